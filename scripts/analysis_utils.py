@@ -0,0 +1,172 @@
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import numpy as np
+from pydub.utils import db_to_float, get_encoder_name, mediainfo
+from silence_utils import group_silence_starts
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Length of each block the energy and peak are measured over, matches the silence seek step
+ANALYSIS_BLOCK_MS = 100
+# Blocks read from ffmpeg at a time, keeps memory use the same for any show length
+ANALYSIS_READ_BLOCKS = 600
+
+# Largest 16 bit sample value, the PCM is always read from ffmpeg as 16 bit
+MAX_AMPLITUDE = 2 ** 15
+
+# Directory analysis indexes are kept in under the show's checksum, so a retried show isn't analysed again
+ANALYSIS_INDEX_DIR = os.getenv("ANALYSIS_INDEX_DIR") or os.path.join(tempfile.gettempdir(), "analysis-index")
+
+def index_path(key):
+    return os.path.join(ANALYSIS_INDEX_DIR, f"{key}.npz")
+
+def analyse_audio(path, block_ms=ANALYSIS_BLOCK_MS, read_blocks=ANALYSIS_READ_BLOCKS):
+    """Analyse an audio file in one streaming pass through ffmpeg.
+
+    Returns an index with the sum of squared samples and the peak sample of
+    every block_ms block, plus the integrated loudness measured by ffmpeg's
+    ebur128 filter in the same pass. Only read_blocks blocks of PCM are held at
+    a time.
+    """
+    info = mediainfo(path)
+    sample_rate = int(info["sample_rate"])
+    channels = int(info["channels"])
+    block_frames = sample_rate * block_ms // 1000
+    block_bytes = block_frames * channels * 2
+
+    command = [
+        get_encoder_name(), "-nostdin", "-hide_banner", "-nostats",
+        "-i", path,
+        "-af", "ebur128=framelog=quiet",
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-ac", str(channels),
+        "pipe:1"
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # ffmpeg writes the loudness summary to stderr, read it alongside so neither pipe fills up
+    stderr = []
+    stderr_thread = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+
+    energies = []
+    peaks = []
+    frames = 0
+    remainder = b""
+    while True:
+        data = process.stdout.read(block_bytes * read_blocks)
+        if not data:
+            break
+        data = remainder + data
+        whole = len(data) - len(data) % block_bytes
+        remainder = data[whole:]
+        if whole:
+            samples = np.frombuffer(data[:whole], dtype=np.int16).reshape(-1, block_frames * channels)
+            energies.append(np.square(samples, dtype=np.float64).sum(axis=1))
+            peaks.append(np.abs(samples.astype(np.int32)).max(axis=1))
+            frames += samples.shape[0] * block_frames
+
+    # The last block is usually shorter than the others
+    remainder = remainder[:len(remainder) - len(remainder) % (channels * 2)]
+    if remainder:
+        samples = np.frombuffer(remainder, dtype=np.int16)
+        energies.append(np.array([np.square(samples, dtype=np.float64).sum()]))
+        peaks.append(np.array([np.abs(samples.astype(np.int32)).max()]))
+        frames += len(samples) // channels
+
+    process.stdout.close()
+    process.wait()
+    stderr_thread.join()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg analysis failed: {stderr[0].decode(errors='replace')}")
+
+    # The summary at the end of the log has the integrated loudness as "I: -23.0 LUFS"
+    loudness = re.findall(r"I:\s+(-?[\d.]+|-inf) LUFS", stderr[0].decode(errors="replace"))
+
+    return {
+        "energy": np.concatenate(energies) if energies else np.zeros(0),
+        "peak": np.concatenate(peaks).astype(np.int32) if peaks else np.zeros(0, dtype=np.int32),
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "frames": frames,
+        "block_ms": block_ms,
+        "integrated_loudness": float(loudness[-1]) if loudness else float("nan")
+    }
+
+def save_index(index, key):
+    os.makedirs(ANALYSIS_INDEX_DIR, exist_ok=True)
+    # Write to a temp name first so an interrupted write is never mistaken for an index
+    partial_path = f"{index_path(key)}.partial"
+    with open(partial_path, "wb") as index_file:
+        np.savez(index_file, **index)
+    os.replace(partial_path, index_path(key))
+
+def load_index(key):
+    with np.load(index_path(key)) as data:
+        index = {name: data[name] for name in data.files}
+    for name in ("sample_rate", "channels", "frames", "block_ms"):
+        index[name] = int(index[name])
+    index["integrated_loudness"] = float(index["integrated_loudness"])
+    return index
+
+def get_index(path, key=None):
+    """Return the analysis index of an audio file, analysing it first if none is stored under key.
+
+    key is the file's checksum, without one the file is analysed every time.
+    """
+    if key is None:
+        return analyse_audio(path)
+    if os.path.exists(index_path(key)):
+        return load_index(key)
+    index = analyse_audio(path)
+    save_index(index, key)
+    return index
+
+def remove_index(key):
+    """Drop the stored index of a show once it has been published."""
+    if key is not None and os.path.exists(index_path(key)):
+        os.remove(index_path(key))
+
+def index_duration_ms(index):
+    return round(1000 * index["frames"] / index["sample_rate"])
+
+def index_peak_dbfs(index):
+    peak = int(index["peak"].max()) if len(index["peak"]) else 0
+    return 20 * np.log10(peak / MAX_AMPLITUDE) if peak else float("-inf")
+
+def detect_silence_from_index(index, min_silence_len=1000, silence_thresh=-16, seek_step=ANALYSIS_BLOCK_MS):
+    """Find silent ranges from an analysis index, following pydub's detect_silence rules.
+
+    Windows of min_silence_len start every seek_step, both of which need to be
+    whole numbers of index blocks. Unlike pydub there is no extra window ending
+    exactly at the end of the show, as it wouldn't start on a block. Returns
+    [start, end] ranges in ms.
+    """
+    block_ms = index["block_ms"]
+    if min_silence_len % block_ms or seek_step % block_ms:
+        raise ValueError(f"min_silence_len and seek_step must be multiples of {block_ms} ms")
+
+    seg_len = index_duration_ms(index)
+    if seg_len < min_silence_len:
+        return []
+
+    window_blocks = min_silence_len // block_ms
+    step_blocks = seek_step // block_ms
+    cumulative = np.concatenate(([0.0], np.cumsum(index["energy"])))
+    last_start_block = (seg_len - min_silence_len) // block_ms
+    start_blocks = np.arange(0, last_start_block + 1, step_blocks)
+    end_blocks = np.minimum(start_blocks + window_blocks, len(index["energy"]))
+
+    window_energy = cumulative[end_blocks] - cumulative[start_blocks]
+    # The last block is usually shorter, so the windows that reach it hold fewer frames
+    block_frames = index["sample_rate"] * block_ms // 1000
+    window_frames = np.minimum(end_blocks * block_frames, index["frames"]) - start_blocks * block_frames
+    window_samples = window_frames * index["channels"]
+    rms = np.floor(np.sqrt(np.maximum(window_energy, 0) / window_samples))
+
+    silence_thresh = db_to_float(silence_thresh) * MAX_AMPLITUDE
+    silence_starts = (start_blocks[rms <= silence_thresh] * block_ms).tolist()
+    return group_silence_starts(silence_starts, min_silence_len, seek_step)
@@ -1,46 +1,219 @@
-from pydub import AudioSegment, silence
-import io
+from pydub import AudioSegment
 import time
+import tempfile
 import gc
-from datetime import datetime, timedelta
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from upload_utils import move_file_to_folder, upload_to_soundcloud, fetch_show_details_from_contentful, update_show_contentful, delete_repeat_from_contentful   # Import from the upload script
+from concurrent.futures import ThreadPoolExecutor
+from upload_utils import get_drive_credentials, get_drive_service, move_file_to_folder, upload_to_soundcloud, create_audio_asset_contentful, publish_asset_contentful, link_show_contentful, delete_repeat_from_contentful, upload_to_drive   # Import from the upload script
 from error_handling import send_error_to_slack
+from drive_utils import RANGED_DOWNLOAD_MIN_SIZE, RANGED_DOWNLOAD_CONNECTIONS, get_folder_files, list_folder_files, move_files_to_folder, download_ranged
+from silence_utils import detect_silence
+from analysis_utils import get_index, remove_index, index_duration_ms, index_peak_dbfs, detect_silence_from_index
+from plan_utils import MIN_SHOW_LENGTH_MS, plan_shows
+from pipeline_utils import PIPELINE_DEPTH, run_pipeline
+from pool_utils import WORKER_PROCESSES, run_in_pool
+from journal_utils import get_show_record, record_stage, record_failure, should_attempt
+from cache_utils import render_cache_key, cached_render_path, store_render, remove_render
+from render_utils import RENDER_ENGINE, RENDER_BITRATE, RENDER_SAMPLE_RATE, RENDER_CHANNEL_LAYOUT, START_CROSSFADE_MS, END_CROSSFADE_MS, MAIN_RENDITION, RENDER_RENDITIONS, RENDITION_FORMATS, RenditionEncoders, render_show_ffmpeg, render_renditions_ffmpeg, export_temp_wav
+from stitch_utils import MP3_STITCH, render_show_stitched
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def download_file(service, file_id):
-    """Download a file by its ID and return as an AudioSegment."""
+# Size of each ranged request made while streaming a Drive download to disk.
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 32 * 1024 * 1024))
+# Directory for downloaded shows, defaults to the system temp directory.
+DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR") or None
+# Silences this long and this quiet are removed from shows.
+SILENCE_MIN_LEN_MS = 5000
+SILENCE_SEEK_STEP_MS = 100
+SILENCE_THRESH_DB = -50
+# Drive folder the "drive" rendition is backed up to, defaults to the backup folder the originals go to.
+RENDITION_FOLDER_ID = os.getenv("RENDITION_FOLDER_ID")
+# Directory the decoded jingles are kept in between runs.
+JINGLE_CACHE_DIR = os.getenv("JINGLE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "jingle-cache")
+
+def download_to_temp_file(service, file_id, suffix="", chunk_size=DOWNLOAD_CHUNK_SIZE, size=None, md5_checksum=None):
+    """Stream a file by its ID into a temporary file on disk and return its path.
+
+    When the file's size is known and large, it is fetched as concurrent byte
+    ranges and checked against md5_checksum. The caller is responsible for
+    removing the file once it is done with it.
+    """
 
     # TODO: Add error handling to this function. Perhaps a timeout for downloading.
     start_time = time.time()
-    request = service.files().get_media(fileId=file_id)
-    output = io.BytesIO()
-    downloader = MediaIoBaseDownload(output, request)
-
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-        print(f"Downloaded {int(status.progress() * 100)}%")
-        if done:
+    output = tempfile.NamedTemporaryFile(suffix=suffix, dir=DOWNLOAD_DIR, delete=False)
+    try:
+        if size and size >= RANGED_DOWNLOAD_MIN_SIZE and RANGED_DOWNLOAD_CONNECTIONS > 1:
+            output.close()
+            print(f"Downloading {size} bytes over {RANGED_DOWNLOAD_CONNECTIONS} connections...")
+            download_ranged(get_drive_credentials(), file_id, output.name, size, md5_checksum)
             print("Download complete.")
         else:
-            print("Downloading...")
+            from googleapiclient.http import MediaIoBaseDownload
+            request = service.files().get_media(fileId=file_id)
+            downloader = MediaIoBaseDownload(output, request, chunksize=chunk_size)
+
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+                print(f"Downloaded {int(status.progress() * 100)}%")
+                if done:
+                    print("Download complete.")
+                else:
+                    print("Downloading...")
+    except Exception:
+        output.close()
+        os.remove(output.name)
+        raise
 
-    output.seek(0)  # Ensure file pointer is at the beginning after download
-    file_size = len(output.getvalue())  # Get the size of the downloaded file
+    output.close()
+    file_size = os.path.getsize(output.name)  # Get the size of the downloaded file
     print(f"Downloaded file size: {file_size} bytes")
     end_time = time.time()
     print(f"Time taken to download file: {end_time - start_time:.2f} seconds")
-    return AudioSegment.from_file(output)
+    return output.name
+
+def download_file(service, file_id, suffix=""):
+    """Download a file by its ID and return as an AudioSegment.
+
+    The file is streamed to disk first so ffmpeg reads it directly rather than
+    the compressed bytes being held in memory alongside the decoded audio.
+    """
+    path = download_to_temp_file(service, file_id, suffix=suffix)
+    try:
+        return AudioSegment.from_file(path)
+    finally:
+        os.remove(path)
+
+def cached_jingle_path(service, file_id):
+    """Return the path of a decoded WAV copy of a jingle, downloading it only when it changes.
+
+    The cache is keyed on the file's Drive revision, so a cheap metadata request
+    is all that is needed on runs where the jingle is unchanged.
+    """
+    metadata = service.files().get(fileId=file_id, fields="md5Checksum, modifiedTime").execute()
+    revision = metadata.get("md5Checksum") or metadata["modifiedTime"].replace(":", "")
+    path = os.path.join(JINGLE_CACHE_DIR, f"{file_id}-{revision}.wav")
+    if os.path.exists(path):
+        print(f"Using cached jingle {file_id}")
+        return path
+
+    os.makedirs(JINGLE_CACHE_DIR, exist_ok=True)
+    jingle = download_file(service, file_id)
+
+    # Write to a temp name first so an interrupted run never leaves a partial cache entry
+    partial_path = f"{path}.partial"
+    jingle.export(partial_path, format="wav")
+    os.replace(partial_path, path)
+
+    # Remove older revisions of the same jingle
+    for cached in os.listdir(JINGLE_CACHE_DIR):
+        cached_path = os.path.join(JINGLE_CACHE_DIR, cached)
+        if cached.startswith(f"{file_id}-") and cached_path != path:
+            os.remove(cached_path)
+    return path
+
+class AudioView:
+    """A lazily concatenated view over the PCM of one or more AudioSegments.
+
+    Slicing and adding a view only keeps memoryview offsets into the original
+    raw data, mirroring pydub's millisecond slicing. The samples are copied once,
+    when the view is turned back into an AudioSegment or exported.
+    """
+
+    def __init__(self, parts, sample_width, frame_rate, channels):
+        self.parts = parts
+        self.sample_width = sample_width
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.frame_width = sample_width * channels
+
+    @classmethod
+    def from_segment(cls, segment):
+        """Wrap an AudioSegment without copying its raw data."""
+        if isinstance(segment, cls):
+            return segment
+        return cls([memoryview(segment.raw_data)], segment.sample_width, segment.frame_rate, segment.channels)
+
+    def _spawn(self, parts):
+        return AudioView(parts, self.sample_width, self.frame_rate, self.channels)
+
+    def frame_count(self):
+        return sum(len(part) for part in self.parts) // self.frame_width
+
+    def __len__(self):
+        # Length in ms, rounded the same way as AudioSegment
+        return round(1000 * (self.frame_count() / self.frame_rate))
+
+    def _parse_position(self, val):
+        if val < 0:
+            val = len(self) - abs(val)
+        return int(val * (self.frame_rate / 1000.0))
+
+    def __getitem__(self, millisecond):
+        if not isinstance(millisecond, slice) or millisecond.step:
+            raise TypeError("AudioView only supports contiguous millisecond slices")
+
+        length = len(self)
+        start = min(millisecond.start if millisecond.start is not None else 0, length)
+        end = min(millisecond.stop if millisecond.stop is not None else length, length)
+        start = self._parse_position(start) * self.frame_width
+        end = self._parse_position(end) * self.frame_width
+
+        parts = []
+        offset = 0
+        for part in self.parts:
+            part_start = max(start - offset, 0)
+            part_end = min(end - offset, len(part))
+            if part_start < part_end:
+                parts.append(part[part_start:part_end])
+            offset += len(part)
+
+        # pydub pads a short slice with silence so it is as long as requested
+        missing = end - start - sum(len(part) for part in parts)
+        if missing > 0:
+            parts.append(memoryview(bytes(missing)))
+        return self._spawn(parts)
+
+    def _synced(self, sample_width, frame_rate, channels):
+        """Return this view converted to the given format, only copying if it differs."""
+        if (self.sample_width, self.frame_rate, self.channels) == (sample_width, frame_rate, channels):
+            return self
+        segment = self.to_segment().set_channels(channels).set_frame_rate(frame_rate).set_sample_width(sample_width)
+        return AudioView.from_segment(segment)
+
+    def __add__(self, other):
+        # Match the format of both sides like AudioSegment.append does
+        other = AudioView.from_segment(other)
+        sample_width = max(self.sample_width, other.sample_width)
+        frame_rate = max(self.frame_rate, other.frame_rate)
+        channels = max(self.channels, other.channels)
+        left = self._synced(sample_width, frame_rate, channels)
+        right = other._synced(sample_width, frame_rate, channels)
+        return left._spawn(left.parts + right.parts)
+
+    def to_segment(self):
+        """Copy the viewed samples into a single new AudioSegment."""
+        return AudioSegment(
+            data=b"".join(self.parts),
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels
+        )
+
+    def export(self, *args, **kwargs):
+        return self.to_segment().export(*args, **kwargs)
+
+def concat_views(views):
+    """Concatenate views of the same format without copying any samples."""
+    views = [AudioView.from_segment(view) for view in views]
+    parts = [part for view in views for part in view.parts]
+    return views[0]._spawn(parts)
 
 def get_file_ids_from_folder(service, folder_id):
-    query = f"'{folder_id}' in parents"
-    response = service.files().list(q=query).execute()
-    return {file['name']: file['id'] for file in response.get('files', [])}
+    return {file['name']: file['id'] for file in list_folder_files(service, folder_id)}
 
 def format_time(ms):
     seconds = ms // 1000
@@ -48,118 +221,448 @@ def format_time(ms):
     hours = minutes // 60
     return f"{hours:02}:{minutes % 60:02}:{seconds % 60:02}"
 
-def process_audio_files(service, folder_id, start_jingle, end_jingle):
-    """Process audio files from the given folder."""
-    file_ids = get_file_ids_from_folder(service, folder_id)
-    PROCESSED_FOLDER_ID = os.getenv("BACKUP_FOLDER_ID")
+def trim_silences(show, silent_ranges):
+    """Return a view of a show without the flattened silent ranges, without copying its samples."""
+    show_view = AudioView.from_segment(show)
+    segments = []
+    start = 0
+    for i in range(0, len(silent_ranges), 2):
+        segments.append(show_view[start:silent_ranges[i]])
+        start = silent_ranges[i + 1]
+    segments.append(show_view[start:])
+
+    # Concatenate the segments to form the final audio without long silences
+    return concat_views(segments)
+
+def add_jingles(trimmed_show, start_jingle, end_jingle):
+    """Crossfade the jingles onto the ends of a trimmed show, returning an AudioView."""
+    start_jingle_end = start_jingle[-START_CROSSFADE_MS:].fade_out(START_CROSSFADE_MS)
+    trimmed_start = trimmed_show[:START_CROSSFADE_MS].to_segment().fade_in(START_CROSSFADE_MS)
+    blended_start = start_jingle_end.overlay(trimmed_start)
+
+    end_jingle_start = end_jingle[:END_CROSSFADE_MS].fade_in(END_CROSSFADE_MS)
+    trimmed_end = trimmed_show[-END_CROSSFADE_MS:].to_segment().fade_out(END_CROSSFADE_MS)
+    blended_end = trimmed_end.overlay(end_jingle_start)
+
+    # Only the crossfades are materialised, the show is copied once on export
+    return (
+        AudioView.from_segment(start_jingle)[:-START_CROSSFADE_MS] +
+        blended_start +
+        trimmed_show[START_CROSSFADE_MS:-END_CROSSFADE_MS] +
+        blended_end +
+        end_jingle[END_CROSSFADE_MS:]
+    )
+
+def mix_show(show, silent_ranges, start_jingle, end_jingle):
+    """Remove the silent ranges from a show and crossfade in the jingles, returning an AudioView."""
+    return add_jingles(trim_silences(show, silent_ranges), start_jingle, end_jingle)
+
+def render_show(show, silent_ranges, start_jingle, end_jingle):
+    """Remove the silent ranges from a show, crossfade in the jingles and encode it as MP3.
+
+    Returns an open temporary file with the MP3, which is removed when closed.
+    """
+    return export_mp3(mix_show(show, silent_ranges, start_jingle, end_jingle))
+
+def export_mp3(final_output):
+    """Encode mixed audio as MP3 into an open temporary file, which is removed when closed."""
+    # Export to a temp file on disk, so the MP3 can be streamed when uploading
+    audio_file = tempfile.NamedTemporaryFile(suffix=".mp3", dir=DOWNLOAD_DIR)
+    final_output.export(audio_file, format="mp3", bitrate=RENDER_BITRATE)
+    audio_file.seek(0)  # Reset file pointer
+    return audio_file
+
+def encode_renditions(final_output, renditions):
+    """Encode a mixed show to every rendition in parallel, straight from its views without copying it.
+
+    Returns {name: open temporary file} for each of renditions.
+    """
+    encoders = RenditionEncoders(renditions, final_output.frame_rate, final_output.channels, final_output.sample_width)
+    try:
+        for part in final_output.parts:
+            encoders.write(part)
+        return encoders.finish()
+    except Exception:
+        encoders.abort()
+        raise
+
+def fetch_show(service, entry, processed_folder_id):
+    """Download a planned show and return the path of the temp file.
+
+    If the show's render is cached, the path of the cached MP3 is returned. A
+    show that only needed moving is moved here instead and None is returned.
+    """
+    name, show_id = entry["name"], entry["id"]
+
+    # A show a previous run published but didn't move only needs moving
+    if get_show_record(show_id).get("entry_published"):
+        print(f"{name} was already published, moving it")
+        move_show(service, entry, processed_folder_id)
+        return None
+
+    # A render left over from a run that failed to publish is used instead of downloading again
+    cached_render = cached_render_path(entry.get("render_key"))
+    cached_renditions = {
+        rendition: cached_render_path(entry.get("render_key"), rendition, RENDITION_FORMATS[audio_format][0])
+        for rendition, (audio_format, _) in RENDER_RENDITIONS.items()
+    }
+    if cached_render and all(cached_renditions.values()):
+        print(f"Using cached render of {name}")
+        entry["cached_render"] = True
+        entry["cached_renditions"] = cached_renditions
+        return cached_render
+
+    show_path = download_to_temp_file(
+        service, show_id, suffix=f".{entry['extension']}", size=entry.get("size"), md5_checksum=entry.get("md5Checksum")
+    )
+    record_stage(show_id, name, "downloaded")
+    return show_path
+
+def render_fetched_show(entry, show_path, start_jingle, end_jingle, start_jingle_path, end_jingle_path):
+    """Detect silences in a downloaded show and render it, removing the download afterwards.
+
+    Returns the MP3 as an open file, or None if the show turned out to be too short.
+    Any other renditions are left open in entry["renditions"]. Renders are kept
+    in the render cache until the show has been published.
+    """
+    if entry.get("cached_render"):
+        entry["renditions"] = {name: open(path, "rb") for name, path in entry["cached_renditions"].items()}
+        return open(show_path, "rb")
 
-    for name, show_id in file_ids.items():
-        file_extension = name.split('.')[-1].lower()
-        if file_extension in ('wav', 'mp3'):
+    try:
+        if RENDER_ENGINE == "ffmpeg":
+            # Analyse the show in one streaming pass instead of decoding all of it
+            show = None
+            index = get_index(show_path, entry.get("md5Checksum"))
+            show_length = index_duration_ms(index)
+        else:
+            show = AudioSegment.from_file(show_path)
+            show_length = len(show)
+
+        # The header couldn't always be read when planning, so check the length again
+        if show_length < MIN_SHOW_LENGTH_MS:
+            print("Not processing show as its too small")
+            return None
+
+        print("beginning to process audio")
+
+        # Detect silences longer than 5 seconds (3000 ms)
+        if show is None:
+            silent_ranges = detect_silence_from_index(index, min_silence_len=SILENCE_MIN_LEN_MS, seek_step=SILENCE_SEEK_STEP_MS, silence_thresh=SILENCE_THRESH_DB)
+            print(f"Integrated loudness {index['integrated_loudness']:.1f} LUFS, peak {index_peak_dbfs(index):.1f} dBFS")
+        else:
+            silent_ranges = detect_silence(show, min_silence_len=SILENCE_MIN_LEN_MS, seek_step=SILENCE_SEEK_STEP_MS, silence_thresh=SILENCE_THRESH_DB)
+
+        # Flatten the list of silent ranges
+        silent_ranges = [item for sublist in silent_ranges for item in sublist]
+
+        # Convert silent ranges to readable format
+        formatted_silent_ranges = [(format_time(start), format_time(end)) for start, end in zip(silent_ranges[::2], silent_ranges[1::2])]
+        print(f"Silent ranges (start, end): {formatted_silent_ranges}")
+
+        audio_file = None
+        renditions = {}
+        if show is None and MP3_STITCH and entry["extension"] == "mp3":
+            # Copy most of an MP3 show as it is and only encode around the joins, other renditions get its PCM
+            encoders = RenditionEncoders(RENDER_RENDITIONS, RENDER_SAMPLE_RATE, 2)
             try:
-                start_time = time.time()
-                date_str = name[:8]  # Extract "YYYYMMDD"
-                time_str = name[9:13]  # Extract "HHMM"
-
-                # Convert to datetime object
-                date_time = datetime.strptime(f"{date_str} {time_str}", "%Y%m%d %H%M")
-
-                # Add 15 minutes to the datetime object
-                date_time += timedelta(minutes=15)
-
-                # Format as "YYYYMMDDTHH15"
-                timestamp = date_time.strftime("%Y%m%dT%H%M")
-                show = download_file(service, show_id)
-
-                # If show length is short then don't process
-                if len(show) < 1800000: 
-                    print("Not processing show as its too small")
-                    move_file_to_folder(service, show_id, PROCESSED_FOLDER_ID)
-                    continue
-                
-                # Fetch metadata about show based on timestamp
-                show_metadata = fetch_show_details_from_contentful(timestamp)
-
-                # If the show is a repeat then delete from contentful and don't process
-                if "(r)" in show_metadata['title']:
-                    print("Deleting show as its a repeat")
-                    delete_repeat_from_contentful(show_metadata["entry_id"])
-                    move_file_to_folder(service, show_id, PROCESSED_FOLDER_ID)
-                    continue
-
-                print("beginning to process audio")
-
-                # Detect silences longer than 5 seconds (3000 ms)
-                silent_ranges = silence.detect_silence(show, min_silence_len=5000, seek_step=100, silence_thresh=-50)
-
-                # Flatten the list of silent ranges
-                silent_ranges = [item for sublist in silent_ranges for item in sublist]
-
-                # Convert silent ranges to readable format
-                formatted_silent_ranges = [(format_time(start), format_time(end)) for start, end in zip(silent_ranges[::2], silent_ranges[1::2])]
-                print(f"Silent ranges (start, end): {formatted_silent_ranges}")
-
-                # Remove the silent ranges from the audio
-                segments = []
-                start = 0
-                for i in range(0, len(silent_ranges), 2):
-                    segments.append(show[start:silent_ranges[i]])
-                    start = silent_ranges[i + 1]
-                segments.append(show[start:])
-
-                # Concatenate the segments to form the final audio without long silences
-                trimmed_show = sum(segments, AudioSegment.silent(duration=0))
-
-                start_jingle_end = start_jingle[-5800:].fade_out(5800)
-                trimmed_start = trimmed_show[:5800].fade_in(5800)
-                blended_start = start_jingle_end.overlay(trimmed_start)
-
-                end_jingle_start = end_jingle[:7200].fade_in(7200)
-                trimmed_end = trimmed_show[-7200:].fade_out(7200)
-                blended_end = trimmed_end.overlay(end_jingle_start)
-
-                final_output = (
-                    start_jingle[:-5800] +
-                    blended_start +
-                    trimmed_show[5800:-7200] +
-                    blended_end +
-                    end_jingle[7200:]
+                audio_file = render_show_stitched(
+                    show_path, silent_ranges, start_jingle_path, end_jingle_path, index["frames"], index["sample_rate"],
+                    bitrate=RENDER_BITRATE, pcm_sink=encoders if RENDER_RENDITIONS else None
                 )
+                if audio_file is None:
+                    print("Show can't be stitched, rendering it in full")
+                elif RENDER_RENDITIONS:
+                    renditions = encoders.finish()
+            except Exception as e:
+                encoders.abort()
+                if audio_file is not None:
+                    audio_file.close()
+                    audio_file = None
+                print(f"Stitching failed ({e}), rendering the show in full")
 
-                print("finished processing audio")
+        if audio_file is None and RENDER_RENDITIONS:
+            # The show is decoded and edited once and every rendition is encoded from it in parallel
+            all_renditions = {MAIN_RENDITION: ("mp3", RENDER_BITRATE), **RENDER_RENDITIONS}
+            if show is None:
+                renditions = render_renditions_ffmpeg(show_path, silent_ranges, start_jingle_path, end_jingle_path, all_renditions)
+            else:
+                renditions = encode_renditions(mix_show(show, silent_ranges, start_jingle, end_jingle), all_renditions)
+                del show
+            audio_file = renditions.pop(MAIN_RENDITION)
+        elif audio_file is None and show is None:
+            # ffmpeg streams the show from disk, so it is never decoded in Python
+            audio_file = render_show_ffmpeg(show_path, silent_ranges, start_jingle_path, end_jingle_path, bitrate=RENDER_BITRATE)
+        elif audio_file is None:
+            audio_file = render_show(show, silent_ranges, start_jingle, end_jingle)
+            del show
+    finally:
+        os.remove(show_path)
 
-                # Convert the AudioSegment to a BytesIO object
-                audio_file = io.BytesIO()
-                final_output.export(audio_file, format="mp3", bitrate="192k")
-                audio_file.seek(0)  # Reset file pointer
+    print("finished processing audio")
+    store_render(entry.get("render_key"), audio_file)
+    for name, rendition in renditions.items():
+        store_render(entry.get("render_key"), rendition, name)
+    entry["renditions"] = renditions
+    record_stage(entry["id"], entry["name"], "rendered")
+    return audio_file
 
-                # Validate the BytesIO object content
-                if audio_file.getbuffer().nbytes == 0:
-                    raise ValueError("CCCC The exported audio file is empty. Please check the export operation.")
+def publish_show(service, entry, audio_file, processed_folder_id):
+    """Upload a rendered show to SoundCloud and Contentful, then move the original to the backup folder.
 
-                # Upload to soundcloud
-                sc_link = upload_to_soundcloud(audio_file, show_metadata)
-                
-                # Update show on contentful. Uploading audio file and updating soundcloud link
-                entry_id = show_metadata["entry_id"]
-                entry_title = show_metadata["title"]
-                update_show_contentful(entry_id, entry_title, sc_link, audio_file)
+    A "contentful" rendition replaces the MP3 in the archive and a "drive"
+    rendition is backed up to Drive alongside the other uploads.
+    An audio_file of None means the show was too short, it is only moved. Every
+    stage is recorded in the journal and skipped if an earlier run completed it,
+    so a retried show is never uploaded to SoundCloud twice.
+    """
+    if audio_file is None:
+        move_file_to_folder(service, entry["id"], processed_folder_id)
+        return
 
-                print(f"SoundCloud link: {sc_link}")
-                # Define the processed files folder ID (replace with actual ID)
+    show_id, name = entry["id"], entry["name"]
+    show_metadata = entry["metadata"]
+    try:
+        # Validate the exported audio file content
+        audio_file.seek(0, os.SEEK_END)
+        if audio_file.tell() == 0:
+            raise ValueError("CCCC The exported audio file is empty. Please check the export operation.")
+        audio_file.seek(0)
 
-                # Move the file after successful upload
-                move_file_to_folder(service, show_id, PROCESSED_FOLDER_ID)
+        entry_id = show_metadata["entry_id"]
+        entry_title = show_metadata["title"]
+        record = get_show_record(show_id)
 
-                del show, trimmed_show, final_output, audio_file
-                gc.collect()
-            except Exception as e:
-                error_message = f"Error processing audio {name}: {e}"
-                send_error_to_slack(error_message)
-                print(error_message)
-                
-                # TODO: Add retry logic
-                continue
-
-            end_time = time.time()
-            print(f"Processed {name} in {end_time - start_time:.2f} seconds")
+        # The archive gets its own rendition if there is one, otherwise the same MP3 as SoundCloud
+        renditions = entry.get("renditions", {})
+        contentful_source = renditions.get("contentful", audio_file)
+        contentful_format = RENDER_RENDITIONS["contentful"][0] if "contentful" in renditions else "mp3"
+        contentful_suffix, _, contentful_mimetype = RENDITION_FORMATS[contentful_format]
+        drive_rendition = renditions.get("drive")
+
+        # Upload everywhere at the same time, each upload reading its own handle on its file
+        with open_reader(audio_file) as sc_file, open_reader(contentful_source) as contentful_file:
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                uploads = {}
+                if not record.get("sc_link"):
+                    uploads["sc_link"] = executor.submit(upload_to_soundcloud, sc_file, show_metadata)
+                if not record.get("asset_id"):
+                    uploads["asset_id"] = executor.submit(create_audio_asset_contentful, entry_title, contentful_file, contentful_suffix, contentful_mimetype)
+                if drive_rendition and not record.get("drive_file_id"):
+                    uploads["drive_file_id"] = executor.submit(upload_rendition_to_drive, entry, drive_rendition, processed_folder_id)
+
+                # Every upload that succeeded is journaled before a failure is raised, so a retry only repeats the failed ones
+                errors = []
+                for stage, upload in uploads.items():
+                    try:
+                        record[stage] = upload.result()
+                        if stage == "asset_id":
+                            # The upload thread only started the processing, the asset is published here once it is done
+                            record[stage] = publish_asset_contentful(record[stage].result())
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    record_stage(show_id, name, stage, record[stage])
+                if errors:
+                    raise errors[0]
+
+        sc_link, asset_id = record["sc_link"], record["asset_id"]
+        print(f"SoundCloud link: {sc_link}")
+
+        # Update show on contentful with the processed audio file and the soundcloud link
+        link_show_contentful(entry_id, sc_link, asset_id)
+        record_stage(show_id, name, "entry_published")
+
+        # Move the file after successful upload
+        move_show(service, entry, processed_folder_id)
+    finally:
+        audio_file.close()
+        for rendition in entry.pop("renditions", {}).values():
+            rendition.close()
+        del audio_file
+        gc.collect()
+
+def upload_rendition_to_drive(entry, rendition, processed_folder_id):
+    """Back up the "drive" rendition of a show, with its own Drive service since they aren't thread safe."""
+    suffix, _, mimetype = RENDITION_FORMATS[RENDER_RENDITIONS["drive"][0]]
+    filename = os.path.splitext(entry["name"])[0] + suffix
+    return upload_to_drive(get_drive_service(), rendition.name, filename, RENDITION_FOLDER_ID or processed_folder_id, mimetype)
+
+def move_show(service, entry, processed_folder_id):
+    """Move a published show to the backup folder and drop its cached render and index."""
+    move_file_to_folder(service, entry["id"], processed_folder_id)
+    record_stage(entry["id"], entry["name"], "moved")
+    remove_render(entry.get("render_key"))
+    remove_index(entry.get("md5Checksum"))
+
+def open_reader(audio_file):
+    """Open a separate read handle on a rendered MP3, so it can be uploaded from several threads."""
+    return open(audio_file.name, "rb")
+
+def process_show(service, entry, start_jingle, end_jingle, start_jingle_path, end_jingle_path, processed_folder_id):
+    """Download, render and publish one planned show."""
+    show_path = fetch_show(service, entry, processed_folder_id)
+    if show_path is None:
+        return
+    audio_file = render_fetched_show(entry, show_path, start_jingle, end_jingle, start_jingle_path, end_jingle_path)
+    publish_show(service, entry, audio_file, processed_folder_id)
+
+def process_show_safely(service, entry, start_jingle, end_jingle, start_jingle_path, end_jingle_path, processed_folder_id):
+    """Process one planned show, reporting any error to Slack instead of raising it."""
+    name = entry["name"]
+    try:
+        start_time = time.time()
+        process_show(service, entry, start_jingle, end_jingle, start_jingle_path, end_jingle_path, processed_folder_id)
+    except Exception as e:
+        error_message = f"Error processing audio {name}: {e}"
+        send_error_to_slack(error_message)
+        print(error_message)
+
+        # Retried by a later run, after a backoff
+        record_failure(entry["id"], name, e)
+        return
+
+    end_time = time.time()
+    print(f"Processed {name} in {end_time - start_time:.2f} seconds")
+
+# State of a worker process, set up once by init_worker
+worker_state = {}
+
+def init_worker(start_jingle_path, end_jingle_path, processed_folder_id):
+    """Give a worker process its own Drive service and copy of the jingles."""
+    worker_state["service"] = get_drive_service()
+    worker_state["start_jingle"] = AudioSegment.from_wav(start_jingle_path)
+    worker_state["end_jingle"] = AudioSegment.from_wav(end_jingle_path)
+    worker_state["start_jingle_path"] = start_jingle_path
+    worker_state["end_jingle_path"] = end_jingle_path
+    worker_state["processed_folder_id"] = processed_folder_id
+
+def process_show_in_worker(entry):
+    process_show_safely(
+        worker_state["service"],
+        entry,
+        worker_state["start_jingle"],
+        worker_state["end_jingle"],
+        worker_state["start_jingle_path"],
+        worker_state["end_jingle_path"],
+        worker_state["processed_folder_id"]
+    )
+
+def process_shows_pipelined(service, plan, start_jingle, end_jingle, start_jingle_path, end_jingle_path, processed_folder_id):
+    """Process shows in overlapping fetch, render and publish stages.
+
+    While one show renders the next is downloading and the previous one is
+    being uploaded. Each stage hands over to the next through a queue holding
+    at most PIPELINE_DEPTH shows, so only a few shows are in flight at once.
+    """
+    # Drive services aren't thread safe, so publishing gets a service of its own
+    publish_service = get_drive_service()
+
+    def fetch(entry):
+        show_path = fetch_show(service, entry, processed_folder_id)
+        return (entry, show_path) if show_path else None
+
+    def render(item):
+        entry, show_path = item
+        return entry, render_fetched_show(entry, show_path, start_jingle, end_jingle, start_jingle_path, end_jingle_path)
+
+    def publish(item):
+        entry, audio_file = item
+        publish_show(publish_service, entry, audio_file, processed_folder_id)
+        print(f"Processed {entry['name']}")
+
+    def report_error(item, stage, e):
+        entry = item if isinstance(item, dict) else item[0]
+        error_message = f"Error processing audio {entry['name']} ({stage}): {e}"
+        send_error_to_slack(error_message)
+        print(error_message)
+        record_failure(entry["id"], entry["name"], e)
+
+    run_pipeline(plan, [("fetch", fetch), ("render", render), ("publish", publish)], on_error=report_error)
+
+def until_stopped(entries, stop_event):
+    """Yield entries until stop_event is set, so no new show is started after a shutdown is asked for."""
+    for entry in entries:
+        if stop_event is not None and stop_event.is_set():
+            print("Stopping before the remaining shows, they will be picked up by the next run.")
+            return
+        yield entry
+
+def process_audio_files(service, folder_id, start_jingle, end_jingle, start_jingle_path=None, end_jingle_path=None, files=None, stop_event=None):
+    """Process audio files from the given folder.
+
+    Every show is planned from its metadata and header first, so repeats and
+    short files are moved without being downloaded. With WORKER_PROCESSES above
+    1 the shows are processed in a pool of worker processes that load the
+    jingles from their paths. Otherwise they go through the fetch, render and
+    publish pipeline, or one by one when PIPELINE_DEPTH is 0. Jingles without a
+    path are exported to temporary files when the pool or the ffmpeg engine
+    needs them. files can be passed in when the folder has already been listed.
+    Once stop_event is set the pool, the pipeline and the sequential loop
+    finish the shows they have started and don't start any more.
+    """
+    if files is None:
+        files = get_folder_files(service, folder_id)
+    PROCESSED_FOLDER_ID = os.getenv("BACKUP_FOLDER_ID")
+    plan = plan_shows(service, files)
+
+    # Leave out shows that failed recently or too many times
+    due = []
+    for entry in plan:
+        attempt, reason = should_attempt(entry["id"]) if entry["action"] == "process" else (True, None)
+        if attempt:
+            due.append(entry)
+        else:
+            print(f"Skipping {entry['name']}: {reason}")
+    plan = due
+
+    # Repeats and short files only need moving, so move them all together in batches
+    triaged = [entry for entry in plan if entry["action"] in ("short", "repeat")]
+    for entry in triaged:
+        if entry["action"] == "repeat":
+            print(f"Deleting {entry['name']} as its a repeat")
+            delete_repeat_from_contentful(entry["metadata"]["entry_id"])
+        else:
+            print(f"Not processing {entry['name']} as its too small")
+    move_errors = move_files_to_folder(service, [entry["id"] for entry in triaged], PROCESSED_FOLDER_ID)
+    for entry in triaged:
+        if move_errors.get(entry["id"]) is not None:
+            error_message = f"Error moving {entry['name']} to the backup folder: {move_errors[entry['id']]}"
+            send_error_to_slack(error_message)
+    plan = [entry for entry in plan if entry["action"] == "process"]
+
+    # The pool and the ffmpeg engine read the jingles from disk
+    temp_jingle_paths = []
+    if RENDER_ENGINE == "ffmpeg" or WORKER_PROCESSES > 1:
+        if start_jingle_path is None:
+            start_jingle_path = export_temp_wav(start_jingle)
+            temp_jingle_paths.append(start_jingle_path)
+        if end_jingle_path is None:
+            end_jingle_path = export_temp_wav(end_jingle)
+            temp_jingle_paths.append(end_jingle_path)
+
+    # Renders are cached under everything that affects the output, so a retry can skip straight to publishing
+    if start_jingle_path and end_jingle_path:
+        render_params = {
+            "engine": RENDER_ENGINE,
+            "format": [RENDER_SAMPLE_RATE, RENDER_CHANNEL_LAYOUT],
+            "silence": [SILENCE_MIN_LEN_MS, SILENCE_SEEK_STEP_MS, SILENCE_THRESH_DB],
+            "crossfades": [START_CROSSFADE_MS, END_CROSSFADE_MS],
+            "bitrate": RENDER_BITRATE,
+            "mp3_stitch": MP3_STITCH,
+            "renditions": RENDER_RENDITIONS
+        }
+        for entry in plan:
+            entry["render_key"] = render_cache_key(entry.get("md5Checksum"), [start_jingle_path, end_jingle_path], render_params)
+
+    try:
+        if WORKER_PROCESSES > 1:
+            run_in_pool(plan, process_show_in_worker, init_worker, (start_jingle_path, end_jingle_path, PROCESSED_FOLDER_ID), stop_event=stop_event)
+        elif PIPELINE_DEPTH > 0:
+            process_shows_pipelined(service, until_stopped(plan, stop_event), start_jingle, end_jingle, start_jingle_path, end_jingle_path, PROCESSED_FOLDER_ID)
+        else:
+            for entry in until_stopped(plan, stop_event):
+                process_show_safely(service, entry, start_jingle, end_jingle, start_jingle_path, end_jingle_path, PROCESSED_FOLDER_ID)
+    finally:
+        for path in temp_jingle_paths:
+            os.remove(path)
@@ -0,0 +1,97 @@
+import os
+import subprocess
+import threading
+import psutil
+from pydub.utils import get_encoder_name
+
+# Seconds between memory samples while a benchmark runs
+MEMORY_SAMPLE_INTERVAL = 0.5
+
+# Silence in a synthetic show: every and length give a gap of length seconds in
+# the middle of every `every` seconds, edges gives silence at the start and end
+DEFAULT_SILENCE_PATTERN = "every=600,length=10"
+
+def parse_silence_pattern(spec):
+    """Parse "every=600,length=10,edges=20" into a dict of seconds, "none" gives no silence."""
+    pattern = {"every": 0, "length": 0, "edges": 0}
+    if spec.strip().lower() in ("", "none"):
+        return pattern
+    for item in spec.split(","):
+        name, _, seconds = item.partition("=")
+        name = name.strip()
+        if name not in pattern:
+            raise ValueError(f"Unknown silence setting {name!r}, expected one of {', '.join(pattern)}")
+        pattern[name] = float(seconds)
+    return pattern
+
+def silence_expression(pattern, seconds):
+    """Return an ffmpeg expression of t that is non-zero where the pattern is silent."""
+    terms = []
+    if pattern["every"] and pattern["length"]:
+        start = pattern["every"] / 2
+        terms.append(f"between(mod(t,{pattern['every']}),{start},{start + pattern['length']})")
+    if pattern["edges"]:
+        terms.append(f"lt(t,{pattern['edges']})")
+        terms.append(f"gt(t,{seconds - pattern['edges']})")
+    return "+".join(terms)
+
+def generate_audio(path, seconds, sample_rate=44100, channels=2, signal="noise", silence=None, frequency=220, bitrate="128k"):
+    """Write synthetic audio with ffmpeg, in the format given by the extension of path.
+
+    signal is "noise" for pink noise, which costs about as much to encode as
+    music, or "tone" for a sine wave. silence is a pattern from
+    parse_silence_pattern. MP3s are encoded at bitrate.
+    """
+    if signal == "noise":
+        source = f"anoisesrc=duration={seconds}:color=pink:sample_rate={sample_rate}:amplitude=0.25"
+    elif signal == "tone":
+        source = f"sine=frequency={frequency}:sample_rate={sample_rate}:duration={seconds}"
+    else:
+        raise ValueError(f"Unknown signal {signal!r}, expected noise or tone")
+
+    command = [
+        get_encoder_name(), "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", source,
+        "-ac", str(channels)
+    ]
+    expression = silence_expression(silence, seconds) if silence else ""
+    if expression:
+        command += ["-af", f"volume=enable='{expression}':volume=0"]
+    if path.lower().endswith(".mp3"):
+        command += ["-b:a", bitrate]
+    subprocess.run(command + [path], check=True)
+
+class MemorySampler:
+    """Samples the memory of this process and all of its children from a background thread."""
+
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def sample(self):
+        process = psutil.Process(os.getpid())
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                continue
+        self.peak = max(self.peak, rss)
+        return rss
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+        # A stage shorter than the interval still gets a sample from its end
+        self.sample()
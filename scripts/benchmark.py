@@ -0,0 +1,179 @@
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from bench_utils import DEFAULT_SILENCE_PATTERN, MemorySampler, generate_audio, parse_silence_pattern
+from fake_services import FakeServices
+from render_utils import START_CROSSFADE_MS, END_CROSSFADE_MS
+
+# Drive folders the synthetic shows start in and are moved to
+INPUT_FOLDER_ID = "benchmark-input"
+BACKUP_FOLDER_ID = "benchmark-backup"
+JINGLE_FOLDER_ID = "benchmark-jingles"
+
+# Length of the synthetic jingles in seconds, each jingle has to be longer than its crossfade with the show
+JINGLE_SECONDS = max(START_CROSSFADE_MS, END_CROSSFADE_MS) // 1000 + 3
+
+# Time between journal stages, reported as the latency of the stage that ends it
+STAGE_INTERVALS = (
+    ("render", "downloaded", "rendered"),
+    ("publish", "rendered", "entry_published"),
+    ("move", "entry_published", "moved")
+)
+
+def generate_shows(directory, count, minutes):
+    """Write count synthetic MP3 shows named the way the pipeline expects.
+
+    One show is encoded and copied, with a different ID3v1 tag on the end of
+    each copy so every show has its own checksum and render cache key.
+    """
+    base_path = os.path.join(directory, "base.mp3")
+    generate_audio(base_path, minutes * 60, signal="tone", silence=parse_silence_pattern(DEFAULT_SILENCE_PATTERN))
+
+    first_show = datetime(2024, 1, 1, 12, 0)
+    shows = []
+    for number in range(count):
+        name = f"{(first_show + timedelta(hours=number)).strftime('%Y%m%d %H%M')} Benchmark.mp3"
+        path = os.path.join(directory, name)
+        shutil.copyfile(base_path, path)
+        with open(path, "ab") as show:
+            show.write(b"TAG" + f"Benchmark show {number}".encode().ljust(125, b"\0"))
+        shows.append((name, path))
+    os.remove(base_path)
+    return shows
+
+def generate_private_key():
+    # Drive credentials are signed by the client, so the stand-in needs a real key even though it never checks it
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+
+def parse_latency(spec):
+    """Parse "service=seconds,..." into {service: seconds}."""
+    latency = {}
+    for item in filter(None, (item.strip() for item in spec.split(","))):
+        service, _, seconds = item.partition("=")
+        latency[service.strip()] = float(seconds)
+    return latency
+
+def report(elapsed, records, fake, peak_memory):
+    completed = [record for record in records if record.get("moved")]
+    print()
+    print(f"Processed {len(completed)}/{len(records)} shows in {elapsed:.1f} seconds, {len(completed) / elapsed * 3600:.1f} shows per hour")
+    print(f"Peak memory of the process and its children: {peak_memory / 1024 ** 2:.0f} MB")
+
+    print("\nStage latency (seconds between journal stages):")
+    for stage, start, end in STAGE_INTERVALS:
+        latencies = [record[end] - record[start] for record in records if record.get(start) and record.get(end)]
+        if latencies:
+            print(f"  {stage:<8} median {statistics.median(latencies):8.2f}  max {max(latencies):8.2f}  ({len(latencies)} shows)")
+
+    print("\nRequests to the stand-in services:")
+    for (service, operation), stats in sorted(fake.stats.items()):
+        print(f"  {service:<11} {operation:<28} {stats['requests']:5d} requests  {stats['seconds']:8.2f} s  {stats['bytes'] / 1024 ** 2:9.1f} MB received")
+
+    if fake.slack_messages:
+        print(f"\n{len(fake.slack_messages)} errors were reported to Slack:")
+        for message in fake.slack_messages:
+            print(f"  {message.splitlines()[-1]}")
+
+def run_benchmark(shows=4, minutes=35, latency=None, asset_processing_delay=0.0, keep=False):
+    """Run process_audio_files over synthetic shows against local stand-ins for every service.
+
+    Settings such as WORKER_PROCESSES, PIPELINE_DEPTH and RENDER_ENGINE are read
+    from the environment as usual, so the same command compares them. The
+    journal, caches and downloads are kept in a temporary directory.
+    """
+    work_dir = tempfile.mkdtemp(prefix="audio-benchmark-")
+    fake = FakeServices(latency=latency, asset_processing_delay=asset_processing_delay).start()
+    try:
+        print(f"Generating {shows} shows of {minutes} minutes in {work_dir}...")
+        file_ids = [fake.add_file(path, name, INPUT_FOLDER_ID) for name, path in generate_shows(work_dir, shows, minutes)]
+        jingle_ids = []
+        for name, frequency in (("start-jingle.wav", 440), ("end-jingle.wav", 660)):
+            path = os.path.join(work_dir, name)
+            generate_audio(path, JINGLE_SECONDS, signal="tone", frequency=frequency)
+            jingle_ids.append(fake.add_file(path, name, JINGLE_FOLDER_ID, "audio/wav"))
+
+        os.environ.update(fake.environment())
+        os.environ.update({
+            "GOOGLE_DRIVE_CLIENT_EMAIL": "benchmark@example.com",
+            "GOOGLE_DRIVE_PRIVATE_KEY": generate_private_key(),
+            # The Supabase client only accepts keys shaped like a JWT
+            "SUPABASE_TOKEN": "benchmark.benchmark.benchmark",
+            "CONTENTFUL_MANAGEMENT_API_TOKEN": "benchmark",
+            "SC_CLIENT_ID": "benchmark",
+            "SC_CLIENT_SECRET": "benchmark",
+            "WEBSITE_API_KEY": "benchmark",
+            "INPUT_FOLDER_ID": INPUT_FOLDER_ID,
+            "OUTPUT_FOLDER_ID": BACKUP_FOLDER_ID,
+            "BACKUP_FOLDER_ID": BACKUP_FOLDER_ID,
+            "START_JINGLE_ID": jingle_ids[0],
+            "END_JINGLE_ID": jingle_ids[1],
+            "JOURNAL_PATH": os.path.join(work_dir, "journal.sqlite3"),
+            "RENDER_CACHE_DIR": os.path.join(work_dir, "render-cache"),
+            "ANALYSIS_INDEX_DIR": os.path.join(work_dir, "analysis-index"),
+            "JINGLE_CACHE_DIR": os.path.join(work_dir, "jingle-cache"),
+            "DRIVE_LISTING_STATE_PATH": os.path.join(work_dir, "listing-state.json"),
+            "RUN_LOCK_PATH": os.path.join(work_dir, "run.lock"),
+            "DOWNLOAD_DIR": work_dir
+        })
+
+        # Imported only now, as the modules read their settings from the environment when they are imported
+        from audio_utils import process_audio_files, cached_jingle_path
+        from upload_utils import get_drive_service
+        from journal_utils import get_show_record
+        from pydub import AudioSegment
+
+        drive_service = get_drive_service()
+        start_jingle_path = cached_jingle_path(drive_service, jingle_ids[0])
+        end_jingle_path = cached_jingle_path(drive_service, jingle_ids[1])
+        start_jingle, end_jingle = AudioSegment.from_wav(start_jingle_path), AudioSegment.from_wav(end_jingle_path)
+
+        with MemorySampler() as memory:
+            started = time.time()
+            process_audio_files(
+                service=drive_service,
+                folder_id=INPUT_FOLDER_ID,
+                start_jingle=start_jingle,
+                end_jingle=end_jingle,
+                start_jingle_path=start_jingle_path,
+                end_jingle_path=end_jingle_path
+            )
+            elapsed = time.time() - started
+
+        report(elapsed, [get_show_record(file_id) for file_id in file_ids], fake, memory.peak)
+    finally:
+        fake.stop()
+        if keep:
+            print(f"\nKept the shows, journal and caches in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput of the pipeline against local stand-ins for every service.")
+    parser.add_argument("--shows", type=int, default=4, help="number of synthetic shows to process")
+    parser.add_argument("--minutes", type=int, default=35, help="length of each show, shows under 30 minutes aren't processed")
+    parser.add_argument("--latency", default="", help='seconds added to every response, e.g. "drive=0.05,contentful=0.2,soundcloud=0.3"')
+    parser.add_argument("--asset-processing-delay", type=float, default=5.0, help="seconds Contentful takes to process an asset")
+    parser.add_argument("--keep", action="store_true", help="keep the generated shows, journal and caches")
+    args = parser.parse_args()
+
+    run_benchmark(
+        shows=args.shows,
+        minutes=args.minutes,
+        latency=parse_latency(args.latency),
+        asset_processing_delay=args.asset_processing_delay,
+        keep=args.keep
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Directory rendered MP3s are kept in so a failed publish can be retried without re-rendering
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "render-cache")
+# Disk quota for the render cache, the least recently used renders are removed first
+RENDER_CACHE_MAX_MB = int(os.getenv("RENDER_CACHE_MAX_MB", 2048))
+
+def render_cache_key(source_md5, jingle_paths, params):
+    """Return the cache key of a render, or None if the source has no checksum.
+
+    The jingle paths come from the jingle cache and name the jingle revision, so
+    a new jingle gives a new key.
+    """
+    if not source_md5:
+        return None
+    key = json.dumps({
+        "source": source_md5,
+        "jingles": [os.path.basename(path) for path in jingle_paths],
+        "params": params
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def render_path(key, name=None, suffix=".mp3"):
+    # The main MP3 is stored under the key alone and other renditions under the key and their name
+    return os.path.join(RENDER_CACHE_DIR, f"{key}.{name}{suffix}" if name else f"{key}{suffix}")
+
+def cached_render_path(key, name=None, suffix=".mp3"):
+    """Return the path of a cached render, marking it as recently used, or None if there isn't one."""
+    if key is None:
+        return None
+    path = render_path(key, name, suffix)
+    if not os.path.exists(path):
+        return None
+    os.utime(path)
+    return path
+
+def store_render(key, audio_file, name=None):
+    """Copy a rendered file into the cache and evict old renders to stay under the quota."""
+    if key is None:
+        return
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    path = render_path(key, name, os.path.splitext(audio_file.name)[1])
+
+    # Write to a temp name first so an interrupted copy is never mistaken for a render
+    partial_path = f"{path}.partial"
+    audio_file.seek(0)
+    with open(partial_path, "wb") as cached_file:
+        shutil.copyfileobj(audio_file, cached_file)
+    audio_file.seek(0)
+    os.replace(partial_path, path)
+
+    evict_renders(keep=path)
+
+def evict_renders(keep=None, max_bytes=None):
+    """Remove the least recently used renders until the cache fits in its quota."""
+    if max_bytes is None:
+        max_bytes = RENDER_CACHE_MAX_MB * 1024 ** 2
+
+    renders = []
+    for name in os.listdir(RENDER_CACHE_DIR):
+        # A partial file is a copy another worker process is still writing
+        if name.endswith(".partial"):
+            continue
+        path = os.path.join(RENDER_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        renders.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in renders)
+    for _, size, path in sorted(renders):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Another worker process evicted or published it first
+            pass
+        total -= size
+        print(f"Evicted cached render {os.path.basename(path)}")
+
+def remove_render(key):
+    """Drop a render and its other renditions from the cache once it has been published."""
+    if key is None or not os.path.isdir(RENDER_CACHE_DIR):
+        return
+    for name in os.listdir(RENDER_CACHE_DIR):
+        if name.startswith(f"{key}."):
+            os.remove(os.path.join(RENDER_CACHE_DIR, name))
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Root of the Drive API, can point at a local stand-in for benchmarks
+DRIVE_API_URL = os.getenv("DRIVE_API_URL", "https://www.googleapis.com/")
+
+# Fields needed to plan and process a show, shared by folder listings and change listings
+FILE_FIELDS = "id, name, size, md5Checksum, mimeType, parents, trashed, videoMediaMetadata(durationMillis)"
+
+# Largest page size the Drive API allows for files and changes
+MAX_PAGE_SIZE = 1000
+# Drive accepts at most 100 calls in one batch request
+MAX_BATCH_SIZE = 100
+
+# Files at least this big are downloaded as byte ranges over several connections
+RANGED_DOWNLOAD_MIN_SIZE = int(os.getenv("RANGED_DOWNLOAD_MIN_SIZE", 64 * 1024 * 1024))
+RANGED_DOWNLOAD_CONNECTIONS = int(os.getenv("RANGED_DOWNLOAD_CONNECTIONS", 4))
+RANGED_DOWNLOAD_PART_SIZE = int(os.getenv("RANGED_DOWNLOAD_PART_SIZE", 32 * 1024 * 1024))
+# Attempts made at each byte range before the download fails
+RANGED_DOWNLOAD_ATTEMPTS = 3
+
+# Only list new arrivals through the changes API instead of scanning the whole folder
+INCREMENTAL_LISTING = os.getenv("DRIVE_INCREMENTAL_LISTING", "").lower() in ("1", "true", "yes")
+# Where the changes page token and the files still waiting in the folder are kept between runs
+LISTING_STATE_PATH = os.getenv("DRIVE_LISTING_STATE_PATH") or os.path.join(tempfile.gettempdir(), "drive-listing-state.json")
+
+def is_audio_file(file):
+    return file.get("mimeType", "").startswith("audio/") and not file.get("trashed", False)
+
+def list_folder_files(service, folder_id):
+    """Return every audio file in a folder, following pagination.
+
+    Trashed and non-audio files are filtered out by Drive and only the fields
+    in FILE_FIELDS are returned.
+    """
+    query = f"'{folder_id}' in parents and trashed = false and mimeType contains 'audio/'"
+    files = []
+    page_token = None
+    while True:
+        response = service.files().list(
+            q=query,
+            pageSize=MAX_PAGE_SIZE,
+            pageToken=page_token,
+            fields=f"nextPageToken, files({FILE_FIELDS})"
+        ).execute()
+        files.extend(response.get("files", []))
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return files
+
+def load_listing_state(path=LISTING_STATE_PATH):
+    try:
+        with open(path) as state_file:
+            return json.load(state_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_listing_state(state, path=LISTING_STATE_PATH):
+    # Write to a temp name first so a crash never leaves a half written state file
+    partial_path = f"{path}.partial"
+    with open(partial_path, "w") as state_file:
+        json.dump(state, state_file)
+    os.replace(partial_path, path)
+
+def list_folder_files_incremental(service, folder_id, path=LISTING_STATE_PATH):
+    """Return the audio files in a folder using the changes API since the last run.
+
+    The first run, or a run for a different folder, scans the folder in full and
+    stores a start page token. Later runs only read the changes since then. The
+    files seen in the folder are kept in the state, so a show that failed and is
+    still waiting is returned again, and one moved out of the folder is dropped.
+    """
+    state = load_listing_state(path)
+    if not state or state.get("folder_id") != folder_id:
+        page_token = service.changes().getStartPageToken().execute()["startPageToken"]
+        files = list_folder_files(service, folder_id)
+        save_listing_state({
+            "folder_id": folder_id,
+            "page_token": page_token,
+            "files": {file["id"]: file for file in files}
+        }, path)
+        return files
+
+    files = state["files"]
+    page_token = state["page_token"]
+    while page_token:
+        response = service.changes().list(
+            pageToken=page_token,
+            pageSize=MAX_PAGE_SIZE,
+            spaces="drive",
+            fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))"
+        ).execute()
+        for change in response.get("changes", []):
+            file = change.get("file")
+            if not change.get("removed") and file and folder_id in file.get("parents", []) and is_audio_file(file):
+                files[change["fileId"]] = file
+            else:
+                files.pop(change["fileId"], None)
+
+        if "newStartPageToken" in response:
+            state["page_token"] = response["newStartPageToken"]
+        page_token = response.get("nextPageToken")
+
+    save_listing_state(state, path)
+    print(f"Incremental listing found {len(files)} files waiting in the folder")
+    return list(files.values())
+
+def get_folder_files(service, folder_id):
+    """List the audio files waiting in a folder, incrementally when DRIVE_INCREMENTAL_LISTING is set."""
+    if INCREMENTAL_LISTING:
+        return list_folder_files_incremental(service, folder_id)
+    return list_folder_files(service, folder_id)
+
+def execute_batched(service, requests_by_id):
+    """Execute {request_id: request} in as few batch requests as possible.
+
+    Returns {request_id: (response, exception)}, one result per request. When a
+    batch request fails as a whole, its error is the result of every request in
+    it that has none yet, and the remaining batches are still sent.
+    """
+    results = {}
+
+    def callback(request_id, response, exception):
+        results[request_id] = (response, exception)
+
+    items = list(requests_by_id.items())
+    for start in range(0, len(items), MAX_BATCH_SIZE):
+        batch_items = items[start:start + MAX_BATCH_SIZE]
+        batch = service.new_batch_http_request(callback=callback)
+        for request_id, request in batch_items:
+            batch.add(request, request_id=request_id)
+        try:
+            batch.execute()
+        except Exception as e:
+            print(f"Batch of {len(batch_items)} Drive requests failed: {e}")
+            for request_id, _ in batch_items:
+                results.setdefault(request_id, (None, e))
+    return results
+
+def move_files_to_folder(service, file_ids, new_folder_id):
+    """Move several files to a folder using batch requests.
+
+    The parents of every file are looked up in one batch and the moves made in
+    another. Files with no parents are copied into the folder and the originals
+    deleted, also in batches. Returns {file_id: error}, with None for the files
+    that were moved.
+    """
+    errors = {}
+    if not file_ids:
+        return errors
+
+    # Step 1: Get the parents of every file
+    lookups = execute_batched(service, {
+        file_id: service.files().get(fileId=file_id, fields="id, name, parents")
+        for file_id in file_ids
+    })
+
+    moves = {}
+    copies = {}
+    names = {}
+    for file_id, (file_metadata, exception) in lookups.items():
+        if exception is not None:
+            errors[file_id] = exception
+            continue
+        names[file_id] = file_metadata["name"]
+        parents = file_metadata.get("parents", [])
+        if parents:
+            moves[file_id] = service.files().update(
+                fileId=file_id,
+                addParents=new_folder_id,
+                removeParents=",".join(parents),
+                fields="id, parents"
+            )
+        else:
+            print(f"File {file_id} has NO parents. Copying to {new_folder_id}...")
+            copies[file_id] = service.files().copy(
+                fileId=file_id,
+                body={"name": file_metadata["name"], "parents": [new_folder_id]}
+            )
+
+    # Step 2: Move the files that have parents and copy the ones that don't
+    for file_id, (_, exception) in execute_batched(service, {**moves, **copies}).items():
+        errors[file_id] = exception
+
+    # Step 3: Delete the originals of the files that were copied
+    copied = [file_id for file_id in copies if errors[file_id] is None]
+    deletes = execute_batched(service, {file_id: service.files().delete(fileId=file_id) for file_id in copied})
+    for file_id, (_, exception) in deletes.items():
+        errors[file_id] = exception
+
+    for file_id, error in errors.items():
+        if error is None:
+            print(f"Successfully moved {names.get(file_id, file_id)} to folder {new_folder_id}")
+        else:
+            print(f"Error moving file {file_id} to folder {new_folder_id}: {error}")
+    return errors
+
+def download_ranged(credentials, file_id, path, size, md5_checksum=None, connections=RANGED_DOWNLOAD_CONNECTIONS, part_size=RANGED_DOWNLOAD_PART_SIZE):
+    """Download a file into path as byte ranges fetched over several connections.
+
+    The file is preallocated to its full size and every range is written at its
+    own offset. Each thread has its own authorised session, since the Drive
+    service's http client isn't thread safe. The result is checked against
+    Drive's md5Checksum when one is given.
+    """
+    from google.auth.transport.requests import AuthorizedSession
+    url = f"{DRIVE_API_URL}drive/v3/files/{file_id}"
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+    local = threading.local()
+
+    with open(path, "wb") as output:
+        output.truncate(size)
+
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        def fetch_range(byte_range):
+            start, end = byte_range
+            if not hasattr(local, "session"):
+                local.session = AuthorizedSession(credentials)
+
+            for attempt in range(1, RANGED_DOWNLOAD_ATTEMPTS + 1):
+                try:
+                    response = local.session.get(
+                        url,
+                        params={"alt": "media"},
+                        headers={"Range": f"bytes={start}-{end}"},
+                        stream=True,
+                        timeout=60
+                    )
+                    response.raise_for_status()
+                    # A server that ignores Range answers 200 with the whole file, which would overwrite the other ranges
+                    content_range = response.headers.get("Content-Range", "")
+                    if response.status_code != 206 or not content_range.startswith(f"bytes {start}-{end}/"):
+                        response.close()
+                        raise IOError(f"Expected bytes {start}-{end} but got status {response.status_code} with Content-Range {content_range!r}")
+                    offset = start
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        chunk = chunk[:end + 1 - offset]
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                        if offset > end:
+                            break
+                    if offset != end + 1:
+                        raise IOError(f"Expected bytes {start}-{end} but got {offset - start} bytes")
+                    return
+                except Exception as e:
+                    if attempt == RANGED_DOWNLOAD_ATTEMPTS:
+                        raise
+                    print(f"Range {start}-{end} of {file_id} failed ({e}), retrying...")
+                    time.sleep(2 ** attempt)
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            list(executor.map(fetch_range, ranges))
+    finally:
+        os.close(fd)
+
+    if md5_checksum:
+        md5 = hashlib.md5()
+        with open(path, "rb") as downloaded:
+            for block in iter(lambda: downloaded.read(8 * 1024 * 1024), b""):
+                md5.update(block)
+        if md5.hexdigest() != md5_checksum:
+            raise IOError(f"Checksum mismatch for {file_id}: expected {md5_checksum}, got {md5.hexdigest()}")
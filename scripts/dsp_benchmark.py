@@ -0,0 +1,284 @@
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pydub import AudioSegment
+from pydub.utils import get_encoder_name
+from bench_utils import DEFAULT_SILENCE_PATTERN, MemorySampler, generate_audio, parse_silence_pattern
+from audio_utils import SILENCE_MIN_LEN_MS, SILENCE_SEEK_STEP_MS, SILENCE_THRESH_DB, trim_silences, add_jingles, export_mp3
+from silence_utils import detect_silence
+from analysis_utils import analyse_audio, detect_silence_from_index
+from render_utils import RENDER_BITRATE, RENDER_SAMPLE_RATE, START_CROSSFADE_MS, END_CROSSFADE_MS, render_show_ffmpeg
+from stitch_utils import render_show_stitched
+
+# pydub stages are decode, detect_silence, concatenate, jingles and export. The ffmpeg
+# engine's alternatives are analyse, detect_silence_from_index, render_ffmpeg and stitch.
+ENGINES = ("pydub", "ffmpeg")
+# Stages are short, so memory is sampled more often than in the throughput benchmark
+STAGE_SAMPLE_INTERVAL = 0.05
+JINGLE_SECONDS = 10
+# Version of the results format, bumped when a field changes meaning
+RESULTS_VERSION = 1
+
+def measure(fn, trace):
+    """Run fn and return its result with the time, CPU and memory it took.
+
+    CPU time includes the ffmpeg processes the stage waited for. The peak RSS
+    covers this process and its children. When trace is True tracemalloc must be
+    running, and allocated_peak_bytes is the most memory it traced above what was
+    allocated when the stage began.
+    """
+    gc.collect()
+    if trace:
+        tracemalloc.reset_peak()
+        traced_before = tracemalloc.get_traced_memory()[0]
+    times_before = os.times()
+    with MemorySampler(STAGE_SAMPLE_INTERVAL) as memory:
+        rss_before = memory.sample()
+        started = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - started
+    times_after = os.times()
+
+    measurement = {
+        "seconds": seconds,
+        "cpu_seconds": sum(times_after[:4]) - sum(times_before[:4]),
+        "rss_before_bytes": rss_before,
+        "peak_rss_bytes": memory.peak
+    }
+    if trace:
+        measurement["allocated_peak_bytes"] = tracemalloc.get_traced_memory()[1] - traced_before
+    return result, measurement
+
+def print_measurement(stage, measurement):
+    line = f"  {stage:<26} {measurement['seconds']:8.2f} s  {measurement['cpu_seconds']:8.2f} s CPU  peak {measurement['peak_rss_bytes'] / 1024 ** 2:7.0f} MB"
+    if "allocated_peak_bytes" in measurement:
+        line += f"  allocated {measurement['allocated_peak_bytes'] / 1024 ** 2:7.0f} MB"
+    print(line)
+
+def flatten(silent_ranges):
+    return [item for silent_range in silent_ranges for item in silent_range]
+
+def run_pydub_stages(show_path, start_jingle_path, end_jingle_path, trace):
+    """Time each step of the pydub render on its own, the same calls render_fetched_show makes."""
+    start_jingle, end_jingle = AudioSegment.from_wav(start_jingle_path), AudioSegment.from_wav(end_jingle_path)
+    measurements = {}
+
+    show, measurements["decode"] = measure(lambda: AudioSegment.from_file(show_path), trace)
+    silent_ranges, measurements["detect_silence"] = measure(
+        lambda: detect_silence(show, min_silence_len=SILENCE_MIN_LEN_MS, seek_step=SILENCE_SEEK_STEP_MS, silence_thresh=SILENCE_THRESH_DB),
+        trace
+    )
+    trimmed_show, measurements["concatenate"] = measure(lambda: trim_silences(show, flatten(silent_ranges)), trace)
+    final_output, measurements["jingles"] = measure(lambda: add_jingles(trimmed_show, start_jingle, end_jingle), trace)
+    audio_file, measurements["export"] = measure(lambda: export_mp3(final_output), trace)
+    audio_file.close()
+    return measurements, len(silent_ranges)
+
+def run_ffmpeg_stages(show_path, start_jingle_path, end_jingle_path, trace):
+    """Time each step of the ffmpeg engine on its own, including MP3 stitching for MP3 shows."""
+    measurements = {}
+
+    index, measurements["analyse"] = measure(lambda: analyse_audio(show_path), trace)
+    silent_ranges, measurements["detect_silence_from_index"] = measure(
+        lambda: detect_silence_from_index(index, min_silence_len=SILENCE_MIN_LEN_MS, seek_step=SILENCE_SEEK_STEP_MS, silence_thresh=SILENCE_THRESH_DB),
+        trace
+    )
+    audio_file, measurements["render_ffmpeg"] = measure(
+        lambda: render_show_ffmpeg(show_path, flatten(silent_ranges), start_jingle_path, end_jingle_path, bitrate=RENDER_BITRATE),
+        trace
+    )
+    audio_file.close()
+
+    if show_path.lower().endswith(".mp3"):
+        audio_file, measurement = measure(
+            lambda: render_show_stitched(
+                show_path, flatten(silent_ranges), start_jingle_path, end_jingle_path,
+                index["frames"], index["sample_rate"], bitrate=RENDER_BITRATE
+            ),
+            trace
+        )
+        # A show the stitcher can't copy from is rendered in full by the pipeline instead
+        measurement["stitched"] = audio_file is not None
+        measurements["stitch"] = measurement
+        if audio_file is not None:
+            audio_file.close()
+    return measurements, len(silent_ranges)
+
+def summarise(runs, allocated_peak_bytes=None):
+    return {
+        "seconds_min": min(run["seconds"] for run in runs),
+        "seconds_median": statistics.median(run["seconds"] for run in runs),
+        "cpu_seconds_median": statistics.median(run["cpu_seconds"] for run in runs),
+        "peak_rss_bytes_max": max(run["peak_rss_bytes"] for run in runs),
+        "allocated_peak_bytes": allocated_peak_bytes,
+        "runs": runs
+    }
+
+def benchmark_show(work_dir, show, engines, repeat, allocations):
+    """Generate one synthetic show and time every stage of the given engines on it repeat times.
+
+    tracemalloc slows down Python heavy stages many times over, so allocations
+    are measured in one extra run whose times aren't used.
+    """
+    show_path = os.path.join(work_dir, f"show-{show['minutes']}m-{show['sample_rate']}hz.{show['format']}")
+    print(f"Generating a {show['minutes']} minute {show['format']} show at {show['sample_rate']} Hz, silence {show['silence']!r}...")
+    generate_audio(
+        show_path, show["minutes"] * 60, sample_rate=show["sample_rate"], channels=show["channels"],
+        signal=show["signal"], silence=parse_silence_pattern(show["silence"])
+    )
+
+    # Jingles come from Drive as 44.1 kHz stereo WAVs
+    jingle_paths = []
+    for name, frequency in (("start-jingle.wav", 440), ("end-jingle.wav", 660)):
+        path = os.path.join(work_dir, name)
+        generate_audio(path, JINGLE_SECONDS, signal="tone", frequency=frequency)
+        jingle_paths.append(path)
+
+    runs = {}
+    allocated = {}
+    silent_ranges = {}
+    passes = [f"Run {attempt}/{repeat}" for attempt in range(1, repeat + 1)] + (["Tracing allocations"] if allocations else [])
+    for name in passes:
+        print(f"{name}:")
+        trace = name == "Tracing allocations"
+        if trace:
+            tracemalloc.start()
+        try:
+            for engine in engines:
+                run_stages = run_pydub_stages if engine == "pydub" else run_ffmpeg_stages
+                measurements, silent_ranges[engine] = run_stages(show_path, *jingle_paths, trace)
+                for stage, measurement in measurements.items():
+                    print_measurement(stage, measurement)
+                    if trace:
+                        allocated[stage] = measurement["allocated_peak_bytes"]
+                    else:
+                        runs.setdefault(stage, []).append(measurement)
+                gc.collect()
+        finally:
+            if trace:
+                tracemalloc.stop()
+
+    result = dict(show, size_bytes=os.path.getsize(show_path), silent_ranges=silent_ranges)
+    os.remove(show_path)
+    return {"show": result, "stages": {stage: summarise(stage_runs, allocated.get(stage)) for stage, stage_runs in runs.items()}}
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def ffmpeg_version():
+    try:
+        output = subprocess.run([get_encoder_name(), "-version"], capture_output=True, text=True).stdout
+        return output.splitlines()[0] if output else None
+    except OSError:
+        return None
+
+def show_key(show):
+    return tuple(show[name] for name in ("minutes", "sample_rate", "channels", "format", "signal", "silence"))
+
+def compare(baseline, results):
+    """Print the change in median time and peak memory of each stage against a baseline run."""
+    baseline_shows = {show_key(entry["show"]): entry for entry in baseline["shows"]}
+    print(f"\nCompared with {baseline.get('commit') or 'the baseline'}:")
+    for entry in results["shows"]:
+        before = baseline_shows.get(show_key(entry["show"]))
+        if before is None:
+            continue
+        show = entry["show"]
+        print(f"{show['minutes']} minute {show['format']} show at {show['sample_rate']} Hz:")
+        for stage, after_stats in entry["stages"].items():
+            before_stats = before["stages"].get(stage)
+            if before_stats is None:
+                continue
+            seconds_before, seconds_after = before_stats["seconds_median"], after_stats["seconds_median"]
+            change = (seconds_after - seconds_before) / seconds_before * 100 if seconds_before else 0
+            print(
+                f"  {stage:<26} {seconds_before:8.2f} s -> {seconds_after:8.2f} s ({change:+6.1f}%)"
+                f"  peak {before_stats['peak_rss_bytes_max'] / 1024 ** 2:7.0f} MB -> {after_stats['peak_rss_bytes_max'] / 1024 ** 2:7.0f} MB"
+            )
+
+def run_dsp_benchmark(shows, engines=ENGINES, repeat=1, allocations=True):
+    """Time every DSP stage on each synthetic show and return the results as a dict ready for JSON."""
+    work_dir = tempfile.mkdtemp(prefix="dsp-benchmark-")
+    try:
+        results = {
+            "version": RESULTS_VERSION,
+            "created": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "ffmpeg": ffmpeg_version()
+            },
+            "settings": {
+                "bitrate": RENDER_BITRATE,
+                "render_sample_rate": RENDER_SAMPLE_RATE,
+                "silence": [SILENCE_MIN_LEN_MS, SILENCE_SEEK_STEP_MS, SILENCE_THRESH_DB],
+                "crossfades": [START_CROSSFADE_MS, END_CROSSFADE_MS],
+                "engines": list(engines),
+                "repeat": repeat,
+                "allocations": allocations
+            },
+            "shows": [benchmark_show(work_dir, show, engines, repeat, allocations) for show in shows]
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the decode, silence, edit and encode stages on synthetic shows and write the results as JSON.")
+    parser.add_argument("--minutes", type=int, nargs="+", default=[30], help="show lengths to benchmark, e.g. 30 120 240")
+    parser.add_argument("--sample-rate", type=int, nargs="+", default=[44100], help="sample rates of the synthetic shows")
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--format", choices=("mp3", "wav"), default="mp3", help="format the shows are uploaded in")
+    parser.add_argument("--signal", choices=("noise", "tone"), default="noise", help="pink noise encodes about as slowly as music")
+    parser.add_argument("--silence", default=DEFAULT_SILENCE_PATTERN, help='silence pattern in seconds, e.g. "every=600,length=10,edges=20" or "none"')
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--repeat", type=int, default=1, help="times every stage is run on each show")
+    parser.add_argument("--no-allocations", action="store_true", help="skip the extra run that traces allocations")
+    parser.add_argument("--output", help="where to write the JSON results, defaults to a timestamped file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    # Fail before any show is generated rather than after
+    parse_silence_pattern(args.silence)
+    shows = [
+        {
+            "minutes": minutes,
+            "sample_rate": sample_rate,
+            "channels": args.channels,
+            "format": args.format,
+            "signal": args.signal,
+            "silence": args.silence
+        }
+        for minutes, sample_rate in itertools.product(args.minutes, args.sample_rate)
+    ]
+
+    results = run_dsp_benchmark(shows, engines=args.engines, repeat=args.repeat, allocations=not args.no_allocations)
+    output = args.output or f"dsp-benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"\nWrote results to {output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(json.load(baseline_file), results)
+
+if __name__ == "__main__":
+    main()
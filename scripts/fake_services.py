@@ -0,0 +1,561 @@
+import base64
+import email.parser
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# Artwork returned for every show, a 1x1 PNG
+ARTWORK_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+# Size of the blocks request bodies are read and discarded in
+READ_SIZE = 1024 * 1024
+# Requests whose bodies are counted and thrown away instead of being kept in memory
+DISCARDED_BODIES = re.compile(r"^(POST /soundcloud/tracks|POST /spaces/[^/]+/uploads|PUT /upload/drive/v3/files)")
+
+# Service of a request, worked out from the start of its path
+SERVICE_PREFIXES = (
+    ("/token", "drive"),
+    ("/drive/", "drive"),
+    ("/upload/drive/", "drive"),
+    ("/batch/drive/", "drive"),
+    ("/soundcloud/", "soundcloud"),
+    ("/website/", "website"),
+    ("/spaces/", "contentful"),
+    ("/supabase/", "supabase"),
+    ("/slack", "slack"),
+)
+
+TOKEN_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+def service_for(path):
+    for prefix, service in SERVICE_PREFIXES:
+        if path.startswith(prefix):
+            return service
+    return "unknown"
+
+def json_response(data, status=200, headers=None):
+    return status, dict({"Content-Type": "application/json"}, **(headers or {})), json.dumps(data).encode()
+
+def drive_error(status, message):
+    return json_response({"error": {"code": status, "message": message}}, status)
+
+class FakeServices:
+    """Local stand-ins for Drive, SoundCloud, the website API, Contentful, Supabase and Slack.
+
+    Everything is served from one HTTP server and each service is told apart by
+    its path, environment() gives the settings that point the pipeline at it.
+    latency maps a service name to seconds added to each of its responses, and
+    Contentful assets only get a URL asset_processing_delay seconds after they
+    are processed. Requests are counted and timed per operation in stats, and
+    the connections they arrived on in connections.
+    """
+
+    def __init__(self, port=0, latency=None, asset_processing_delay=0.0, space_id="benchmark", environment_id="master"):
+        self.latency = latency or {}
+        self.asset_processing_delay = asset_processing_delay
+        self.space_id = space_id
+        self.environment_id = environment_id
+        self.lock = threading.Lock()
+
+        self.files = {}
+        self.file_paths = {}
+        self.changes = []
+        self.upload_sessions = {}
+        self.tracks = []
+        self.contentful_uploads = {}
+        self.assets = {}
+        self.entries = {}
+        self.slack_messages = []
+        self.rejections = []
+        self.stats = {}
+        self.connections = 0
+        self.ids = 0
+
+        # The SoundCloud token starts out expired so the first upload refreshes it
+        self.soundcloud_tokens = {
+            "application": "soundcloud",
+            "token": "expired-token",
+            "refresh_token": "refresh-token-0",
+            "expires": (datetime.now(timezone.utc) - timedelta(hours=1)).strftime(TOKEN_DATE_FORMAT)
+        }
+
+        handler = type("Handler", (FakeServicesHandler,), {"services": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self.host = f"127.0.0.1:{self.server.server_address[1]}"
+        self.url = f"http://{self.host}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def environment(self):
+        """Return the environment variables that point every service at this server."""
+        return {
+            "DRIVE_API_URL": f"{self.url}/",
+            "GOOGLE_TOKEN_URI": f"{self.url}/token",
+            "SOUNDCLOUD_API_URL": f"{self.url}/soundcloud",
+            "SOUNDCLOUD_TOKEN_URL": f"{self.url}/soundcloud/oauth/token",
+            "WEBSITE_API_URL": f"{self.url}/website/api",
+            "CONTENTFUL_API_HOST": self.host,
+            "CONTENTFUL_UPLOADS_HOST": self.host,
+            "CONTENTFUL_HTTPS": "false",
+            "CONTENTFUL_SPACE_ID": self.space_id,
+            "CONTENTFUL_ENV_ID": self.environment_id,
+            "SUPABASE_URL": f"{self.url}/supabase",
+            "SLACK_ERROR_URL": f"{self.url}/slack"
+        }
+
+    def next_id(self, prefix):
+        with self.lock:
+            self.ids += 1
+            return f"{prefix}{self.ids}"
+
+    def add_file(self, path, name, folder_id, mime_type="audio/mpeg"):
+        """Put a file from disk into a Drive folder and return its ID."""
+        md5 = hashlib.md5()
+        size = 0
+        with open(path, "rb") as source:
+            for block in iter(lambda: source.read(READ_SIZE), b""):
+                md5.update(block)
+                size += len(block)
+
+        file_id = self.next_id("file")
+        with self.lock:
+            self.file_paths[file_id] = path
+            self.files[file_id] = {
+                "id": file_id,
+                "name": name,
+                "size": str(size),
+                "md5Checksum": md5.hexdigest(),
+                "mimeType": mime_type,
+                "parents": [folder_id],
+                "trashed": False,
+                "modifiedTime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            }
+            self.changes.append(file_id)
+        return file_id
+
+    def folder_files(self, folder_id):
+        with self.lock:
+            return [dict(file) for file in self.files.values() if folder_id in file["parents"]]
+
+    def reject_next(self, method, pattern, status=401):
+        """Answer the next method request whose path matches the regex pattern with an error status."""
+        with self.lock:
+            self.rejections.append((method, re.compile(pattern), status))
+
+    def record(self, service, operation, seconds, received):
+        with self.lock:
+            stats = self.stats.setdefault((service, operation), {"requests": 0, "seconds": 0.0, "bytes": 0})
+            stats["requests"] += 1
+            stats["seconds"] += seconds
+            stats["bytes"] += received
+
+    def handle(self, method, target, headers, body, received=0):
+        """Answer one request, returns (status, headers, body) and the operation it was."""
+        parts = urlsplit(target)
+        path = parts.path
+        query = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+        service = service_for(path)
+        time.sleep(self.latency.get(service, 0))
+
+        with self.lock:
+            rejection = next((rejection for rejection in self.rejections if rejection[0] == method and rejection[1].fullmatch(path)), None)
+            if rejection is not None:
+                self.rejections.remove(rejection)
+        if rejection is not None:
+            # Shaped like Contentful's answer to an expired token
+            return json_response({"sys": {"type": "Error", "id": "AccessTokenInvalid"}, "message": "Rejected by the test"}, rejection[2]), "rejected"
+
+        handler = getattr(self, f"handle_{service}", None)
+        if handler is None:
+            return (404, {}, b"Not found"), "unknown"
+        return handler(method, path, query, headers, body, received)
+
+    # Drive
+
+    def handle_drive(self, method, path, query, headers, body, received):
+        if path == "/token":
+            return json_response({"access_token": "drive-token", "expires_in": 3600, "token_type": "Bearer"}), "token"
+        if path == "/batch/drive/v3":
+            return self.drive_batch(headers, body), "batch"
+        if path == "/upload/drive/v3/files":
+            return self.drive_upload(method, query, headers, body, received), "upload"
+        if path == "/drive/v3/changes/startPageToken":
+            with self.lock:
+                return json_response({"startPageToken": str(len(self.changes))}), "changes.getStartPageToken"
+        if path == "/drive/v3/changes":
+            return self.drive_changes(query), "changes.list"
+        if path == "/drive/v3/files" and method == "GET":
+            return self.drive_list(query), "files.list"
+
+        match = re.fullmatch(r"/drive/v3/files/([^/]+)(/copy)?", path)
+        if not match:
+            return drive_error(404, f"No route for {method} {path}"), "unknown"
+        file_id, copy = match.groups()
+        with self.lock:
+            file = self.files.get(file_id)
+        if file is None:
+            return drive_error(404, f"File not found: {file_id}"), "files.get"
+
+        if copy:
+            attributes = json.loads(body or b"{}")
+            new_id = self.next_id("file")
+            with self.lock:
+                self.files[new_id] = dict(file, id=new_id, name=attributes.get("name", file["name"]), parents=attributes.get("parents", []))
+                if file_id in self.file_paths:
+                    self.file_paths[new_id] = self.file_paths[file_id]
+                self.changes.append(new_id)
+            return json_response({"id": new_id}), "files.copy"
+        if method == "DELETE":
+            with self.lock:
+                del self.files[file_id]
+                self.changes.append(file_id)
+            return (204, {}, b""), "files.delete"
+        if method == "PATCH":
+            with self.lock:
+                removed = query.get("removeParents", "").split(",")
+                parents = [parent for parent in file["parents"] if parent not in removed]
+                if query.get("addParents"):
+                    parents.append(query["addParents"])
+                file["parents"] = parents
+                self.changes.append(file_id)
+            return json_response({"id": file_id, "parents": parents}), "files.update"
+        if query.get("alt") == "media":
+            return self.drive_media(file_id, file, headers), "files.get_media"
+        return json_response(file), "files.get"
+
+    def drive_list(self, query):
+        folder = re.search(r"'([^']+)' in parents", query.get("q", ""))
+        files = [
+            file for file in self.folder_files(folder.group(1) if folder else None)
+            if not file["trashed"] and file["mimeType"].startswith("audio/")
+        ]
+        start = int(query.get("pageToken", 0))
+        page_size = int(query.get("pageSize", 100))
+        response = {"files": files[start:start + page_size]}
+        if start + page_size < len(files):
+            response["nextPageToken"] = str(start + page_size)
+        return json_response(response)
+
+    def drive_changes(self, query):
+        start = int(query.get("pageToken", 0))
+        with self.lock:
+            changed = list(dict.fromkeys(self.changes[start:]))
+            changes = []
+            for file_id in changed:
+                if file_id in self.files:
+                    changes.append({"fileId": file_id, "removed": False, "file": dict(self.files[file_id])})
+                else:
+                    changes.append({"fileId": file_id, "removed": True})
+            return json_response({"changes": changes, "newStartPageToken": str(len(self.changes))})
+
+    def drive_media(self, file_id, file, headers):
+        path = self.file_paths.get(file_id)
+        if path is None:
+            return drive_error(404, f"File {file_id} has no content")
+        size = int(file["size"])
+        byte_range = re.fullmatch(r"bytes=(\d+)-(\d*)", headers.get("Range", ""))
+        if not byte_range:
+            with open(path, "rb") as source:
+                return 200, {"Content-Type": file["mimeType"]}, source.read()
+
+        start = int(byte_range.group(1))
+        end = min(int(byte_range.group(2) or size - 1), size - 1)
+        with open(path, "rb") as source:
+            source.seek(start)
+            data = source.read(end - start + 1)
+        return 206, {"Content-Type": file["mimeType"], "Content-Range": f"bytes {start}-{end}/{size}"}, data
+
+    def drive_upload(self, method, query, headers, body, received):
+        """Resumable uploads, the only kind the pipeline makes."""
+        if method == "POST":
+            session_id = uuid.uuid4().hex
+            with self.lock:
+                self.upload_sessions[session_id] = {
+                    "metadata": json.loads(body or b"{}"),
+                    "mime_type": headers.get("X-Upload-Content-Type", "application/octet-stream"),
+                    "received": 0
+                }
+            location = f"{self.url}/upload/drive/v3/files?uploadType=resumable&upload_id={session_id}"
+            return 200, {"Location": location}, b""
+
+        with self.lock:
+            session = self.upload_sessions.get(query.get("upload_id"))
+        if session is None:
+            return drive_error(404, "Unknown upload session")
+        content_range = re.fullmatch(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)", headers.get("Content-Range", "bytes */*"))
+        session["received"] += received
+        total = content_range.group(3) if content_range else "*"
+        if total == "*" or session["received"] < int(total):
+            return 308, {"Range": f"bytes=0-{session['received'] - 1}"} if session["received"] else {}, b""
+
+        file_id = self.next_id("file")
+        metadata = session["metadata"]
+        with self.lock:
+            del self.upload_sessions[query["upload_id"]]
+            self.files[file_id] = {
+                "id": file_id,
+                "name": metadata.get("name", file_id),
+                "size": total,
+                "mimeType": session["mime_type"],
+                "parents": metadata.get("parents", []),
+                "trashed": False
+            }
+            self.changes.append(file_id)
+        return json_response({"id": file_id})
+
+    def drive_batch(self, headers, body):
+        """Answer a multipart/mixed batch by handling each of its requests in turn."""
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {headers.get('Content-Type')}\r\n\r\n".encode() + body
+        )
+        boundary = uuid.uuid4().hex
+        response = []
+        for part in message.get_payload():
+            head, _, inner_body = part.get_payload().replace("\r\n", "\n").partition("\n\n")
+            lines = head.split("\n")
+            method, target, _ = lines[0].split(" ", 2)
+            inner_headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+            (status, response_headers, content), operation = self.handle_drive(
+                method, urlsplit(target).path,
+                {name: values[-1] for name, values in parse_qs(urlsplit(target).query).items()},
+                inner_headers, inner_body.encode(), 0
+            )
+            self.record("drive", f"batch {operation}", 0, 0)
+            content_id = part["Content-ID"]
+            response.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id[1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\nContent-Type: {response_headers.get('Content-Type', 'application/json')}\r\n\r\n".encode()
+                + content + b"\r\n"
+            )
+        response.append(f"--{boundary}--\r\n".encode())
+        return 200, {"Content-Type": f"multipart/mixed; boundary={boundary}"}, b"".join(response)
+
+    # SoundCloud
+
+    def handle_soundcloud(self, method, path, query, headers, body, received):
+        if path == "/soundcloud/oauth/token":
+            form = {name: values[-1] for name, values in parse_qs(body.decode()).items()}
+            if form.get("refresh_token") != self.soundcloud_tokens["refresh_token"]:
+                return json_response({"error": "invalid_grant"}, 401), "oauth.token"
+            number = self.next_id("")
+            return json_response({
+                "access_token": f"access-token-{number}",
+                "refresh_token": f"refresh-token-{number}",
+                "expires_in": 3600
+            }), "oauth.token"
+
+        if path == "/soundcloud/tracks" and method == "POST":
+            if headers.get("Authorization") != f"OAuth {self.soundcloud_tokens['token']}":
+                return json_response({"error": "invalid token"}, 401), "tracks.create"
+            track_id = self.next_id("")
+            with self.lock:
+                self.tracks.append({"id": track_id, "bytes": received})
+            return json_response({"id": track_id, "permalink_url": f"https://soundcloud.com/benchmark/track-{track_id}"}, 201), "tracks.create"
+        return json_response({"error": "not found"}, 404), "unknown"
+
+    # Website
+
+    def handle_website(self, method, path, query, headers, body, received):
+        if path == "/website/artwork.png":
+            return (200, {"Content-Type": "image/png"}, ARTWORK_PNG), "artwork"
+        if path == "/website/api/shows/by-timestamp":
+            timestamp = query.get("t", "")
+            return json_response([{
+                "id": f"show-{timestamp}",
+                "title": f"Benchmark Show {timestamp} | Benchmark Artist",
+                "artwork": f"{self.url}/website/artwork.png",
+                "genres": ["Benchmark"]
+            }]), "shows.by-timestamp"
+        return json_response({"error": "not found"}, 404), "unknown"
+
+    # Contentful
+
+    def link(self, link_type, link_id):
+        return {"sys": {"type": "Link", "linkType": link_type, "id": link_id}}
+
+    def contentful_sys(self, resource_type, resource_id, version=1, **extra):
+        return dict({
+            "type": resource_type,
+            "id": resource_id,
+            "version": version,
+            "space": self.link("Space", self.space_id),
+            "environment": self.link("Environment", self.environment_id)
+        }, **extra)
+
+    def asset_json(self, asset):
+        fields = json.loads(json.dumps(asset["fields"]))
+        if asset["processed_at"] is not None and time.time() >= asset["processed_at"] + self.asset_processing_delay:
+            for locale, file in fields.get("file", {}).items():
+                file.pop("uploadFrom", None)
+                file["url"] = f"//assets.benchmark/{asset['id']}/{file.get('fileName', 'audio.mp3')}"
+        return {"sys": self.contentful_sys("Asset", asset["id"], asset["version"]), "fields": fields}
+
+    def entry_json(self, entry):
+        return {
+            "sys": self.contentful_sys("Entry", entry["id"], entry["version"], contentType=self.link("ContentType", "show")),
+            "fields": entry["fields"]
+        }
+
+    def handle_contentful(self, method, path, query, headers, body, received):
+        space = f"/spaces/{self.space_id}"
+        environment = f"{space}/environments/{self.environment_id}"
+
+        if path == space:
+            return json_response({"sys": {"type": "Space", "id": self.space_id}, "name": "Benchmark"}), "spaces.find"
+        if path == environment:
+            return json_response({"sys": self.contentful_sys("Environment", self.environment_id), "name": self.environment_id}), "environments.find"
+        if path == f"{space}/uploads" and method == "POST":
+            upload_id = self.next_id("upload")
+            with self.lock:
+                self.contentful_uploads[upload_id] = received
+            return json_response({"sys": {"type": "Upload", "id": upload_id, "space": self.link("Space", self.space_id)}}, 201), "uploads.create"
+        if path == f"{environment}/content_types/show":
+            return json_response({
+                "sys": self.contentful_sys("ContentType", "show"),
+                "name": "Show",
+                "displayField": "title",
+                "fields": [
+                    {"id": "title", "name": "Title", "type": "Symbol"},
+                    {"id": "mixcloudLink", "name": "Mixcloud Link", "type": "Symbol"},
+                    {"id": "audioFile", "name": "Audio File", "type": "Link", "linkType": "Asset"}
+                ]
+            }), "content_types.find"
+
+        if path == f"{environment}/assets" and method == "POST":
+            asset_id = self.next_id("asset")
+            asset = {"id": asset_id, "version": 1, "fields": json.loads(body)["fields"], "processed_at": None}
+            with self.lock:
+                self.assets[asset_id] = asset
+            return json_response(self.asset_json(asset), 201), "assets.create"
+
+        match = re.fullmatch(rf"{environment}/assets/([^/]+)(/files/[^/]+/process|/published)?", path)
+        if match:
+            asset = self.assets.get(match.group(1))
+            if asset is None:
+                return json_response({"sys": {"type": "Error", "id": "NotFound"}}, 404), "assets.find"
+            action = match.group(2) or ""
+            if action.endswith("/process"):
+                asset["processed_at"] = time.time()
+                asset["version"] += 1
+                return (204, {}, b""), "assets.process"
+            if action == "/published":
+                asset["version"] += 1
+                return json_response(self.asset_json(asset)), "assets.publish"
+            return json_response(self.asset_json(asset)), "assets.find"
+
+        match = re.fullmatch(rf"{environment}/entries/([^/]+)(/published)?", path)
+        if match:
+            entry_id, published = match.groups()
+            with self.lock:
+                entry = self.entries.setdefault(entry_id, {
+                    "id": entry_id,
+                    "version": 1,
+                    "fields": {"title": {"en-US": f"Benchmark Show {entry_id}"}}
+                })
+            if method == "DELETE" and not published:
+                with self.lock:
+                    del self.entries[entry_id]
+                return (204, {}, b""), "entries.delete"
+            if method == "PUT" and not published:
+                entry["fields"] = json.loads(body).get("fields", entry["fields"])
+                entry["version"] += 1
+                return json_response(self.entry_json(entry)), "entries.update"
+            if published:
+                entry["version"] += 1
+                return json_response(self.entry_json(entry)), "entries.unpublish" if method == "DELETE" else "entries.publish"
+            return json_response(self.entry_json(entry)), "entries.find"
+
+        return json_response({"sys": {"type": "Error", "id": "NotFound"}}, 404), "unknown"
+
+    # Supabase
+
+    def handle_supabase(self, method, path, query, headers, body, received):
+        if path != "/supabase/rest/v1/accessTokens" or query.get("application") != "eq.soundcloud":
+            return json_response({"message": "not found"}, 404), "unknown"
+        if method == "PATCH":
+            with self.lock:
+                self.soundcloud_tokens.update(json.loads(body))
+            return json_response([self.soundcloud_tokens]), "accessTokens.update"
+        if "vnd.pgrst.object" in headers.get("Accept", ""):
+            return json_response(self.soundcloud_tokens), "accessTokens.select"
+        return json_response([self.soundcloud_tokens]), "accessTokens.select"
+
+    # Slack
+
+    def handle_slack(self, method, path, query, headers, body, received):
+        with self.lock:
+            self.slack_messages.append(json.loads(body).get("text", ""))
+        return (200, {"Content-Type": "text/plain"}, b"ok"), "error"
+
+class FakeServicesHandler(BaseHTTPRequestHandler):
+    """Reads each request and passes it on to the FakeServices it belongs to."""
+
+    protocol_version = "HTTP/1.1"
+    services = None
+
+    def setup(self):
+        super().setup()
+        with self.services.lock:
+            self.services.connections += 1
+
+    def read_body(self, keep):
+        """Return the request body, or only count it when keep is False."""
+        chunks = []
+        received = 0
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                received += len(chunk)
+                if keep:
+                    chunks.append(chunk)
+        else:
+            remaining = int(self.headers.get("Content-Length", 0))
+            while remaining:
+                chunk = self.rfile.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                received += len(chunk)
+                if keep:
+                    chunks.append(chunk)
+        return b"".join(chunks), received
+
+    def respond(self):
+        started = time.time()
+        keep = not DISCARDED_BODIES.match(f"{self.command} {self.path}")
+        body, received = self.read_body(keep)
+        (status, headers, content), operation = self.services.handle(self.command, self.path, self.headers, body, received)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+        self.services.record(service_for(urlsplit(self.path).path), operation, time.time() - started, received)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = respond
+
+    def log_message(self, format, *args):
+        # The pipeline's own logs are what the benchmark is read alongside
+        pass
@@ -0,0 +1,114 @@
+import fcntl
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing, contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# SQLite file recording how far each show got, so a later run can carry on from there
+JOURNAL_PATH = os.getenv("JOURNAL_PATH") or os.path.join(tempfile.gettempdir(), "show-journal.sqlite3")
+# Runs a failing show is attempted in before it is left for someone to look at
+JOURNAL_MAX_ATTEMPTS = int(os.getenv("JOURNAL_MAX_ATTEMPTS", 5))
+# Seconds to wait before retrying a failed show, doubled after every failure
+JOURNAL_RETRY_DELAY = float(os.getenv("JOURNAL_RETRY_DELAY", 600))
+
+# Lock file held while shows are being processed, so a cron run and the worker never overlap
+RUN_LOCK_PATH = os.getenv("RUN_LOCK_PATH") or os.path.join(tempfile.gettempdir(), "audio-automation.lock")
+
+# Stages recorded for a show, in the order they happen
+STAGES = ("downloaded", "rendered", "sc_link", "asset_id", "drive_file_id", "entry_published", "moved")
+
+def connect(path=JOURNAL_PATH):
+    # A connection per call keeps the journal safe to use from threads and worker processes.
+    # Used as `with closing(connect()) as connection, connection:`, as the connection's own block only commits
+    connection = sqlite3.connect(path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS shows (
+            file_id TEXT PRIMARY KEY,
+            name TEXT,
+            downloaded REAL,
+            rendered REAL,
+            sc_link TEXT,
+            asset_id TEXT,
+            drive_file_id TEXT,
+            entry_published REAL,
+            moved REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL DEFAULT 0,
+            last_error TEXT
+        )"""
+    )
+    # Journals created before the Drive rendition was added don't have its column yet
+    columns = [row["name"] for row in connection.execute("PRAGMA table_info(shows)")]
+    if "drive_file_id" not in columns:
+        try:
+            connection.execute("ALTER TABLE shows ADD COLUMN drive_file_id TEXT")
+        except sqlite3.OperationalError:
+            # Another process added it first
+            pass
+    return connection
+
+def get_show_record(file_id, path=JOURNAL_PATH):
+    """Return the journal record of a show as a dict, empty if it has none yet."""
+    with closing(connect(path)) as connection, connection:
+        row = connection.execute("SELECT * FROM shows WHERE file_id = ?", (file_id,)).fetchone()
+    return dict(row) if row else {}
+
+def record_stage(file_id, name, stage, value=None, path=JOURNAL_PATH):
+    """Record that a show has completed a stage.
+
+    sc_link, asset_id and drive_file_id store the value they produced, the
+    other stages store the time they were completed.
+    """
+    if stage not in STAGES:
+        raise ValueError(f"Unknown journal stage {stage}")
+    if value is None:
+        value = time.time()
+    with closing(connect(path)) as connection, connection:
+        connection.execute("INSERT OR IGNORE INTO shows (file_id, name) VALUES (?, ?)", (file_id, name))
+        connection.execute(f"UPDATE shows SET {stage} = ? WHERE file_id = ?", (value, file_id))
+
+def record_failure(file_id, name, error, path=JOURNAL_PATH):
+    """Record a failed attempt at a show and when it may be tried again."""
+    with closing(connect(path)) as connection, connection:
+        connection.execute("INSERT OR IGNORE INTO shows (file_id, name) VALUES (?, ?)", (file_id, name))
+        attempts = connection.execute("SELECT attempts FROM shows WHERE file_id = ?", (file_id,)).fetchone()[0] + 1
+        next_attempt = time.time() + JOURNAL_RETRY_DELAY * 2 ** (attempts - 1)
+        connection.execute(
+            "UPDATE shows SET attempts = ?, next_attempt = ?, last_error = ? WHERE file_id = ?",
+            (attempts, next_attempt, str(error), file_id)
+        )
+
+def should_attempt(file_id, path=JOURNAL_PATH):
+    """Return whether a show is due to be attempted, or why not."""
+    record = get_show_record(file_id, path)
+    if not record:
+        return True, None
+    if record["attempts"] >= JOURNAL_MAX_ATTEMPTS:
+        return False, f"gave up after {record['attempts']} attempts, last error: {record['last_error']}"
+    if time.time() < record["next_attempt"]:
+        return False, f"retrying after backoff in {record['next_attempt'] - time.time():.0f} seconds"
+    return True, None
+
+@contextmanager
+def run_lock(path=RUN_LOCK_PATH):
+    """Hold the run lock for the duration of the block.
+
+    Yields True once the lock is held, or False straight away if another
+    process already holds it. The lock is released when the process exits, so
+    a crashed run never leaves it behind.
+    """
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -1,5 +1,7 @@
-from audio_utils import process_audio_files, download_file
+from audio_utils import process_audio_files, cached_jingle_path
 from upload_utils import get_drive_service, find_asset_url
+from drive_utils import get_folder_files
+from journal_utils import run_lock
 from pydub import AudioSegment
 import psutil
 import threading
@@ -7,11 +9,17 @@ import os
 import time
 
 def log_memory_usage_periodically():
-    """Log memory usage every 10 seconds."""
+    """Log memory usage every 10 seconds, including any worker processes."""
     process = psutil.Process(os.getpid())
     while True:
         memory_info = process.memory_info()
-        print(f"[Memory Monitor] Memory usage: {memory_info.rss / 1024 ** 2:.2f} MB")
+        workers_rss = 0
+        for child in process.children(recursive=True):
+            try:
+                workers_rss += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                continue
+        print(f"[Memory Monitor] Memory usage: {memory_info.rss / 1024 ** 2:.2f} MB, workers: {workers_rss / 1024 ** 2:.2f} MB")
         time.sleep(10)  # Wait for 10 seconds before logging again
 
 def main():
@@ -33,17 +41,34 @@ def main():
         if not input_folder_id or not output_folder_id:
             raise ValueError("Ensure INPUT_FOLDER_ID and OUTPUT_FOLDER_ID are set in environment variables.")
 
-        # Load jingles as audio segment
-        start_jingle, end_jingle = download_file(drive_service, os.getenv('START_JINGLE_ID')),  download_file(drive_service, os.getenv('END_JINGLE_ID'))
-
-        # Process audio files and upload results
-        process_audio_files(
-            service=drive_service,
-            folder_id=input_folder_id,
-            start_jingle=start_jingle,
-            end_jingle=end_jingle
-        )
-        print("Audio processing and uploads completed successfully.")
+        # The worker may already be processing shows from the same folder
+        with run_lock() as acquired:
+            if not acquired:
+                print("Another run is processing shows, nothing to do.")
+                return
+
+            # Most runs find nothing new, so stop before the jingles are fetched and decoded
+            files = get_folder_files(drive_service, input_folder_id)
+            if not files:
+                print("No shows waiting in the input folder, nothing to do.")
+                return
+
+            # Load jingles as audio segment, only downloading them when they have changed on Drive
+            start_jingle_path = cached_jingle_path(drive_service, os.getenv('START_JINGLE_ID'))
+            end_jingle_path = cached_jingle_path(drive_service, os.getenv('END_JINGLE_ID'))
+            start_jingle, end_jingle = AudioSegment.from_wav(start_jingle_path), AudioSegment.from_wav(end_jingle_path)
+
+            # Process audio files and upload results
+            process_audio_files(
+                service=drive_service,
+                folder_id=input_folder_id,
+                start_jingle=start_jingle,
+                end_jingle=end_jingle,
+                start_jingle_path=start_jingle_path,
+                end_jingle_path=end_jingle_path,
+                files=files
+            )
+            print("Audio processing and uploads completed successfully.")
 
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -0,0 +1,75 @@
+import os
+import queue
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Shows that can wait between two stages, 0 turns the pipeline off
+PIPELINE_DEPTH = int(os.getenv("PIPELINE_DEPTH", 1))
+
+# Marks the end of a stage's output
+DONE = object()
+
+def iter_queue(stage_queue):
+    """Yield items from a queue until the stage feeding it is done."""
+    while True:
+        item = stage_queue.get()
+        if item is DONE:
+            return
+        yield item
+
+def run_stage(name, fn, inputs, output, stats, on_error):
+    """Apply fn to every input and pass on the results that aren't None."""
+    for item in inputs:
+        start_time = time.time()
+        try:
+            result = fn(item)
+        except Exception as e:
+            result = None
+            try:
+                on_error(item, name, e)
+            except Exception as report_error:
+                print(f"Error reporting failure in {name} stage: {report_error}")
+        stats["busy"] += time.time() - start_time
+        stats["items"] += 1
+
+        if result is not None and output is not None:
+            output.put(result)
+
+    if output is not None:
+        output.put(DONE)
+
+def run_pipeline(items, stages, depth=PIPELINE_DEPTH, on_error=None):
+    """Run items through a list of (name, fn) stages, each in its own thread.
+
+    Stages are joined by queues holding at most `depth` items, so a slow stage
+    holds back the ones before it instead of letting work pile up. A stage drops
+    an item by returning None or raising, raised errors go to on_error(item,
+    stage_name, error). Logs how busy each stage was once everything is done.
+    """
+    if on_error is None:
+        on_error = lambda item, stage, e: print(f"Error in {stage} stage: {e}")
+
+    start_time = time.time()
+    inputs = iter(items)
+    threads = []
+    stats = {}
+    for index, (name, fn) in enumerate(stages):
+        output = queue.Queue(maxsize=depth) if index < len(stages) - 1 else None
+        stats[name] = {"busy": 0.0, "items": 0}
+        thread = threading.Thread(target=run_stage, args=(name, fn, inputs, output, stats[name], on_error), name=f"pipeline-{name}")
+        thread.start()
+        threads.append(thread)
+        if output is not None:
+            inputs = iter_queue(output)
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = max(time.time() - start_time, 1e-6)
+    for name, stage_stats in stats.items():
+        busy = stage_stats["busy"]
+        per_hour = stage_stats["items"] / busy * 3600 if busy else 0
+        print(f"[Pipeline] {name}: {stage_stats['items']} shows, busy {busy:.2f}s of {elapsed:.2f}s ({busy / elapsed:.0%}), {per_hour:.1f} shows/hour")
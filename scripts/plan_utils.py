@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+from upload_utils import fetch_show_details_from_contentful
+from error_handling import send_error_to_slack
+
+# Shows shorter than this are moved to the backup folder without processing
+MIN_SHOW_LENGTH_MS = 1800000
+
+# Bytes fetched from the start of a file to read its duration from the header
+HEADER_READ_SIZE = 128 * 1024
+
+# Layer III bitrates in kbps by bitrate index, for MPEG-1 and for MPEG-2/2.5
+MP3_BITRATES = {
+    3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Sample rates by MPEG version bits (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5)
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def parse_show_timestamp(name):
+    """Turn a "YYYYMMDD HHMM..." filename into the "YYYYMMDDTHHMM" timestamp of the show."""
+    date_str = name[:8]  # Extract "YYYYMMDD"
+    time_str = name[9:13]  # Extract "HHMM"
+
+    # Convert to datetime object
+    date_time = datetime.strptime(f"{date_str} {time_str}", "%Y%m%d %H%M")
+
+    # Add 15 minutes to the datetime object
+    date_time += timedelta(minutes=15)
+
+    # Format as "YYYYMMDDTHH15"
+    return date_time.strftime("%Y%m%dT%H%M")
+
+def wav_duration_ms(header, file_size):
+    """Return the duration of a WAV file from its first bytes, or None if it can't be read."""
+    if header[:4] not in (b"RIFF", b"RF64") or header[8:12] != b"WAVE":
+        return None
+
+    byte_rate = None
+    offset = 12
+    while offset + 8 <= len(header):
+        chunk_id = header[offset:offset + 4]
+        chunk_size = int.from_bytes(header[offset + 4:offset + 8], "little")
+        if chunk_id == b"fmt " and offset + 20 <= len(header):
+            byte_rate = int.from_bytes(header[offset + 16:offset + 20], "little")
+        elif chunk_id == b"data":
+            if not byte_rate:
+                return None
+            # Streamed and RF64 files don't record the real data size in the chunk
+            data_size = file_size - offset - 8
+            if chunk_size not in (0, 0xFFFFFFFF) and header[:4] == b"RIFF":
+                data_size = min(chunk_size, data_size)
+            return data_size * 1000 // byte_rate
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+def mp3_duration_ms(header, file_size):
+    """Return the duration of an MP3 file from its first bytes, or None if it can't be read.
+
+    Uses the Xing/Info or VBRI frame count when there is one, otherwise assumes a
+    constant bitrate from the first frame.
+    """
+    offset = 0
+    if header[:3] == b"ID3":
+        if len(header) < 10:
+            return None
+        tag_size = 0
+        for byte in header[6:10]:
+            tag_size = (tag_size << 7) | (byte & 0x7F)
+        offset = 10 + tag_size + (10 if header[5] & 0x10 else 0)
+
+    # Find the first frame sync after the tag
+    while offset + 4 <= len(header) and not (header[offset] == 0xFF and header[offset + 1] & 0xE0 == 0xE0):
+        offset += 1
+    if offset + 4 > len(header):
+        return None
+
+    version = (header[offset + 1] >> 3) & 3
+    layer = (header[offset + 1] >> 1) & 3
+    bitrate_index = header[offset + 2] >> 4
+    sample_rate_index = (header[offset + 2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    bitrate = MP3_BITRATES[3 if version == 3 else 2][bitrate_index]
+    samples_per_frame = 1152 if version == 3 else 576
+    mono = (header[offset + 3] >> 6) == 3
+
+    # Side information sits between the frame header and the Xing/Info tag
+    side_info = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+    xing = offset + 4 + side_info
+    if header[xing:xing + 4] in (b"Xing", b"Info") and len(header) >= xing + 12 and header[xing + 7] & 1:
+        frames = int.from_bytes(header[xing + 8:xing + 12], "big")
+        return frames * samples_per_frame * 1000 // sample_rate
+    vbri = offset + 36
+    if header[vbri:vbri + 4] == b"VBRI" and len(header) >= vbri + 18:
+        frames = int.from_bytes(header[vbri + 14:vbri + 18], "big")
+        return frames * samples_per_frame * 1000 // sample_rate
+
+    return (file_size - offset) * 8 // bitrate
+
+def get_audio_duration(service, file):
+    """Get a Drive audio file's duration in ms from its metadata or a ranged read of its header.
+
+    Returns None if the duration can't be worked out, the show is then checked
+    after it has been downloaded instead.
+    """
+    duration = file.get("videoMediaMetadata", {}).get("durationMillis")
+    if duration:
+        return int(duration)
+
+    file_size = int(file.get("size", 0))
+    if not file_size:
+        return None
+
+    try:
+        request = service.files().get_media(fileId=file["id"])
+        request.headers["Range"] = f"bytes=0-{min(HEADER_READ_SIZE, file_size) - 1}"
+        header = request.execute()
+    except Exception as e:
+        print(f"Could not read header of {file['name']}: {e}")
+        return None
+
+    if file["name"].lower().endswith(".wav"):
+        return wav_duration_ms(header, file_size)
+    return mp3_duration_ms(header, file_size)
+
+def plan_shows(service, files):
+    """Decide what to do with each show before anything is downloaded.
+
+    Returns a list of plan entries. Each has an "action" of "process", "short"
+    (move to backup) or "repeat" (delete from Contentful and move to backup).
+    Shows that can't be planned are reported to Slack and left out.
+    """
+    plan = []
+    for file in files:
+        name = file["name"]
+        extension = name.split('.')[-1].lower()
+        if extension not in ('wav', 'mp3'):
+            continue
+
+        try:
+            entry = {
+                "id": file["id"],
+                "name": name,
+                "extension": extension,
+                "size": int(file.get("size", 0)),
+                "md5Checksum": file.get("md5Checksum"),
+                "timestamp": parse_show_timestamp(name),
+                "duration": get_audio_duration(service, file),
+                "metadata": None
+            }
+
+            # If show length is short then don't process
+            if entry["duration"] is not None and entry["duration"] < MIN_SHOW_LENGTH_MS:
+                entry["action"] = "short"
+                plan.append(entry)
+                continue
+
+            # Fetch metadata about show based on timestamp
+            show_metadata = fetch_show_details_from_contentful(entry["timestamp"])
+            if not isinstance(show_metadata, dict):
+                raise ValueError(f"No show found for timestamp {entry['timestamp']}")
+            entry["metadata"] = show_metadata
+
+            # If the show is a repeat then it gets deleted and isn't processed
+            entry["action"] = "repeat" if "(r)" in show_metadata['title'] else "process"
+            plan.append(entry)
+        except Exception as e:
+            error_message = f"Error planning audio {name}: {e}"
+            send_error_to_slack(error_message)
+            print(error_message)
+
+    actions = [entry["action"] for entry in plan]
+    print(f"Planned {actions.count('process')} shows to process, {actions.count('repeat')} repeats and {actions.count('short')} short files")
+    return plan
@@ -0,0 +1,77 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from error_handling import send_error_to_slack
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Number of shows processed at the same time, 1 keeps the original one-by-one loop
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 1))
+# Combined estimated peak memory of the shows being processed at once
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", 4096))
+# Peak memory of a show as a multiple of its decoded PCM size
+PEAK_MEMORY_FACTOR = float(os.getenv("PEAK_MEMORY_FACTOR", 3))
+
+# Format shows are assumed to decode to when estimating their size
+ASSUMED_BYTES_PER_SECOND = 44100 * 2 * 2
+
+def estimate_peak_memory(entry):
+    """Estimate the peak memory in bytes needed to process a planned show.
+
+    Repeats and short files are never downloaded so they cost nothing. Otherwise
+    the decoded size comes from the duration read from the header, or from the
+    file size for a WAV (or an MP3 at roughly 1/8 of its decoded size).
+    """
+    if entry["action"] != "process":
+        return 0
+
+    if entry.get("duration"):
+        pcm_size = entry["duration"] * ASSUMED_BYTES_PER_SECOND // 1000
+    elif entry["extension"] == "wav":
+        pcm_size = entry["size"]
+    else:
+        pcm_size = entry["size"] * 8
+    return int(pcm_size * PEAK_MEMORY_FACTOR)
+
+def run_in_pool(entries, worker, initializer, initargs, processes=WORKER_PROCESSES, budget_mb=MEMORY_BUDGET_MB, stop_event=None):
+    """Run worker(entry) for every entry in a process pool under a memory budget.
+
+    A show is only started when its estimated peak memory fits in the budget
+    alongside the shows already running. A show larger than the whole budget
+    is run on its own. The worker is responsible for handling its own errors.
+    Once stop_event is set no more shows are started and the running ones are
+    finished.
+    """
+    budget = budget_mb * 1024 ** 2
+    pending = list(entries)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=initializer, initargs=initargs) as executor:
+        while pending or running:
+            if pending and stop_event is not None and stop_event.is_set():
+                print(f"Stopping before the remaining {len(pending)} shows, they will be picked up by the next run.")
+                pending = []
+                if not running:
+                    break
+
+            # Admit the first pending shows that fit in what is left of the budget
+            in_use = sum(estimate for estimate, _ in running.values())
+            for entry in list(pending):
+                if len(running) >= processes:
+                    break
+                estimate = estimate_peak_memory(entry)
+                if running and in_use + estimate > budget:
+                    continue
+                pending.remove(entry)
+                running[executor.submit(worker, entry)] = (estimate, entry)
+                in_use += estimate
+                print(f"Started {entry['name']} (estimated {estimate / 1024 ** 2:.0f} MB, {in_use / 1024 ** 2:.0f}/{budget_mb} MB in use)")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                _, entry = running.pop(future)
+                # Report anything the worker didn't handle itself, e.g. a crashed process
+                if future.exception():
+                    error_message = f"Worker failed processing audio {entry['name']}: {future.exception()}"
+                    send_error_to_slack(error_message)
+                    print(error_message)
@@ -0,0 +1,228 @@
+import os
+import subprocess
+import tempfile
+from pydub.utils import get_encoder_name
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Length of the crossfades between the jingles and the show
+START_CROSSFADE_MS = 5800
+END_CROSSFADE_MS = 7200
+
+# "pydub" decodes and edits the show in Python, "ffmpeg" renders it in one ffmpeg filtergraph
+RENDER_ENGINE = os.getenv("RENDER_ENGINE", "pydub")
+
+# Bitrate of the encoded MP3
+RENDER_BITRATE = "192k"
+
+# Format every input is converted to before trimming and crossfading
+RENDER_SAMPLE_RATE = int(os.getenv("RENDER_SAMPLE_RATE", 44100))
+RENDER_CHANNEL_LAYOUT = os.getenv("RENDER_CHANNEL_LAYOUT", "stereo")
+CHANNEL_COUNTS = {"mono": 1, "stereo": 2}
+
+# Formats a rendition can be encoded in, as file suffix, ffmpeg codec and MIME type
+RENDITION_FORMATS = {
+    "mp3": (".mp3", "libmp3lame", "audio/mpeg"),
+    "flac": (".flac", "flac", "audio/flac"),
+    "opus": (".opus", "libopus", "audio/ogg"),
+    "ogg": (".ogg", "libvorbis", "audio/ogg"),
+    "m4a": (".m4a", "aac", "audio/mp4")
+}
+# Name of the MP3 at RENDER_BITRATE that every render produces, it goes to SoundCloud
+MAIN_RENDITION = "main"
+# ffmpeg's raw PCM format for each sample width in bytes
+PCM_FORMATS = {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}
+# Bytes of PCM passed to the encoders at a time
+RENDITION_BLOCK_SIZE = 1024 * 1024
+
+def parse_renditions(spec):
+    """Parse renditions given as "name=format[:bitrate],..." into {name: (format, bitrate)}."""
+    renditions = {}
+    for item in filter(None, (item.strip() for item in spec.split(","))):
+        name, _, audio_format = item.partition("=")
+        audio_format, _, bitrate = audio_format.partition(":")
+        if name == MAIN_RENDITION or audio_format not in RENDITION_FORMATS:
+            raise ValueError(f"Invalid rendition {item}, it needs a name other than {MAIN_RENDITION} and one of the formats {', '.join(RENDITION_FORMATS)}")
+        renditions[name] = (audio_format, bitrate or None)
+    return renditions
+
+# Extra renditions encoded from the same render as the main MP3, e.g. "contentful=mp3:128k,drive=flac".
+# "contentful" is uploaded to the archive instead of the main MP3 and "drive" is backed up to Drive.
+RENDER_RENDITIONS = parse_renditions(os.getenv("RENDER_RENDITIONS", ""))
+
+class RenditionEncoders:
+    """Encode the same PCM to several renditions at once, one ffmpeg process each.
+
+    The encoders are started on the first write and every block written goes to
+    all of them, so they encode in parallel and the PCM is only produced once.
+    """
+
+    def __init__(self, renditions, sample_rate, channels, sample_width=2):
+        self.renditions = renditions
+        self.input_format = ["-f", PCM_FORMATS[sample_width], "-ar", str(sample_rate), "-ac", str(channels)]
+        self.encoders = {}
+
+    def start(self):
+        for name, (audio_format, bitrate) in self.renditions.items():
+            suffix, codec, _ = RENDITION_FORMATS[audio_format]
+            output = tempfile.NamedTemporaryFile(suffix=suffix, dir=os.getenv("DOWNLOAD_DIR") or None)
+            command = [
+                get_encoder_name(), "-y", "-hide_banner", "-loglevel", "error",
+                *self.input_format, "-i", "pipe:0",
+                "-c:a", codec
+            ]
+            if bitrate:
+                command += ["-b:a", bitrate]
+            command.append(output.name)
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            self.encoders[name] = (process, output)
+
+    def write(self, data):
+        if not self.encoders:
+            self.start()
+        for name, (process, _) in self.encoders.items():
+            try:
+                process.stdin.write(data)
+            except BrokenPipeError:
+                raise RuntimeError(f"Encoding the {name} rendition failed: {process.stderr.read().decode(errors='replace')}")
+
+    def finish(self):
+        """Wait for every encoder and return {name: open temporary file}, removed when closed."""
+        if not self.encoders:
+            self.start()
+        try:
+            for process, _ in self.encoders.values():
+                process.stdin.close()
+            for name, (process, output) in self.encoders.items():
+                stderr = process.stderr.read()
+                if process.wait() != 0:
+                    raise RuntimeError(f"Encoding the {name} rendition failed: {stderr.decode(errors='replace')}")
+        except Exception:
+            self.abort()
+            raise
+        outputs = {name: output for name, (_, output) in self.encoders.items()}
+        for output in outputs.values():
+            output.seek(0)
+        return outputs
+
+    def abort(self):
+        for process, output in self.encoders.values():
+            process.kill()
+            process.wait()
+            output.close()
+        self.encoders = {}
+
+class TeeReader:
+    """Read from a stream, writing everything read to a sink as well."""
+
+    def __init__(self, source, sink):
+        self.source = source
+        self.sink = sink
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        if data:
+            self.sink.write(data)
+        return data
+
+def kept_ranges(silent_ranges):
+    """Turn a flattened list of silent [start, end, ...] ms into the ranges to keep.
+
+    The last range has an end of None, meaning until the end of the show.
+    """
+    ranges = []
+    start = 0
+    for i in range(0, len(silent_ranges), 2):
+        if silent_ranges[i] > start:
+            ranges.append((start, silent_ranges[i]))
+        start = silent_ranges[i + 1]
+    ranges.append((start, None))
+    return ranges
+
+def build_filtergraph(silent_ranges, start_crossfade_ms=START_CROSSFADE_MS, end_crossfade_ms=END_CROSSFADE_MS):
+    """Build the filtergraph that trims silences from input 0 and crossfades in the jingles.
+
+    Input 1 is the start jingle and input 2 the end jingle. The show is split once
+    and each kept range is trimmed sample accurately, then the ranges are joined
+    and blended with the jingles the same way the pydub path overlays its fades.
+    """
+    audio_format = f"aformat=sample_fmts=fltp:sample_rates={RENDER_SAMPLE_RATE}:channel_layouts={RENDER_CHANNEL_LAYOUT}"
+    ranges = kept_ranges(silent_ranges)
+
+    filters = [f"[0:a]{audio_format},asplit={len(ranges)}" + "".join(f"[in{i}]" for i in range(len(ranges)))]
+    for i, (start, end) in enumerate(ranges):
+        trim = f"start={start / 1000}" + (f":end={end / 1000}" if end is not None else "")
+        filters.append(f"[in{i}]atrim={trim},asetpts=PTS-STARTPTS[keep{i}]")
+    filters.append("".join(f"[keep{i}]" for i in range(len(ranges))) + f"concat=n={len(ranges)}:v=0:a=1[show]")
+
+    filters.append(f"[1:a]{audio_format}[start_jingle]")
+    filters.append(f"[2:a]{audio_format}[end_jingle]")
+    filters.append(f"[start_jingle][show]acrossfade=d={start_crossfade_ms / 1000}:c1=tri:c2=tri[opened]")
+    filters.append(f"[opened][end_jingle]acrossfade=d={end_crossfade_ms / 1000}:c1=tri:c2=tri[out]")
+    return ";".join(filters)
+
+def render_show_ffmpeg(show_path, silent_ranges, start_jingle_path, end_jingle_path, bitrate=RENDER_BITRATE):
+    """Trim, crossfade and encode a show to MP3 in a single ffmpeg pass.
+
+    The show is streamed from disk by ffmpeg so its PCM is never held in Python.
+    Returns an open temporary file with the MP3, which is removed when closed.
+    """
+    output = tempfile.NamedTemporaryFile(suffix=".mp3", dir=os.getenv("DOWNLOAD_DIR") or None)
+    command = [
+        get_encoder_name(), "-y", "-hide_banner", "-loglevel", "error",
+        "-i", show_path,
+        "-i", start_jingle_path,
+        "-i", end_jingle_path,
+        "-filter_complex", build_filtergraph(silent_ranges),
+        "-map", "[out]",
+        "-c:a", "libmp3lame", "-b:a", bitrate,
+        "-f", "mp3", output.name
+    ]
+
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        output.close()
+        raise RuntimeError(f"ffmpeg render failed: {result.stderr.decode(errors='replace')}")
+
+    output.seek(0)
+    return output
+
+def render_renditions_ffmpeg(show_path, silent_ranges, start_jingle_path, end_jingle_path, renditions):
+    """Trim and crossfade a show once in ffmpeg and encode the result to every rendition in parallel.
+
+    Returns {name: open temporary file} for each of renditions.
+    """
+    command = [
+        get_encoder_name(), "-hide_banner", "-loglevel", "error",
+        "-i", show_path,
+        "-i", start_jingle_path,
+        "-i", end_jingle_path,
+        "-filter_complex", build_filtergraph(silent_ranges),
+        "-map", "[out]",
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "pipe:1"
+    ]
+    render = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    encoders = RenditionEncoders(renditions, RENDER_SAMPLE_RATE, CHANNEL_COUNTS[RENDER_CHANNEL_LAYOUT])
+    try:
+        for block in iter(lambda: render.stdout.read(RENDITION_BLOCK_SIZE), b""):
+            encoders.write(block)
+        stderr = render.stderr.read()
+        if render.wait() != 0:
+            raise RuntimeError(f"ffmpeg render failed: {stderr.decode(errors='replace')}")
+        return encoders.finish()
+    except Exception:
+        render.kill()
+        render.wait()
+        encoders.abort()
+        raise
+
+def export_temp_wav(audio_segment):
+    """Write an AudioSegment to a temporary WAV file and return its path."""
+    output = tempfile.NamedTemporaryFile(suffix=".wav", dir=os.getenv("DOWNLOAD_DIR") or None, delete=False)
+    try:
+        audio_segment.export(output, format="wav")
+    finally:
+        output.close()
+    return output.name
@@ -0,0 +1,99 @@
+import numpy as np
+from pydub.utils import db_to_float
+
+# Number of frames squared and summed at a time, keeps the float64 working
+# copy small no matter how long the show is.
+BLOCK_FRAMES = 2 ** 20
+
+SAMPLE_TYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+def cumulative_energy(samples, channels, boundaries, block_frames=BLOCK_FRAMES):
+    """Return the sum of squared samples before each frame index in boundaries.
+
+    `samples` is the interleaved sample array and `boundaries` a sorted array of
+    frame indices. Only one block of samples is converted to float at a time.
+    """
+    n_frames = len(samples) // channels
+    energies = np.zeros(len(boundaries), dtype=np.float64)
+    total = 0.0
+    for start in range(0, n_frames, block_frames):
+        stop = min(start + block_frames, n_frames)
+        block = samples[start * channels:stop * channels].astype(np.float64)
+        frame_energy = np.square(block).reshape(-1, channels).sum(axis=1)
+        cumulative = np.cumsum(frame_energy)
+        cumulative += total
+
+        # Boundaries in (start, stop] are the cumulative sum of every frame before them
+        lo = np.searchsorted(boundaries, start, side='right')
+        hi = np.searchsorted(boundaries, stop, side='right')
+        energies[lo:hi] = cumulative[boundaries[lo:hi] - start - 1]
+        total = cumulative[-1]
+
+    # Boundaries past the end of the audio (padded with silence by pydub) get the total
+    energies[boundaries > n_frames] = total
+    return energies
+
+def group_silence_starts(silence_starts, min_silence_len, seek_step):
+    """Merge window start positions into [start, end] ranges the same way pydub does."""
+    if len(silence_starts) == 0:
+        return []
+
+    silent_ranges = []
+    prev_i = silence_starts[0]
+    current_range_start = prev_i
+    for silence_start_i in silence_starts[1:]:
+        continuous = (silence_start_i == prev_i + seek_step)
+        silence_has_gap = silence_start_i > (prev_i + min_silence_len)
+        if not continuous and silence_has_gap:
+            silent_ranges.append([current_range_start, prev_i + min_silence_len])
+            current_range_start = silence_start_i
+        prev_i = silence_start_i
+    silent_ranges.append([current_range_start, prev_i + min_silence_len])
+    return silent_ranges
+
+def detect_silence(audio_segment, min_silence_len=1000, silence_thresh=-16, seek_step=1):
+    """Drop-in replacement for pydub's silence.detect_silence.
+
+    Instead of computing the RMS of every window separately, the squared samples
+    are summed once into a cumulative table and each window's energy is the
+    difference of two lookups. Returns the same list of [start, end] ranges in ms.
+    """
+    seg_len = len(audio_segment)
+
+    # You can't have a silent portion of a sound that is longer than the sound
+    if seg_len < min_silence_len:
+        return []
+
+    # Convert silence threshold to a float value (so we can compare it to rms)
+    silence_thresh = db_to_float(silence_thresh) * audio_segment.max_possible_amplitude
+
+    # Window start positions, including the final window when it is not on a step
+    last_slice_start = seg_len - min_silence_len
+    slice_starts = np.arange(0, last_slice_start + 1, seek_step, dtype=np.int64)
+    if last_slice_start % seek_step:
+        slice_starts = np.append(slice_starts, last_slice_start)
+
+    # Convert window positions in ms to frame indices exactly as AudioSegment slicing does
+    frames_per_ms = audio_segment.frame_rate / 1000.0
+    slice_ends = np.minimum(slice_starts + min_silence_len, seg_len)
+    start_frames = (slice_starts * frames_per_ms).astype(np.int64)
+    end_frames = (slice_ends * frames_per_ms).astype(np.int64)
+
+    channels = audio_segment.channels
+    samples = np.frombuffer(audio_segment.raw_data, dtype=SAMPLE_TYPES[audio_segment.sample_width])
+    boundaries = np.unique(np.concatenate((start_frames, end_frames)))
+    energies = cumulative_energy(samples, channels, boundaries)
+
+    window_energy = (
+        energies[np.searchsorted(boundaries, end_frames)] -
+        energies[np.searchsorted(boundaries, start_frames)]
+    )
+    window_samples = (end_frames - start_frames) * channels
+
+    # audioop.rms truncates to an integer, do the same so results match exactly
+    rms = np.zeros(len(slice_starts), dtype=np.float64)
+    np.divide(np.maximum(window_energy, 0), window_samples, out=rms, where=window_samples > 0)
+    rms = np.floor(np.sqrt(rms))
+
+    silence_starts = slice_starts[rms <= silence_thresh].tolist()
+    return group_silence_starts(silence_starts, min_silence_len, seek_step)
@@ -0,0 +1,492 @@
+import mmap
+import os
+import subprocess
+import tempfile
+import wave
+from array import array
+from pydub.utils import get_encoder_name
+from dotenv import load_dotenv
+from render_utils import RENDER_SAMPLE_RATE, RENDER_CHANNEL_LAYOUT, START_CROSSFADE_MS, END_CROSSFADE_MS, RENDER_BITRATE, TeeReader, kept_ranges, build_filtergraph
+
+load_dotenv()
+
+# Copy the untouched middle of MP3 shows frame by frame, only re-encoding around the crossfades and cuts
+MP3_STITCH = os.getenv("RENDER_MP3_STITCH", "").lower() in ("1", "true", "yes")
+# Stretches shorter than this many frames (about 26 ms each) are re-encoded rather than copied
+MIN_COPY_FRAMES = int(os.getenv("MIN_COPY_FRAMES", 200))
+
+# Samples in an MPEG-1 Layer III frame
+FRAME_SAMPLES = 1152
+# LAME's encoder delay plus the decoder's filterbank delay, the offset between the PCM fed in and the PCM decoded
+CODEC_DELAY = 576 + 529
+# Samples of the previous copy fed in before an encoded stretch, so that its first frame can be dropped
+PRE_ROLL = FRAME_SAMPLES - CODEC_DELAY
+# Bitrates in kbps by header index for MPEG-1 Layer III, index 0 is free format and isn't supported
+BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+SAMPLE_RATES = (44100, 48000, 32000)
+# Bits of side info describing each granule of each channel
+GRANULE_INFO_BITS = 59
+# Encoders whose tag holds an encoder delay ffmpeg skips when decoding
+DELAY_TAG_ENCODERS = (b"LAME", b"Lavf", b"Lavc")
+# Bytes per sample frame of the 16 bit stereo PCM read from and written to ffmpeg
+PCM_FRAME_BYTES = 4
+# Sample frames moved between ffmpeg processes at a time
+PCM_CHUNK_FRAMES = 64 * 1024
+# Bitrate of the Info frame in front of a stitched MP3, the smallest frame with room for the tag
+INFO_FRAME_BITRATE = 128
+# Decoders skip the encoder delay written in the tag plus their own filterbank delay
+DECODER_DELAY = 529
+# Largest delay or padding the 12 bit fields of the tag can hold
+MAX_TAG_DELAY = 4095
+
+def frame_size(bitrate_index, sample_rate, padding):
+    return 144000 * BITRATES[bitrate_index] // sample_rate + padding
+
+def parse_header(buffer, offset):
+    """Return (size, sample_rate, channels, side_info_offset, side_info_length) of the frame at offset, or None."""
+    if offset + 4 > len(buffer):
+        return None
+    header = int.from_bytes(buffer[offset:offset + 4], "big")
+    # Only MPEG-1 Layer III frames with a valid bitrate and sample rate are accepted
+    if header >> 21 != 0x7FF or (header >> 19) & 3 != 3 or (header >> 17) & 3 != 1:
+        return None
+    bitrate_index = (header >> 12) & 0xF
+    sample_rate_index = (header >> 10) & 3
+    if bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    sample_rate = SAMPLE_RATES[sample_rate_index]
+    channels = 1 if (header >> 6) & 3 == 3 else 2
+    has_crc = not (header >> 16) & 1
+    side_info_offset = offset + 4 + (2 if has_crc else 0)
+    return (
+        frame_size(bitrate_index, sample_rate, (header >> 9) & 1),
+        sample_rate,
+        channels,
+        side_info_offset,
+        17 if channels == 1 else 32
+    )
+
+def read_bits(buffer, bit_offset, count):
+    value = 0
+    for i in range(bit_offset, bit_offset + count):
+        value = (value << 1) | ((buffer[i // 8] >> (7 - i % 8)) & 1)
+    return value
+
+def main_data_begin(buffer, side_info_offset):
+    # The first 9 bits of the side info count back into earlier frames' data, the bit reservoir
+    return read_bits(buffer, side_info_offset * 8, 9)
+
+def uses_reservoir(frame):
+    return main_data_begin(frame, parse_header(frame, 0)[3]) != 0
+
+def main_data_bits(buffer, side_info_offset, channels):
+    """Return how many bits of main data a frame uses itself."""
+    start = side_info_offset * 8 + 9 + (5 if channels == 1 else 3) + 4 * channels
+    return sum(
+        read_bits(buffer, start + i * GRANULE_INFO_BITS, 12)
+        for i in range(2 * channels)
+    )
+
+def skip_id3v2(buffer):
+    if buffer[:3] != b"ID3" or len(buffer) < 10:
+        return 0
+    # The tag size is stored as four 7 bit bytes and excludes the 10 byte header
+    size = 0
+    for byte in buffer[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    return 10 + size + (10 if buffer[5] & 0x10 else 0)
+
+def scan_frames(buffer):
+    """Index the frames of an MP3.
+
+    Returns a dict with the sample rate and channels, arrays of each audio
+    frame's offset and main_data_begin, the offset after the last frame, and the
+    samples ffmpeg skips at the start when decoding, or None if the file has
+    anything but consistent MPEG-1 Layer III frames.
+    """
+    offset = skip_id3v2(buffer)
+    offsets = array("q")
+    reservoirs = array("H")
+    sample_rate = channels = None
+    skip = 0
+
+    while True:
+        frame = parse_header(buffer, offset)
+        if frame is None or offset + frame[0] > len(buffer):
+            break
+        size, frame_rate, frame_channels, side_info_offset, side_info_length = frame
+        if sample_rate is None:
+            sample_rate, channels = frame_rate, frame_channels
+            # A Xing or Info frame in front of the audio holds the encoder's tag rather than audio
+            tag_offset = side_info_offset + side_info_length
+            if bytes(buffer[tag_offset:tag_offset + 4]) in (b"Xing", b"Info"):
+                flags = int.from_bytes(buffer[tag_offset + 4:tag_offset + 8], "big")
+                encoder_offset = tag_offset + 8 + 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4) + 4 * bool(flags & 8)
+                if bytes(buffer[encoder_offset:encoder_offset + 4]) in DELAY_TAG_ENCODERS:
+                    delay = int.from_bytes(buffer[encoder_offset + 21:encoder_offset + 24], "big") >> 12
+                    skip = delay + DECODER_DELAY
+                offset += size
+                continue
+        elif (frame_rate, frame_channels) != (sample_rate, channels):
+            return None
+        offsets.append(offset)
+        reservoirs.append(main_data_begin(buffer, side_info_offset))
+        offset += size
+
+    # Anything after the frames has to be a tag or a cut off last frame, which is left out
+    trailing = bytes(buffer[offset:offset + 8])
+    if not offsets or (trailing and parse_header(buffer, offset) is None and not trailing.startswith((b"TAG", b"APETAGEX", b"LYRICS"))):
+        return None
+
+    return {
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "offsets": offsets,
+        "reservoirs": reservoirs,
+        "end": offset,
+        "skip": skip
+    }
+
+def reservoir_bytes(buffer, frames, frame_index):
+    """Return the bytes of earlier frames that a frame's main_data_begin points back to."""
+    needed = frames["reservoirs"][frame_index]
+    parts = []
+    i = frame_index - 1
+    while needed > 0 and i >= 0:
+        offset = frames["offsets"][i]
+        size, _, _, side_info_offset, side_info_length = parse_header(buffer, offset)
+        data = bytes(buffer[side_info_offset + side_info_length:offset + size])
+        parts.insert(0, data[-needed:])
+        needed -= len(data[-needed:])
+        i -= 1
+    if needed > 0:
+        raise ValueError(f"Frame {frame_index} points back past the start of the file")
+    return b"".join(parts)
+
+def carry_reservoir(frame, reservoir):
+    """Grow a frame that doesn't use the bit reservoir so the next frame's reservoir bytes fit at its end.
+
+    Only the bitrate and padding bits of the header change, the side info and
+    the frame's own main data are kept as they are.
+    """
+    if not reservoir:
+        return frame
+    size, sample_rate, channels, side_info_offset, side_info_length = parse_header(frame, 0)
+    if side_info_offset != 4:
+        raise ValueError("Can't resize a frame protected by a CRC")
+    if main_data_begin(frame, side_info_offset) != 0:
+        raise ValueError("The frame before a copied stretch uses the bit reservoir")
+
+    used = side_info_offset + side_info_length + (main_data_bits(frame, side_info_offset, channels) + 7) // 8
+    header = int.from_bytes(frame[:4], "big")
+    for bitrate_index in range((header >> 12) & 0xF, len(BITRATES)):
+        for padding in (0, 1):
+            new_size = frame_size(bitrate_index, sample_rate, padding)
+            if new_size >= used + len(reservoir):
+                header = (header & ~(0xF << 12) & ~(1 << 9)) | (bitrate_index << 12) | (padding << 9)
+                return header.to_bytes(4, "big") + frame[4:used] + bytes(new_size - used - len(reservoir)) + reservoir
+    raise ValueError(f"{len(reservoir)} reservoir bytes don't fit in the largest frame")
+
+def crc16(data):
+    # The CRC-16 LAME protects its tag with, polynomial 0x8005 processed least significant bit first
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+def info_frame(frame_count, file_size, start_pad, end_pad):
+    """Build the silent Xing "Info" frame with a LAME tag that goes in front of a stitched MP3.
+
+    frame_count and file_size cover the audio frames after it and the whole file.
+    Decoders skip start_pad samples plus their own delay at the start and drop
+    end_pad samples at the end, the same way they do for a file LAME encoded.
+    """
+    if not 0 <= start_pad <= MAX_TAG_DELAY or not 0 <= end_pad <= MAX_TAG_DELAY:
+        raise RuntimeError(f"Can't tag a stitched MP3 with a delay of {start_pad} and padding of {end_pad} samples")
+    bitrate_index = BITRATES.index(INFO_FRAME_BITRATE)
+    size = frame_size(bitrate_index, RENDER_SAMPLE_RATE, 0)
+    # MPEG-1 Layer III without a CRC, stereo, at the render's sample rate
+    header = 0xFFFB0000 | (bitrate_index << 12) | (SAMPLE_RATES.index(RENDER_SAMPLE_RATE) << 10)
+
+    tag = bytearray(header.to_bytes(4, "big") + bytes(32))
+    tag += b"Info" + (1 | 2).to_bytes(4, "big") + frame_count.to_bytes(4, "big") + file_size.to_bytes(4, "big")
+    # Version, tag revision 0 with CBR, then lowpass, replay gain, flags and bitrate left empty
+    tag += b"LAME3.100" + bytes([1]) + bytes(1 + 4 + 2 + 2 + 1) + bytes([min(INFO_FRAME_BITRATE, 255)])
+    tag += ((start_pad << 12) | end_pad).to_bytes(3, "big")
+    # Misc, gain and preset, then the length of the music and its CRC, which isn't computed
+    tag += bytes(1 + 1 + 2) + file_size.to_bytes(4, "big") + bytes(2)
+    tag += crc16(tag).to_bytes(2, "big")
+    return bytes(tag) + bytes(size - len(tag))
+
+class ByteCounter:
+    """A sink that only counts the bytes written to it."""
+
+    def __init__(self):
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+
+def max_carried_reservoir(bitrate):
+    # The most reservoir bytes guaranteed to fit when a frame at this bitrate is grown to 320k
+    kbps = int(bitrate.rstrip("k"))
+    own_size = 144000 * kbps // RENDER_SAMPLE_RATE + 1
+    return frame_size(len(BITRATES) - 1, RENDER_SAMPLE_RATE, 1) - own_size
+
+def wav_frames(path):
+    with wave.open(path, "rb") as wav_file:
+        return wav_file.getnframes(), wav_file.getframerate()
+
+def ms_to_samples(ms):
+    return round(ms * RENDER_SAMPLE_RATE / 1000)
+
+def plan_copies(frames, silent_ranges, show_frames, start_jingle_frames, bitrate):
+    """Choose the stretches of source frames to copy as they are.
+
+    Each kept range of the show can have one copied stretch, outside the
+    crossfades and starting on a frame whose reservoir can be carried across
+    the join. Returns (rendered_start, rendered_end, first_frame, end_frame)
+    for each stretch, with positions in samples of the fully rendered show.
+    """
+    start_crossfade = ms_to_samples(START_CROSSFADE_MS)
+    end_crossfade = ms_to_samples(END_CROSSFADE_MS)
+    ranges = [
+        (ms_to_samples(start), show_frames if end is None else min(ms_to_samples(end), show_frames))
+        for start, end in kept_ranges(silent_ranges)
+    ]
+    show_length = sum(max(0, end - start) for start, end in ranges)
+    # Where show sample 0 lands once the start jingle has been crossfaded in
+    show_offset = start_jingle_frames - start_crossfade
+    max_reservoir = max_carried_reservoir(bitrate)
+    skip = frames["skip"]
+    frame_count = len(frames["offsets"])
+
+    copies = []
+    position = 0
+    for start, end in ranges:
+        length = max(0, end - start)
+        # The part of this range outside both crossfades, in show samples
+        low = max(position, start_crossfade)
+        high = min(position + length, show_length - end_crossfade)
+        first = -(-(start + low - position + skip) // FRAME_SAMPLES)
+        last = min((start + high - position + skip) // FRAME_SAMPLES, frame_count)
+        # Where the start of source frame 0 would land in the rendered show
+        frame_offset = show_offset + position - skip - start
+        position += length
+
+        # The stretch encoded between two copies needs a whole frame left after its samples are dropped
+        if copies:
+            first = max(first, -(-(copies[-1][1] + 2 * FRAME_SAMPLES - frame_offset) // FRAME_SAMPLES))
+        while first < last and frames["reservoirs"][first] > max_reservoir:
+            first += 1
+        if last - first < MIN_COPY_FRAMES:
+            continue
+
+        copies.append((frame_offset + first * FRAME_SAMPLES, frame_offset + last * FRAME_SAMPLES, first, last))
+    return copies
+
+def cut_positions(silent_ranges, show_frames, start_jingle_frames):
+    # Where each cut between two kept ranges lands in the rendered show
+    position = start_jingle_frames - ms_to_samples(START_CROSSFADE_MS)
+    cuts = []
+    for start, end in kept_ranges(silent_ranges)[:-1]:
+        position += max(0, min(ms_to_samples(end), show_frames) - ms_to_samples(start))
+        cuts.append(position)
+    return cuts
+
+def pipe_pcm(source, destination, frames, tail=PRE_ROLL):
+    """Move frames of PCM from source to destination, or discard them if destination is None.
+
+    frames=None moves everything left in source. Returns the last tail frames
+    moved, the pre-roll of the next encoded stretch.
+    """
+    last = b""
+    remaining = None if frames is None else frames * PCM_FRAME_BYTES
+    while remaining != 0:
+        size = PCM_CHUNK_FRAMES * PCM_FRAME_BYTES if remaining is None else min(remaining, PCM_CHUNK_FRAMES * PCM_FRAME_BYTES)
+        data = source.read(size)
+        if not data:
+            if remaining is None:
+                break
+            raise RuntimeError("The rendered show ended early")
+        if destination is not None:
+            destination.write(data)
+        last = (last + data)[-tail * PCM_FRAME_BYTES:]
+        if remaining is not None:
+            remaining -= len(data)
+    return last
+
+def encode_frames(pcm_parts, source, bitrate):
+    """Encode PCM to MP3 without the bit reservoir and return the frames as a list of bytes.
+
+    pcm_parts is a list of bytes to encode or (frames, keep) pairs, which are
+    read from source and either encoded or dropped.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".mp3", dir=os.getenv("DOWNLOAD_DIR") or None) as encoded:
+        command = [
+            get_encoder_name(), "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "s16le", "-ar", str(RENDER_SAMPLE_RATE), "-ac", "2", "-i", "pipe:0",
+            "-c:a", "libmp3lame", "-b:a", bitrate, "-reservoir", "0",
+            "-write_xing", "0", "-id3v2_version", "0",
+            "-f", "mp3", encoded.name
+        ]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            for part in pcm_parts:
+                if isinstance(part, bytes):
+                    process.stdin.write(part)
+                else:
+                    frames, keep = part
+                    pipe_pcm(source, process.stdin if keep else None, frames)
+            process.stdin.close()
+        except Exception:
+            process.kill()
+            process.wait()
+            raise
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg encode failed: {stderr.decode(errors='replace')}")
+        data = encoded.read()
+
+    frames = scan_frames(data)
+    if frames is None:
+        raise RuntimeError("ffmpeg wrote frames that can't be stitched")
+    ends = list(frames["offsets"][1:]) + [frames["end"]]
+    return [data[start:end] for start, end in zip(frames["offsets"], ends)]
+
+def render_show_stitched(show_path, silent_ranges, start_jingle_path, end_jingle_path, show_frames, show_sample_rate, bitrate=RENDER_BITRATE, pcm_sink=None):
+    """Render an MP3 show by copying most of its frames and only re-encoding around the joins.
+
+    The show is rendered to PCM by the same filtergraph as render_show_ffmpeg,
+    but only the stretches around the crossfades and cuts are encoded. The rest
+    is copied from the source frame by frame. Encoded stretches don't use the bit
+    reservoir, and the frame before each copied stretch is grown to carry the
+    reservoir bytes its first frame points back to. Cuts can move by up to one
+    frame so the copied frames stay aligned. An Info frame in front tells
+    decoders the delay and padding to drop, so the stitched show decodes to the
+    same samples as the full render.
+
+    Every block of the rendered PCM is also written to pcm_sink if one is given,
+    so other renditions can be encoded from the same render.
+
+    Returns an open temporary file with the MP3, or None if the show can't be
+    stitched, in which case it should be rendered in full.
+    """
+    if show_sample_rate != RENDER_SAMPLE_RATE or RENDER_CHANNEL_LAYOUT != "stereo":
+        return None
+    start_jingle_frames, start_jingle_rate = wav_frames(start_jingle_path)
+    end_jingle_frames, end_jingle_rate = wav_frames(end_jingle_path)
+    if (start_jingle_rate, end_jingle_rate) != (RENDER_SAMPLE_RATE, RENDER_SAMPLE_RATE):
+        return None
+    if start_jingle_frames < ms_to_samples(START_CROSSFADE_MS) or end_jingle_frames < ms_to_samples(END_CROSSFADE_MS):
+        return None
+
+    with open(show_path, "rb") as source_file, mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ) as source:
+        frames = scan_frames(source)
+        if frames is None or frames["sample_rate"] != RENDER_SAMPLE_RATE or frames["channels"] != 2:
+            return None
+        # The frame index has to line up with what ffmpeg decodes, give or take the end padding
+        if abs(len(frames["offsets"]) * FRAME_SAMPLES - frames["skip"] - show_frames) > 3 * FRAME_SAMPLES:
+            return None
+
+        copies = plan_copies(frames, silent_ranges, show_frames, start_jingle_frames, bitrate)
+        if not copies:
+            return None
+
+        cuts = cut_positions(silent_ranges, show_frames, start_jingle_frames)
+        output = tempfile.NamedTemporaryFile(suffix=".mp3", dir=os.getenv("DOWNLOAD_DIR") or None)
+        command = [
+            get_encoder_name(), "-hide_banner", "-loglevel", "error",
+            "-i", show_path,
+            "-i", start_jingle_path,
+            "-i", end_jingle_path,
+            "-filter_complex", build_filtergraph(silent_ranges),
+            "-map", "[out]",
+            "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(RENDER_SAMPLE_RATE), "-ac", "2",
+            "pipe:1"
+        ]
+        render = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        rendered = ByteCounter()
+        pcm = TeeReader(render.stdout, rendered)
+        if pcm_sink is not None:
+            pcm = TeeReader(pcm, pcm_sink)
+        try:
+            # Room for the Info frame, which is written once the length is known
+            output.write(bytes(frame_size(BITRATES.index(INFO_FRAME_BITRATE), RENDER_SAMPLE_RATE, 0)))
+            copied_frames = encoded_frames = 0
+            dropped = 0
+            position = 0
+            pre_roll = None
+            for rendered_start, rendered_end, first, last in copies + [(None, None, None, None)]:
+                if pre_roll is None:
+                    # Pad the start with silence so the encoded frames end exactly where the copy begins,
+                    # decoders skip the padding and the codec delay in front of it
+                    padding = -(rendered_start + CODEC_DELAY) % FRAME_SAMPLES
+                    start_pad = padding + CODEC_DELAY - DECODER_DELAY
+                    parts = [bytes(padding * PCM_FRAME_BYTES), (rendered_start, True)]
+                    keep = (padding + rendered_start + CODEC_DELAY) // FRAME_SAMPLES
+                    encoded = encode_frames(parts, pcm, bitrate)[:keep]
+                elif rendered_start is None:
+                    # The end is encoded up to wherever the render finishes
+                    keep = None
+                    encoded = encode_frames([pre_roll, (None, True)], pcm, bitrate)[1:]
+                else:
+                    # Drop the samples that don't make a whole frame, next to the first cut where the show is quietest
+                    length = rendered_start - position
+                    extra = length % FRAME_SAMPLES
+                    cut = next((cut for cut in cuts if position <= cut <= rendered_start), None)
+                    if cut is None and extra:
+                        raise RuntimeError("Copied stretches in the same range don't line up")
+                    drop_start = max(position, (position if cut is None else cut) - extra)
+                    parts = [
+                        pre_roll,
+                        (drop_start - position, True),
+                        (extra, False),
+                        (rendered_start - drop_start - extra, True)
+                    ]
+                    keep = length // FRAME_SAMPLES
+                    dropped += extra
+                    # The first frame only holds the encoder's delay and the pre-roll
+                    encoded = encode_frames(parts, pcm, bitrate)[1:1 + keep]
+
+                if keep is not None and len(encoded) != keep:
+                    raise RuntimeError(f"Expected {keep} encoded frames but got {len(encoded)}")
+                if any(uses_reservoir(frame) for frame in encoded):
+                    raise RuntimeError("ffmpeg used the bit reservoir in a re-encoded stretch")
+                encoded_frames += len(encoded)
+
+                if rendered_start is None:
+                    output.writelines(encoded)
+                    break
+
+                # Carry the first copied frame's reservoir in the last encoded frame
+                encoded[-1] = carry_reservoir(encoded[-1], reservoir_bytes(source, frames, first))
+                output.writelines(encoded)
+                end = frames["offsets"][last] if last < len(frames["offsets"]) else frames["end"]
+                output.write(source[frames["offsets"][first]:end])
+                copied_frames += last - first
+
+                pre_roll = pipe_pcm(pcm, None, rendered_end - rendered_start)
+                position = rendered_end
+
+            stderr = render.stderr.read()
+            if render.wait() != 0:
+                raise RuntimeError(f"ffmpeg render failed: {stderr.decode(errors='replace')}")
+
+            # Whatever the frames hold past the rendered samples is the end padding
+            frame_count = copied_frames + encoded_frames
+            end_pad = frame_count * FRAME_SAMPLES - start_pad - (rendered.count // PCM_FRAME_BYTES - dropped)
+            output.seek(0)
+            output.write(info_frame(frame_count, os.fstat(output.fileno()).st_size, start_pad, end_pad))
+        except Exception:
+            render.kill()
+            render.wait()
+            output.close()
+            raise
+
+    print(f"Copied {copied_frames} frames from the source MP3 and encoded {encoded_frames}")
+    output.seek(0)
+    return output
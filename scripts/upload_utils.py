@@ -1,27 +1,24 @@
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-from google.oauth2 import service_account
+import fcntl
 import io
 import os
+import tempfile
 import requests
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv, set_key, find_dotenv
-from supabase import create_client, Client
-import contentful_management
-import requests
 from error_handling import send_error_to_slack
-from supabase import create_client, Client 
+from drive_utils import DRIVE_API_URL
 import json
 import base64
 import time
+import threading
+import functools
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
 
 dotenv_path = find_dotenv()
 load_dotenv(dotenv_path)
 
-url: str = os.getenv("SUPABASE_URL")
-key: str = os.getenv("SUPABASE_TOKEN")
-supabase: Client = create_client(url, key)
-
 CONTENTFUL_SPACE_ID = os.getenv('CONTENTFUL_SPACE_ID')
 CONTENTFUL_ENV_ID = os.getenv('CONTENTFUL_ENV_ID')
 CONTENTFUL_MANAGEMENT_API_TOKEN = os.getenv('CONTENTFUL_MANAGEMENT_API_TOKEN')
@@ -30,68 +27,393 @@ CONTENTFUL_MANAGEMENT_API_TOKEN = os.getenv('CONTENTFUL_MANAGEMENT_API_TOKEN')
 SCOPES = ['https://www.googleapis.com/auth/drive']
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 
-def get_drive_service():
-    """Authenticate and return a Google Drive service instance."""
-    credentials = service_account.Credentials.from_service_account_info(
+# Service endpoints, all of them can point at local stand-ins for benchmarks
+GOOGLE_TOKEN_URI = os.getenv("GOOGLE_TOKEN_URI", "https://oauth2.googleapis.com/token")
+SOUNDCLOUD_API_URL = os.getenv("SOUNDCLOUD_API_URL", "https://api.soundcloud.com")
+SOUNDCLOUD_TOKEN_URL = os.getenv("SOUNDCLOUD_TOKEN_URL", "https://secure.soundcloud.com/oauth/token")
+WEBSITE_API_URL = os.getenv("WEBSITE_API_URL", "https://refugeworldwide.com/api")
+# Contentful hosts are given without a scheme, CONTENTFUL_HTTPS turns TLS off for a local stand-in
+CONTENTFUL_API_HOST = os.getenv("CONTENTFUL_API_HOST", "api.contentful.com")
+CONTENTFUL_UPLOADS_HOST = os.getenv("CONTENTFUL_UPLOADS_HOST", "upload.contentful.com")
+CONTENTFUL_HTTPS = os.getenv("CONTENTFUL_HTTPS", "true").lower() not in ("0", "false", "no")
+
+# The Supabase, Contentful and Google clients are slow to import, so each is imported on first use.
+# Supabase client holding the SoundCloud tokens, created on first use
+supabase_client = {}
+supabase_lock = threading.Lock()
+
+def get_supabase():
+    """Return the shared Supabase client, creating it on first use."""
+    with supabase_lock:
+        if not supabase_client:
+            from supabase import create_client
+            supabase_client["client"] = create_client(SUPABASE_URL, os.getenv("SUPABASE_TOKEN"))
+        return supabase_client["client"]
+
+class PooledRequests:
+    """Stands in for the requests module inside contentful_management.
+
+    Every request goes through a keep-alive session, one per thread since
+    sessions aren't guaranteed to be thread safe, so the TLS connection to
+    Contentful is reused between calls.
+
+    The client has no option to pass a session, so this replaces the requests
+    module it imported. That relies on Client._http_request looking up
+    requests.<method> on every call, as the pinned contentful_management
+    2.14.4 does. tests/test_upload_utils.py checks the connection is reused,
+    run it before upgrading the client.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def __getattr__(self, name):
+        if name in ("request", "get", "post", "put", "patch", "delete", "head"):
+            return getattr(self.session(), name)
+        return getattr(requests, name)
+
+# Client, space and environment shared by every Contentful call, created on first use
+contentful_context = {}
+contentful_lock = threading.Lock()
+
+def get_contentful_environment():
+    """Return the shared Contentful space and environment, looking them up on first use."""
+    with contentful_lock:
+        if not contentful_context:
+            import contentful_management
+            # The client calls requests directly, route it through pooled sessions instead
+            contentful_management.client.requests = PooledRequests()
+            client = contentful_management.Client(
+                CONTENTFUL_MANAGEMENT_API_TOKEN,
+                api_url=CONTENTFUL_API_HOST,
+                uploads_api_url=CONTENTFUL_UPLOADS_HOST,
+                https=CONTENTFUL_HTTPS
+            )
+            space = client.spaces().find(CONTENTFUL_SPACE_ID)
+            environment = space.environments().find(CONTENTFUL_ENV_ID)
+            contentful_context.update(client=client, space=space, environment=environment)
+        return contentful_context["space"], contentful_context["environment"]
+
+def invalidate_contentful_context():
+    """Drop the shared Contentful objects so the next call looks them up again."""
+    with contentful_lock:
+        contentful_context.clear()
+
+def retry_on_contentful_auth_error(fn):
+    """Invalidate the shared Contentful context and retry once when a call is unauthorized.
+
+    Only wrap calls that are safe to repeat from the start: a single request,
+    or lookups and requests that leave the same state when repeated. A request
+    Contentful rejected changed nothing, but the ones before it did.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            import contentful_management.errors
+            if not isinstance(e, contentful_management.errors.UnauthorizedError):
+                raise
+            print("Contentful rejected the request as unauthorized, reconnecting...")
+            invalidate_contentful_context()
+            return fn(*args, **kwargs)
+    return wrapper
+
+# Size of each request of a resumable upload to Drive
+DRIVE_UPLOAD_CHUNK_SIZE = int(os.getenv("DRIVE_UPLOAD_CHUNK_SIZE", 32 * 1024 * 1024))
+# Attempts made at an upload that fails with a dropped connection or a timeout
+UPLOAD_ATTEMPTS = int(os.getenv("UPLOAD_ATTEMPTS", 3))
+# Seconds before the first retry, doubled for every retry after that
+UPLOAD_RETRY_DELAY = float(os.getenv("UPLOAD_RETRY_DELAY", 10))
+
+class MultipartStream:
+    """A multipart/form-data request body that reads its files lazily.
+
+    requests sends file-like bodies in small blocks, so a large file is
+    streamed from disk instead of being built into one bytes object. The
+    length is known up front, so the request still has a Content-Length.
+    """
+
+    def __init__(self, fields, files):
+        self.boundary = uuid.uuid4().hex
+        self.parts = []
+        for name, value in fields.items():
+            self.parts.append(io.BytesIO(
+                f"--{self.boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n".encode()
+            ))
+        for name, (filename, file, content_type) in files.items():
+            self.parts.append(io.BytesIO(
+                f"--{self.boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+                f"Content-Type: {content_type}\r\n\r\n".encode()
+            ))
+            self.parts.append(file)
+            self.parts.append(io.BytesIO(b"\r\n"))
+        self.parts.append(io.BytesIO(f"--{self.boundary}--\r\n".encode()))
+
+        self.length = 0
+        for part in self.parts:
+            part.seek(0, os.SEEK_END)
+            self.length += part.tell()
+            part.seek(0)
+        self.current = 0
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        chunks = []
+        while self.current < len(self.parts) and size != 0:
+            chunk = self.parts[self.current].read(size)
+            if not chunk:
+                self.current += 1
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(chunks)
+
+def retry_transient(fn, description, attempts=UPLOAD_ATTEMPTS):
+    """Call fn, retrying with backoff when the connection drops or times out.
+
+    Neither SoundCloud nor Contentful can resume a partial upload, so a retry
+    sends the file again from the start.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == attempts:
+                raise
+            delay = UPLOAD_RETRY_DELAY * 2 ** (attempt - 1)
+            print(f"{description} failed ({e}), retrying in {delay:.0f} seconds...")
+            time.sleep(delay)
+
+# Asset processing is checked after ASSET_POLL_FIRST_INTERVAL seconds, then the
+# interval grows by ASSET_POLL_BACKOFF up to ASSET_POLL_MAX_INTERVAL seconds
+ASSET_POLL_FIRST_INTERVAL = float(os.getenv("ASSET_POLL_FIRST_INTERVAL", 1))
+ASSET_POLL_MAX_INTERVAL = float(os.getenv("ASSET_POLL_MAX_INTERVAL", 20))
+ASSET_POLL_BACKOFF = float(os.getenv("ASSET_POLL_BACKOFF", 1.5))
+# Give up on an asset after this many checks or seconds, whichever comes first
+ASSET_POLL_MAX_REQUESTS = int(os.getenv("ASSET_POLL_MAX_REQUESTS", 25))
+ASSET_PROCESSING_TIMEOUT = float(os.getenv("ASSET_PROCESSING_TIMEOUT", 240))
+
+class AssetWaiter:
+    """Waits for Contentful assets to finish processing from a single poller thread.
+
+    Each asset is checked with a growing interval and a bounded number of
+    requests. The poller thread only runs while there are assets to wait for.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.thread = None
+
+    def wait_for(self, asset_id):
+        """Return a Future that resolves to the processed asset."""
+        future = Future()
+        now = time.time()
+        with self.condition:
+            self.pending[asset_id] = {
+                "future": future,
+                "started": now,
+                "next_check": now + ASSET_POLL_FIRST_INTERVAL,
+                "interval": ASSET_POLL_FIRST_INTERVAL,
+                "requests": 0
+            }
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="contentful-asset-waiter", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return future
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.pending:
+                    self.thread = None
+                    return
+                next_check = min(waiting["next_check"] for waiting in self.pending.values())
+                delay = next_check - time.time()
+                if delay > 0:
+                    # Woken early when a new asset is added
+                    self.condition.wait(delay)
+                    continue
+                now = time.time()
+                due = [(asset_id, waiting) for asset_id, waiting in self.pending.items() if waiting["next_check"] <= now]
+
+            for asset_id, waiting in due:
+                self.check(asset_id, waiting)
+
+    def check(self, asset_id, waiting):
+        waiting["requests"] += 1
+        try:
+            _, environment = get_contentful_environment()
+            asset = environment.assets().find(asset_id)
+            processed = 'file' in asset.fields() and 'url' in asset.fields()['file']
+        except Exception as e:
+            self.finish(asset_id, exception=e)
+            return
+
+        elapsed_time = time.time() - waiting["started"]
+        if processed:
+            print(f"Asset {asset_id} processed successfully in {elapsed_time:.2f} seconds after {waiting['requests']} checks.")
+            self.finish(asset_id, result=asset)
+        elif waiting["requests"] >= ASSET_POLL_MAX_REQUESTS or elapsed_time > ASSET_PROCESSING_TIMEOUT:
+            self.finish(asset_id, exception=TimeoutError(
+                f"Asset processing timed out after {elapsed_time:.0f} seconds and {waiting['requests']} checks."
+            ))
+        else:
+            print(f"Waiting for asset {asset_id} to be processed...")
+            with self.condition:
+                waiting["next_check"] = time.time() + waiting["interval"]
+                waiting["interval"] = min(waiting["interval"] * ASSET_POLL_BACKOFF, ASSET_POLL_MAX_INTERVAL)
+
+    def finish(self, asset_id, result=None, exception=None):
+        with self.condition:
+            waiting = self.pending.pop(asset_id)
+        if exception is not None:
+            waiting["future"].set_exception(exception)
+        else:
+            waiting["future"].set_result(result)
+
+asset_waiter = AssetWaiter()
+
+# Drive discovery document, parsed once from the copy bundled with google-api-python-client
+drive_discovery = {}
+drive_discovery_lock = threading.Lock()
+
+def get_drive_credentials():
+    """Return the service account credentials used for Google Drive."""
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_info(
         {
             "type": "service_account",
             "client_email": os.getenv('GOOGLE_DRIVE_CLIENT_EMAIL'),
             "private_key": os.getenv('GOOGLE_DRIVE_PRIVATE_KEY'),
-            "token_uri": "https://oauth2.googleapis.com/token"
+            "token_uri": GOOGLE_TOKEN_URI
         },
         scopes=SCOPES
     )
-    return build('drive', 'v3', credentials=credentials)
 
-def get_soundcloud_token():
-    """Retrieve a valid SoundCloud OAuth token, refreshing if expired."""
+def get_drive_service():
+    """Authenticate and return a Google Drive service instance.
+
+    The service is built from the discovery document bundled with the client
+    library instead of fetching it, and the document is only parsed once. Its
+    root URL is replaced with DRIVE_API_URL, which also moves the upload and
+    batch endpoints.
+    """
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+    with drive_discovery_lock:
+        if not drive_discovery:
+            drive_discovery.update(json.loads(get_static_doc("drive", "v3")))
+    return build_from_document(dict(drive_discovery, rootUrl=DRIVE_API_URL), credentials=get_drive_credentials())
+
+# Token kept in memory between uploads, used until shortly before it expires
+soundcloud_token = {}
+soundcloud_token_lock = threading.Lock()
+SOUNDCLOUD_TOKEN_MARGIN = timedelta(seconds=30)
+# Lock file held while the token is refreshed, so worker processes never refresh it at the same time
+SOUNDCLOUD_TOKEN_LOCK_PATH = os.getenv("SOUNDCLOUD_TOKEN_LOCK_PATH") or os.path.join(tempfile.gettempdir(), "soundcloud-token.lock")
+
+@contextmanager
+def soundcloud_refresh_lock(path=SOUNDCLOUD_TOKEN_LOCK_PATH):
+    """Hold the token refresh lock for the duration of the block, waiting for it if another process holds it."""
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def read_soundcloud_token():
+    """Return the access token, refresh token and expiry stored in Supabase."""
+    response = get_supabase().from_("accessTokens").select("*").eq("application", "soundcloud").single().execute()
+    #convert expiration time to datetime object
+    expires_at_date_object = datetime.strptime(response.data["expires"], "%Y-%m-%dT%H:%M:%S%z")
+    return response.data["token"], response.data["refresh_token"], expires_at_date_object
 
-    # Retrieve the access token, refresh token and expiration time from supbase
-    response = supabase.from_("accessTokens").select("*").eq("application", "soundcloud").single().execute()
-    access_token = response.data["token"]
-    refresh_token = response.data["refresh_token"]
-    expires_at = response.data["expires"]
+def soundcloud_token_expired(expires_at_date_object):
+    return datetime.now(timezone.utc) >= expires_at_date_object - SOUNDCLOUD_TOKEN_MARGIN
 
-    #convert expiration time to datetime object
-    expires_at_date_object = datetime.strptime(expires_at, "%Y-%m-%dT%H:%M:%S%z")
-
-    # If the access token has expired, refresh it
-    if datetime.now(timezone.utc) >= expires_at_date_object:
-        print("Access token expired, refreshing...")
-        refresh_url = "https://secure.soundcloud.com/oauth/token"
-        data = {
-            "grant_type": "refresh_token",
-            "client_id": os.getenv("SC_CLIENT_ID"),
-            "client_secret": os.getenv("SC_CLIENT_SECRET"),
-            "refresh_token": refresh_token
-        }
-        response = requests.post(refresh_url, data=data)
-
-        if response.status_code == 200:
-            new_tokens = response.json()
-            access_token = new_tokens["access_token"]
-            refresh_token = new_tokens["refresh_token"]
-            # Add buffer of 60 seconds to ensure we don't try an invalid token due to some delay
-            expires_at = datetime.now() + timedelta(seconds=new_tokens["expires_in"] - 60)
-            expires_at_str = expires_at.strftime("%Y-%m-%dT%H:%M:%S%z")
-
-            """Update the SoundCloud token in Supabase."""
-            data = {
-                "token": access_token,
-                "refresh_token": refresh_token,
-                "expires": expires_at_str
-            }
-            response = supabase.from_("accessTokens").update(data).eq("application", "soundcloud").execute()
-        
-            print(f"New access token obtained: {access_token}")
-            print(f"New refresh token obtained: {refresh_token}")
-        else:
-            error_message = "Failed to refresh access token"
-            print(error_message)
-            send_error_to_slack(error_message)
-            return None
+def get_soundcloud_token():
+    """Retrieve a valid SoundCloud OAuth token, refreshing if expired.
+
+    The token is cached in memory until shortly before it expires. Threads wait
+    on the same lock while a refresh is in flight, and processes on a lock file,
+    so only one refresh request is ever made. A refresh invalidates the old
+    refresh token, so the row is read again once the lock file is held and a
+    token another process has just refreshed is used as it is.
+    """
+    with soundcloud_token_lock:
+        if soundcloud_token and not soundcloud_token_expired(soundcloud_token["expires"]):
+            return soundcloud_token["token"]
+
+        # Retrieve the access token and expiration time from supbase
+        access_token, _, expires_at_date_object = read_soundcloud_token()
+
+        # If the access token has expired, refresh it
+        if soundcloud_token_expired(expires_at_date_object):
+            with soundcloud_refresh_lock():
+                access_token, refresh_token, expires_at_date_object = read_soundcloud_token()
+                if soundcloud_token_expired(expires_at_date_object):
+                    access_token, expires_at_date_object = refresh_soundcloud_token(refresh_token)
+                    if access_token is None:
+                        return None
+
+        soundcloud_token.update(token=access_token, expires=expires_at_date_object)
+        return access_token
+
+def refresh_soundcloud_token(refresh_token):
+    """Exchange the refresh token for new tokens and store them in Supabase.
+
+    Returns the new access token and its expiry, or (None, None) if SoundCloud refused.
+    """
+    print("Access token expired, refreshing...")
+    refresh_url = SOUNDCLOUD_TOKEN_URL
+    data = {
+        "grant_type": "refresh_token",
+        "client_id": os.getenv("SC_CLIENT_ID"),
+        "client_secret": os.getenv("SC_CLIENT_SECRET"),
+        "refresh_token": refresh_token
+    }
+    response = requests.post(refresh_url, data=data)
+
+    if response.status_code != 200:
+        error_message = "Failed to refresh access token"
+        print(error_message)
+        send_error_to_slack(error_message)
+        return None, None
+
+    new_tokens = response.json()
+    access_token = new_tokens["access_token"]
+    refresh_token = new_tokens["refresh_token"]
+    # Add buffer of 60 seconds to ensure we don't try an invalid token due to some delay
+    expires_at_date_object = datetime.now(timezone.utc) + timedelta(seconds=new_tokens["expires_in"] - 60)
+    expires_at_str = expires_at_date_object.strftime("%Y-%m-%dT%H:%M:%S%z")
+
+    """Update the SoundCloud token in Supabase."""
+    data = {
+        "token": access_token,
+        "refresh_token": refresh_token,
+        "expires": expires_at_str
+    }
+    get_supabase().from_("accessTokens").update(data).eq("application", "soundcloud").execute()
 
-    return access_token
+    print(f"New access token obtained: {access_token}")
+    print(f"New refresh token obtained: {refresh_token}")
+    return access_token, expires_at_date_object
 
 def upload_to_soundcloud(audio_file, show_metadata):
     """Upload audio to SoundCloud."""
@@ -101,8 +423,10 @@ def upload_to_soundcloud(audio_file, show_metadata):
         response.raise_for_status()  # Raise an exception if the image download fails
         return response.content  # Return the raw image data
 
-    # Image URL from Contentful show data
-    image_url = "https:" + show_metadata["artwork"]
+    # Image URL from Contentful show data, which leaves out the scheme
+    image_url = show_metadata["artwork"]
+    if image_url.startswith("//"):
+        image_url = "https:" + image_url
 
     # Download the image
     image_data = download_image(image_url)
@@ -116,22 +440,30 @@ def upload_to_soundcloud(audio_file, show_metadata):
         # Create the filename with the show name and title
         filename = f"{show_metadata['title']}.mp3"
 
-        # Send the POST request to SoundCloud with the token in the Authorization header
-        response = requests.post(
-            "https://api.soundcloud.com/tracks",
-            headers={"Authorization": f"OAuth {token}"},
-            files={
-                "track[asset_data]": (filename, audio_file, "audio/mpeg"),
-                "track[artwork_data]": ("artwork.png", image_data, "image/png")
+        def post_track():
+            # The body streams the MP3 from disk, rebuilt on every attempt so it starts from the beginning
+            body = MultipartStream(
+                fields={
+                    "track[title]": show_metadata["title"],
+                    "track[description]": show_metadata["description"],
+                    "track[tag_list]": " ".join([f"\"{genre}\"" for genre in show_metadata["genres"]]),
+                    "track[sharing]": "public",
+                    "track[downloadable]": "false"
                 },
-            data={
-                "track[title]": show_metadata["title"],
-                "track[description]": show_metadata["description"],
-                "track[tag_list]": " ".join([f"\"{genre}\"" for genre in show_metadata["genres"]]),
-                "track[sharing]": "public",
-                "track[downloadable]": "false"
-            }
-        )
+                files={
+                    "track[asset_data]": (filename, audio_file, "audio/mpeg"),
+                    "track[artwork_data]": ("artwork.png", io.BytesIO(image_data), "image/png")
+                }
+            )
+
+            # Send the POST request to SoundCloud with the token in the Authorization header
+            return requests.post(
+                f"{SOUNDCLOUD_API_URL}/tracks",
+                headers={"Authorization": f"OAuth {token}", "Content-Type": body.content_type},
+                data=body
+            )
+
+        response = retry_transient(post_track, "SoundCloud upload")
 
         # Print response for debugging
         print(f"Response status code: {response.status_code}")
@@ -150,94 +482,94 @@ def upload_to_soundcloud(audio_file, show_metadata):
         print(error_message)
         raise
 
-# Function to update the SoundCloud link and audio file for a show in Contentful
-def update_show_contentful(entry_id, name, sc_link, audio_file):
-    try:
-        audio_file.seek(0)
-
-        client = contentful_management.Client(CONTENTFUL_MANAGEMENT_API_TOKEN)
-        space = client.spaces().find(CONTENTFUL_SPACE_ID)
-        environment = space.environments().find(CONTENTFUL_ENV_ID)
-        
-        upload = space.uploads().create(audio_file)
-        print(f"File uploaded with ID: {upload.sys['id']}")
-
-        # Step 2: Create an asset and link the uploaded file
-        asset = environment.assets().create(
-            None,
-            {
-                "fields": {
-                    "title": {
-                        "en-US": name
-                    },
-                    "file": {
-                        "en-US": {
-                            "uploadFrom": {
-                                "sys": {
-                                    "type": "Link",
-                                    "linkType": "Upload",
-                                    "id": upload.sys['id']
-                                }
-                            },
-                            "fileName": f"{name}.mp3",
-                            "contentType": "audio/mpeg"
-                        }
+@retry_on_contentful_auth_error
+def create_upload_contentful(audio_file):
+    """Upload a file to Contentful from the start and return the upload."""
+    space, _ = get_contentful_environment()
+    audio_file.seek(0)
+    return space.uploads().create(audio_file)
+
+@retry_on_contentful_auth_error
+def create_asset_contentful(name, upload_id, suffix=".mp3", mimetype="audio/mpeg"):
+    """Create an asset from an upload of a file in the format given by suffix and mimetype."""
+    _, environment = get_contentful_environment()
+    return environment.assets().create(
+        None,
+        {
+            "fields": {
+                "title": {
+                    "en-US": name
+                },
+                "file": {
+                    "en-US": {
+                        "uploadFrom": {
+                            "sys": {
+                                "type": "Link",
+                                "linkType": "Upload",
+                                "id": upload_id
+                            }
+                        },
+                        "fileName": f"{name}{suffix}",
+                        "contentType": mimetype
                     }
                 }
             }
-        )
-        print(f"Asset created with ID: {asset.sys['id']}")
-
-        asset.process()
-        
-        # TODO: Fix asset publishing, possibly have to wait for asset to finish
-        # processing but asset.process() is not an async function.
-
-        print(f"Audio file uploaded and published as asset: {asset.sys['id']}")
-
-        # Step 2: Update the entry with the SoundCloud link and audio asset
-        entry = environment.entries().find(entry_id)
-        entry.fields('en-US')['mixcloudLink'] = sc_link
-        entry.fields('en-US')['audioFile'] = {
-            "sys": {
-                "type": "Link",
-                "linkType": "Asset",
-                "id": asset.sys['id']
-            }
         }
-        entry.save()
+    )
 
-        # Wait for asset to finish processing. It will have a URL when it has.
-        # Will timeout after 240 seconds.
-        start_time = time.time()
-        while True:
-            newAsset = environment.assets().find(asset.sys['id'])
-            if 'file' in newAsset.fields() and 'url' in newAsset.fields()['file']:
-                print(f"Asset processed successfully.")
-                # Publish the asset
-                newAsset.publish()
-                break
-            elapsed_time = time.time() - start_time
-            if elapsed_time > 240:
-                raise TimeoutError("Asset processing timed out after 240 seconds.")
-                break
-            print("Waiting for asset to be processed...")
-            time.sleep(5)  # Wait for 5 seconds before checking again
-
-        # Publish the show
-        entry.publish()
-
-        print(f"SoundCloud link and audio file updated for entry ID {entry_id}.")
+def create_audio_asset_contentful(name, audio_file, suffix=".mp3", mimetype="audio/mpeg"):
+    """Upload an audio file to Contentful and start processing it.
+
+    Returns a Future that resolves to the processed asset, which still needs
+    publish_asset_contentful. Nothing waits for the processing in the calling
+    thread, so it is free for other uploads as soon as the file is sent.
+    Doesn't need the SoundCloud link, so it can run while the show is still
+    uploading to SoundCloud. Each request is retried on its own, so an expired
+    token never uploads the file twice.
+    """
+    # The upload is sent straight from the open file, so it streams from disk
+    upload = retry_transient(lambda: create_upload_contentful(audio_file), "Contentful upload")
+    print(f"File uploaded with ID: {upload.sys['id']}")
+
+    # Step 2: Create an asset and link the uploaded file
+    asset = create_asset_contentful(name, upload.sys['id'], suffix, mimetype)
+    print(f"Asset created with ID: {asset.sys['id']}")
+
+    retry_on_contentful_auth_error(asset.process)()
+
+    # The waiter resolves the asset once it is processed. It will have a URL when it has.
+    return asset_waiter.wait_for(asset.sys['id'])
+
+def publish_asset_contentful(processed_asset):
+    """Publish a processed asset and return its ID."""
+    retry_on_contentful_auth_error(processed_asset.publish)()
+    print(f"Audio file uploaded and published as asset: {processed_asset.sys['id']}")
+    return processed_asset.sys['id']
+
+@retry_on_contentful_auth_error
+def link_show_contentful(entry_id, sc_link, asset_id):
+    """Set the SoundCloud link and audio asset of a show in Contentful and publish it."""
+    _, environment = get_contentful_environment()
+
+    entry = environment.entries().find(entry_id)
+    entry.fields('en-US')['mixcloudLink'] = sc_link
+    entry.fields('en-US')['audioFile'] = {
+        "sys": {
+            "type": "Link",
+            "linkType": "Asset",
+            "id": asset_id
+        }
+    }
+    entry.save()
 
-    except Exception as e:
-        error_message = f"Error updating show {entry_id} with SoundCloud link and audio file: {str(e)}"
-        send_error_to_slack(error_message)
-        print(error_message)
+    # Publish the show
+    entry.publish()
+
+    print(f"SoundCloud link and audio file updated for entry ID {entry_id}.")
 
+@retry_on_contentful_auth_error
 def find_asset_url():
-    client = contentful_management.Client(CONTENTFUL_MANAGEMENT_API_TOKEN)
-    space = client.spaces().find(CONTENTFUL_SPACE_ID)
-    environment = space.environments().find(CONTENTFUL_ENV_ID)
+    _, environment = get_contentful_environment()
 
 
     asset = environment.assets().find("46Qi3spciOmdruadxGHtO5")
@@ -245,22 +577,25 @@ def find_asset_url():
     if 'file' in asset.fields() and 'url' in asset.fields()['file']:
         print("YES WE HAVE A URL")
 
-def delete_repeat_from_contentful(entry_id):
-    """Delete a show from contentful, used when its a repeat on the schedule."""
-    try:
-        # Initialize the Contentful Management client
-        client = contentful_management.Client(CONTENTFUL_MANAGEMENT_API_TOKEN)
-        space = client.spaces().find(CONTENTFUL_SPACE_ID)
-        environment = space.environments().find(CONTENTFUL_ENV_ID)
+@retry_on_contentful_auth_error
+def find_entry_contentful(entry_id):
+    _, environment = get_contentful_environment()
+    return environment.entries().find(entry_id)
 
-        # Find the show by ID
-        entry = environment.entries().find(entry_id)
+def delete_entry_contentful(entry_id):
+    # Find the show by ID
+    entry = find_entry_contentful(entry_id)
 
-        # Unpublish the show, required so it can be deleted
-        entry.unpublish()
+    # Unpublish the show, required so it can be deleted. Retried on its own, as unpublishing twice fails
+    retry_on_contentful_auth_error(entry.unpublish)()
 
-        # Delete the show
-        entry.delete()
+    # Delete the show
+    retry_on_contentful_auth_error(entry.delete)()
+
+def delete_repeat_from_contentful(entry_id):
+    """Delete a show from contentful, used when its a repeat on the schedule."""
+    try:
+        delete_entry_contentful(entry_id)
         print(f"Entry with ID {entry_id} has been deleted successfully.")
 
     except Exception as e:
@@ -271,7 +606,7 @@ def get_show_from_timestamp(timestamp):
     try:            
         api_key = os.getenv('WEBSITE_API_KEY')
         headers = {'Authorization': f'Bearer {api_key}'}
-        response = requests.get(f"https://refugeworldwide.com/api/shows/by-timestamp?t={timestamp}", headers=headers)
+        response = requests.get(f"{WEBSITE_API_URL}/shows/by-timestamp?t={timestamp}", headers=headers)
         response.raise_for_status()  # Raise an exception for HTTP errors
         show = response.json()  # Parse the JSON response
         return show
@@ -300,26 +635,23 @@ def fetch_show_details_from_contentful(timestamp):
         return show_metadata
     return None, None, None
 
-def upload_to_drive(service, audio_segment, filename, folder_id, timestamp):
-    """Upload an audio file to Google Drive."""
-    file_stream = io.BytesIO()
-    tags = {'artist': 'Radio Show', 'date': timestamp}
-    audio_segment.export(file_stream, format="mp3", bitrate="192k", tags=tags)
-    file_stream.seek(0)
-
+def upload_to_drive(service, path, filename, folder_id, mimetype='audio/mpeg'):
+    """Upload an already encoded audio file from disk to Google Drive and return its ID."""
     file_metadata = {
         'name': filename,
         'parents': [folder_id]
     }
 
-    media = MediaIoBaseUpload(file_stream, mimetype='audio/mp3', resumable=True)
-    service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-
+    # Drive uploads are resumable, so the client retries a failed chunk without starting again
+    from googleapiclient.http import MediaFileUpload
+    media = MediaFileUpload(path, mimetype=mimetype, chunksize=DRIVE_UPLOAD_CHUNK_SIZE, resumable=True)
+    request = service.files().create(body=file_metadata, media_body=media, fields='id')
+    return request.execute(num_retries=UPLOAD_ATTEMPTS)['id']
 
-from googleapiclient.errors import HttpError
 
 def move_file_to_folder(service, file_id, new_folder_id):
     """Move a file to a folder, even if it has no parents."""
+    from googleapiclient.errors import HttpError
     try:
         # Step 1: Get file metadata
         file_metadata = service.files().get(fileId=file_id, fields='id, name, parents').execute()
@@ -0,0 +1,170 @@
+from audio_utils import process_audio_files, cached_jingle_path
+from upload_utils import get_drive_service
+from drive_utils import get_folder_files
+from journal_utils import run_lock
+from error_handling import send_error_to_slack
+from main import log_memory_usage_periodically
+from pydub import AudioSegment
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import signal
+import threading
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds between checks of the input folder for new shows
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 60))
+# Port the status endpoint listens on, 0 turns it off
+WORKER_STATUS_PORT = int(os.getenv("WORKER_STATUS_PORT", 8080))
+# Polls that can be missed while idle before the worker reports itself unhealthy
+WORKER_STALE_POLLS = 3
+
+# What the worker is doing, reported by the status endpoint
+status = {
+    "state": "starting",
+    "queue_depth": 0,
+    "last_poll": None,
+    "last_error": None,
+    "batches": 0,
+    "started": time.time()
+}
+status_lock = threading.Lock()
+
+# Set by SIGTERM or SIGINT, the worker finishes the shows it has started and exits
+stop_event = threading.Event()
+
+# Decoded jingles, kept between batches and only decoded again when the cached file changes
+jingles = {}
+
+def update_status(**changes):
+    with status_lock:
+        status.update(changes)
+
+def is_healthy(snapshot, now):
+    # A batch can take hours, so only an idle worker that has stopped polling is unhealthy
+    if snapshot["state"] != "idle":
+        return True
+    return snapshot["last_poll"] is not None and now - snapshot["last_poll"] < WORKER_STALE_POLLS * WORKER_POLL_INTERVAL
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """Report the worker's state and queue depth as JSON on /health."""
+
+    def do_GET(self):
+        if self.path not in ("/", "/health"):
+            self.send_error(404)
+            return
+
+        with status_lock:
+            snapshot = dict(status)
+        healthy = is_healthy(snapshot, time.time())
+        body = json.dumps({**snapshot, "healthy": healthy}).encode()
+
+        self.send_response(200 if healthy else 503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Health checks would drown out the processing logs
+        pass
+
+def start_status_server(port=WORKER_STATUS_PORT):
+    server = ThreadingHTTPServer(("", port), StatusHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Status endpoint listening on port {port}")
+    return server
+
+def load_jingles(service):
+    """Return the jingle paths and decoded jingles, decoding them again only when they change on Drive."""
+    paths = (
+        cached_jingle_path(service, os.getenv('START_JINGLE_ID')),
+        cached_jingle_path(service, os.getenv('END_JINGLE_ID'))
+    )
+    if jingles.get("paths") != paths:
+        print("Decoding jingles...")
+        jingles["paths"] = paths
+        jingles["segments"] = tuple(AudioSegment.from_wav(path) for path in paths)
+    return jingles["paths"], jingles["segments"]
+
+def poll_once(service, input_folder_id):
+    """List the input folder and process whatever is waiting in it."""
+    # A poll that finds another run holding the lock still counts, so the worker stays healthy meanwhile
+    update_status(last_poll=time.time())
+    with run_lock() as acquired:
+        if not acquired:
+            print("Another run is processing shows, checking again at the next poll.")
+            return
+
+        files = get_folder_files(service, input_folder_id)
+        update_status(queue_depth=len(files))
+        if not files:
+            return
+
+        update_status(state="processing")
+        print(f"Found {len(files)} shows waiting in the input folder")
+        (start_jingle_path, end_jingle_path), (start_jingle, end_jingle) = load_jingles(service)
+        process_audio_files(
+            service=service,
+            folder_id=input_folder_id,
+            start_jingle=start_jingle,
+            end_jingle=end_jingle,
+            start_jingle_path=start_jingle_path,
+            end_jingle_path=end_jingle_path,
+            files=files,
+            stop_event=stop_event
+        )
+        with status_lock:
+            status["batches"] += 1
+
+def handle_stop(signum, frame):
+    print(f"Received signal {signum}, stopping once the shows in progress are finished...")
+    stop_event.set()
+
+def run_worker():
+    """Poll the input folder and process new shows until asked to stop.
+
+    The Drive service, the service clients and the decoded jingles are kept
+    between polls, so a poll that finds nothing costs one listing request.
+    Errors are reported and the worker carries on at the next poll.
+    """
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    # Start memory monitoring in a separate thread
+    memory_thread = threading.Thread(target=log_memory_usage_periodically, daemon=True)
+    memory_thread.start()
+
+    input_folder_id = os.getenv('INPUT_FOLDER_ID')
+    output_folder_id = os.getenv('OUTPUT_FOLDER_ID')
+    if not input_folder_id or not output_folder_id:
+        raise ValueError("Ensure INPUT_FOLDER_ID and OUTPUT_FOLDER_ID are set in environment variables.")
+
+    server = start_status_server() if WORKER_STATUS_PORT else None
+
+    print("Authenticating Google Drive service...")
+    drive_service = get_drive_service()
+    print("Google Drive service authenticated.")
+
+    while not stop_event.is_set():
+        try:
+            poll_once(drive_service, input_folder_id)
+        except Exception as e:
+            error_message = f"Worker failed processing the input folder: {e}"
+            send_error_to_slack(error_message)
+            print(error_message)
+            update_status(last_error=error_message)
+        update_status(state="idle")
+        stop_event.wait(WORKER_POLL_INTERVAL)
+
+    update_status(state="stopped")
+    if server:
+        server.shutdown()
+    print("Worker stopped.")
+
+if __name__ == "__main__":
+    run_worker()
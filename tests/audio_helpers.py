@@ -0,0 +1,70 @@
+import subprocess
+import numpy as np
+from pydub import AudioSegment
+
+SAMPLE_RATE = 44100
+# Window the level of each tone is measured over, 50 Hz apart bins so the tones below fall on one
+LEVEL_WINDOW_MS = 20
+
+def tone(seconds, frequency, sample_rate=SAMPLE_RATE, channels=2, amplitude=0.5, silences=()):
+    """A 16 bit sine wave as an AudioSegment, silent over each (start, end) in seconds of silences."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    wave = amplitude * np.sin(2 * np.pi * frequency * t)
+    for start, end in silences:
+        wave[int(start * sample_rate):int(end * sample_rate)] = 0
+    samples = np.round(np.repeat(wave[:, None], channels, axis=1) * 32767).astype(np.int16)
+    return AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=sample_rate, channels=channels)
+
+def decode(path, sample_rate=SAMPLE_RATE):
+    """Decode any file ffmpeg can read to a float array of mono samples."""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", path, "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "pipe:1"],
+        stdout=subprocess.PIPE, check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+def tone_levels(samples, frequency, sample_rate=SAMPLE_RATE, window_ms=LEVEL_WINDOW_MS):
+    """Amplitude of a tone in each window of samples."""
+    window = sample_rate * window_ms // 1000
+    windows = samples[:len(samples) // window * window].reshape(-1, window)
+    spectrum = np.abs(np.fft.rfft(windows, axis=1)) * 2 / window
+    return spectrum[:, round(frequency * window / sample_rate)]
+
+def overlap_ms(samples, first_frequency, second_frequency, threshold=0.1, sample_rate=SAMPLE_RATE, window_ms=LEVEL_WINDOW_MS):
+    """Return the (start, end) in ms of the stretch where both tones can be heard, i.e. a crossfade.
+
+    A tone is heard where it is above threshold times its loudest level.
+    """
+    first = tone_levels(samples, first_frequency, sample_rate, window_ms)
+    second = tone_levels(samples, second_frequency, sample_rate, window_ms)
+    both = np.flatnonzero((first > threshold * first.max()) & (second > threshold * second.max()))
+    assert len(both), "the tones never overlap"
+    return both[0] * window_ms, (both[-1] + 1) * window_ms
+
+def duration_ms(samples, sample_rate=SAMPLE_RATE):
+    return len(samples) * 1000 / sample_rate
+
+def noise(path, seconds, amplitude=0.05, silences=(), bitrate="192k", color="pink", seed=1, sample_rate=SAMPLE_RATE):
+    """Write stereo noise with ffmpeg in the format given by path's extension, silent over each (start, end) in seconds of silences."""
+    command = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"anoisesrc=duration={seconds}:color={color}:seed={seed}:sample_rate={sample_rate}:amplitude={amplitude}",
+        "-ac", "2"
+    ]
+    if silences:
+        command += ["-af", "volume=enable='" + "+".join(f"between(t,{start},{end})" for start, end in silences) + "':volume=0"]
+    if path.endswith(".mp3"):
+        command += ["-b:a", bitrate]
+    subprocess.run(command + [path], check=True)
+
+def alignment(samples, reference, position, window=4096, search=2400):
+    """Return the lag at which the window of samples at position best matches reference, and how well.
+
+    samples[position + i] lines up with reference[position + lag + i].
+    """
+    segment = samples[position:position + window]
+    low = max(0, position - search)
+    correlation = np.correlate(reference[low:position + window + search], segment, mode="valid")
+    lag = int(np.argmax(correlation)) + low - position
+    matched = reference[position + lag:position + lag + window]
+    return lag, float(np.corrcoef(segment, matched)[0, 1])
@@ -0,0 +1,26 @@
+import os
+import shutil
+import sys
+import tempfile
+import pytest
+
+# The scripts import each other as top level modules, the same way they do when run from scripts/
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+
+# Keep the journal, caches and locks of the tests away from a real run's, the scripts read them on import
+TEST_STATE_DIR = tempfile.mkdtemp(prefix="audio-automation-tests-")
+os.environ.update({
+    "JOURNAL_PATH": os.path.join(TEST_STATE_DIR, "journal.sqlite3"),
+    "RUN_LOCK_PATH": os.path.join(TEST_STATE_DIR, "run.lock"),
+    "SOUNDCLOUD_TOKEN_LOCK_PATH": os.path.join(TEST_STATE_DIR, "soundcloud-token.lock"),
+    "RENDER_CACHE_DIR": os.path.join(TEST_STATE_DIR, "render-cache"),
+    "ANALYSIS_INDEX_DIR": os.path.join(TEST_STATE_DIR, "analysis-index"),
+    "JINGLE_CACHE_DIR": os.path.join(TEST_STATE_DIR, "jingle-cache"),
+    "DRIVE_LISTING_STATE_PATH": os.path.join(TEST_STATE_DIR, "listing-state.json")
+})
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_STATE_DIR, ignore_errors=True)
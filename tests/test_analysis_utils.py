@@ -0,0 +1,55 @@
+import numpy as np
+import analysis_utils
+from analysis_utils import get_index, remove_index, index_path, index_duration_ms, detect_silence_from_index
+
+SAMPLE_RATE = 44100
+BLOCK_FRAMES = SAMPLE_RATE // 10
+
+def steady_index(rms, full_blocks, last_block_frames, channels=2):
+    """An index of audio at a steady RMS whose last block is last_block_frames long."""
+    frames = [BLOCK_FRAMES] * full_blocks + [last_block_frames]
+    return {
+        "energy": np.array([rms ** 2 * block * channels for block in frames], dtype=np.float64),
+        "peak": np.full(len(frames), rms, dtype=np.int32),
+        "sample_rate": SAMPLE_RATE,
+        "channels": channels,
+        "frames": sum(frames),
+        "block_ms": 100,
+        "integrated_loudness": -20.0
+    }
+
+def test_short_last_block_isnt_silence():
+    # Just above -50 dBFS, 104 against a threshold of 103.6, all the way to the end
+    index = steady_index(104, 100, BLOCK_FRAMES - 1)
+    # The show rounds up to 10100 ms, so the last window reaches the short block
+    assert index_duration_ms(index) == 10100
+    assert detect_silence_from_index(index, min_silence_len=5000, silence_thresh=-50, seek_step=100) == []
+
+def test_silence_from_index():
+    index = steady_index(5000, 100, BLOCK_FRAMES - 1)
+    index["energy"][20:80] = 0
+    assert detect_silence_from_index(index, min_silence_len=5000, silence_thresh=-50, seek_step=100) == [[2000, 8000]]
+
+def test_get_index_is_stored_under_the_checksum(monkeypatch):
+    analysed = []
+    def analyse_audio(path):
+        analysed.append(path)
+        return steady_index(104, 10, 100)
+    monkeypatch.setattr(analysis_utils, "analyse_audio", analyse_audio)
+
+    first = get_index("first-download.mp3", "checksum")
+    # A retry downloads the show to a new path but finds the index under its checksum
+    second = get_index("second-download.mp3", "checksum")
+    assert analysed == ["first-download.mp3"]
+    assert second["frames"] == first["frames"] and np.array_equal(second["energy"], first["energy"])
+
+    # Once the show is published its index is dropped
+    remove_index("checksum")
+    get_index("third-download.mp3", "checksum")
+    assert len(analysed) == 2
+
+    # Without a checksum nothing is stored
+    get_index("other.mp3")
+    get_index("other.mp3")
+    assert len(analysed) == 4
+    remove_index("checksum")
@@ -0,0 +1,87 @@
+import tempfile
+from concurrent.futures import Future
+import pytest
+import audio_utils
+from audio_helpers import tone
+from audio_utils import AudioView, concat_views, publish_show
+from journal_utils import get_show_record
+
+def rendered_show():
+    audio_file = tempfile.NamedTemporaryFile(suffix=".mp3")
+    audio_file.write(b"\xff\xfb" * 100)
+    audio_file.flush()
+    return audio_file
+
+def processed(asset):
+    """A finished Future like the one the asset waiter resolves."""
+    future = Future()
+    future.set_result(asset)
+    return future
+
+def test_publish_show_journals_uploads_that_succeeded(monkeypatch):
+    entry = {"id": "publish-partial", "name": "20240101 1200 Show.mp3", "metadata": {"entry_id": "entry-1", "title": "Show"}}
+    monkeypatch.setattr(audio_utils, "create_audio_asset_contentful", lambda title, audio_file, suffix, mimetype: processed("asset-1"))
+    monkeypatch.setattr(audio_utils, "publish_asset_contentful", lambda asset: asset)
+    def soundcloud_fails(audio_file, show_metadata):
+        raise RuntimeError("SoundCloud is down")
+    monkeypatch.setattr(audio_utils, "upload_to_soundcloud", soundcloud_fails)
+
+    with pytest.raises(RuntimeError, match="SoundCloud is down"):
+        publish_show(None, entry, rendered_show(), "backup")
+    assert get_show_record(entry["id"])["asset_id"] == "asset-1"
+
+    # The retry only uploads to SoundCloud and links the asset from the first attempt
+    def contentful_repeated(title, audio_file, suffix, mimetype):
+        raise AssertionError("uploaded to Contentful again")
+    linked = []
+    monkeypatch.setattr(audio_utils, "create_audio_asset_contentful", contentful_repeated)
+    monkeypatch.setattr(audio_utils, "upload_to_soundcloud", lambda audio_file, show_metadata: "https://soundcloud.com/show")
+    monkeypatch.setattr(audio_utils, "link_show_contentful", lambda entry_id, sc_link, asset_id: linked.append((entry_id, sc_link, asset_id)))
+    monkeypatch.setattr(audio_utils, "move_file_to_folder", lambda service, file_id, folder_id: None)
+
+    publish_show(None, entry, rendered_show(), "backup")
+    assert linked == [("entry-1", "https://soundcloud.com/show", "asset-1")]
+    assert get_show_record(entry["id"])["moved"]
+
+def test_publish_show_uploads_contentful_rendition_in_its_format(monkeypatch):
+    rendition = tempfile.NamedTemporaryFile(suffix=".opus")
+    rendition.write(b"OggS" * 100)
+    rendition.flush()
+    entry = {
+        "id": "publish-opus", "name": "20240102 1200 Show.mp3", "metadata": {"entry_id": "entry-2", "title": "Show"},
+        "renditions": {"contentful": rendition}
+    }
+    uploaded = []
+    def create_asset(title, audio_file, suffix, mimetype):
+        uploaded.append((audio_file.name, suffix, mimetype))
+        return processed("asset-2")
+    monkeypatch.setattr(audio_utils, "RENDER_RENDITIONS", {"contentful": ("opus", "96k")})
+    monkeypatch.setattr(audio_utils, "create_audio_asset_contentful", create_asset)
+    monkeypatch.setattr(audio_utils, "publish_asset_contentful", lambda asset: asset)
+    monkeypatch.setattr(audio_utils, "upload_to_soundcloud", lambda audio_file, show_metadata: "https://soundcloud.com/show")
+    monkeypatch.setattr(audio_utils, "link_show_contentful", lambda entry_id, sc_link, asset_id: None)
+    monkeypatch.setattr(audio_utils, "move_file_to_folder", lambda service, file_id, folder_id: None)
+
+    publish_show(None, entry, rendered_show(), "backup")
+    assert uploaded == [(rendition.name, ".opus", "audio/ogg")]
+
+# Millisecond slices at odd offsets, from the end, empty, reversed and past the end
+SLICES = [(None, None), (123, 1457), (-777, None), (None, -1234), (500, 500), (900, 700), (1999, 5000), (-1, None)]
+
+@pytest.mark.parametrize("start, end", SLICES)
+def test_view_slices_match_audio_segment(start, end):
+    # An odd number of frames, so the length in ms is rounded
+    segment = tone(2.0371, 440)
+
+    assert AudioView.from_segment(segment)[start:end].to_segment().raw_data == segment[start:end].raw_data
+
+@pytest.mark.parametrize("start, end", SLICES)
+def test_concatenated_views_match_audio_segment(start, end):
+    first, second, third = tone(1.0133, 440), tone(0.5011, 660), tone(0.7, 880)
+    # The jingle in another format is converted the way AudioSegment.append converts it
+    jingle = tone(0.3017, 330, sample_rate=48000, channels=1)
+
+    views = concat_views([AudioView.from_segment(first)[17:], AudioView.from_segment(second), AudioView.from_segment(third)[:-333]]) + jingle
+    segments = first[17:] + second + third[:-333] + jingle
+    assert len(views) == len(segments)
+    assert views[start:end].to_segment().raw_data == segments[start:end].raw_data
@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+from conftest import SCRIPTS_DIR, requires_ffmpeg
+
+@requires_ffmpeg
+def test_benchmark_publishes_a_show():
+    # The shortest show that is processed, rendered by the default engine
+    result = subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS_DIR, "benchmark.py"), "--shows", "1", "--minutes", "30", "--asset-processing-delay", "0"],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True,
+        env={key: value for key, value in os.environ.items() if key != "RENDER_ENGINE"}
+    )
+
+    assert "Processed 1/1 shows" in result.stdout
+    assert "errors were reported to Slack" not in result.stdout
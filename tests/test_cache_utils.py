@@ -0,0 +1,26 @@
+import os
+import cache_utils
+from cache_utils import evict_renders
+
+def write(path, size, mtime):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (mtime, mtime))
+
+def test_evict_renders_removes_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_utils, "RENDER_CACHE_DIR", str(tmp_path))
+    for number in range(4):
+        write(tmp_path / f"render{number}.mp3", 100, 1000 + number)
+
+    evict_renders(keep=str(tmp_path / "render0.mp3"), max_bytes=250)
+    assert sorted(os.listdir(tmp_path)) == ["render0.mp3", "render3.mp3"]
+
+def test_evict_renders_leaves_partial_copies(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_utils, "RENDER_CACHE_DIR", str(tmp_path))
+    # Another worker's copy in progress, older and bigger than everything else
+    write(tmp_path / "other.mp3.partial", 1000, 0)
+    write(tmp_path / "render0.mp3", 100, 1000)
+    write(tmp_path / "render1.mp3", 100, 1001)
+
+    evict_renders(keep=str(tmp_path / "render1.mp3"), max_bytes=150)
+    assert sorted(os.listdir(tmp_path)) == ["other.mp3.partial", "render1.mp3"]
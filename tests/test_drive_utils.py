@@ -0,0 +1,201 @@
+import os
+import pytest
+from google.auth.credentials import AnonymousCredentials
+import drive_utils
+from drive_utils import download_ranged
+from fake_services import FakeServices
+
+SIZE = 1000
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeServices().start()
+    monkeypatch.setattr(drive_utils, "DRIVE_API_URL", fake.environment()["DRIVE_API_URL"])
+    # Fail straight away instead of backing off between attempts
+    monkeypatch.setattr(drive_utils, "RANGED_DOWNLOAD_ATTEMPTS", 1)
+    yield fake
+    fake.stop()
+
+def drive_file(fake, tmp_path):
+    source = tmp_path / "source.mp3"
+    source.write_bytes(os.urandom(SIZE))
+    file_id = fake.add_file(str(source), "source.mp3", "input")
+    return source, file_id, fake.files[file_id]["md5Checksum"]
+
+def test_download_ranged(fake, tmp_path):
+    source, file_id, md5_checksum = drive_file(fake, tmp_path)
+    path = tmp_path / "download.mp3"
+
+    download_ranged(AnonymousCredentials(), file_id, str(path), SIZE, md5_checksum, connections=3, part_size=300)
+    assert path.read_bytes() == source.read_bytes()
+
+def test_download_ranged_rejects_server_ignoring_range(fake, tmp_path):
+    _, file_id, md5_checksum = drive_file(fake, tmp_path)
+    ranged_media = fake.drive_media
+    fake.drive_media = lambda file_id, file, headers: ranged_media(file_id, file, {})
+    path = tmp_path / "download.mp3"
+
+    with pytest.raises(IOError, match="Expected bytes"):
+        download_ranged(AnonymousCredentials(), file_id, str(path), SIZE, md5_checksum, connections=3, part_size=300)
+    assert path.stat().st_size == SIZE
+
+class BatchService:
+    """A Drive service whose batch requests fail in the order given by fail_batches.
+
+    A request is the keyword arguments it was built with, and a batch that
+    succeeds answers each request with them.
+    """
+
+    def __init__(self, fail_batches):
+        self.fail_batches = list(fail_batches)
+        self.batches = []
+
+    def files(self):
+        return self
+
+    def get(self, **kwargs):
+        return kwargs
+
+    def new_batch_http_request(self, callback):
+        batch = FakeBatch(callback, self.fail_batches.pop(0))
+        self.batches.append(batch)
+        return batch
+
+class FakeBatch:
+    def __init__(self, callback, fail):
+        self.callback = callback
+        self.fail = fail
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        if self.fail:
+            raise ConnectionResetError("Connection reset by peer")
+        for request_id, request in self.requests:
+            self.callback(request_id, request, None)
+
+def test_execute_batched_carries_on_after_a_failed_batch(monkeypatch):
+    monkeypatch.setattr(drive_utils, "MAX_BATCH_SIZE", 2)
+    service = BatchService([True, False])
+
+    results = drive_utils.execute_batched(service, {file_id: service.get(fileId=file_id) for file_id in ("a", "b", "c")})
+
+    assert len(service.batches) == 2
+    assert [type(results[file_id][1]) for file_id in ("a", "b")] == [ConnectionResetError] * 2
+    assert results["c"] == ({"fileId": "c"}, None)
+
+def test_move_files_to_folder_reports_a_failed_batch():
+    errors = drive_utils.move_files_to_folder(BatchService([True]), ["a", "b"], "backup")
+
+    assert sorted(errors) == ["a", "b"]
+    assert all(isinstance(error, ConnectionResetError) for error in errors.values())
+
+class Resource:
+    """Stands in for a Drive resource, each method builds a request answered by a function of its arguments."""
+
+    def __init__(self, **methods):
+        self.methods = methods
+
+    def __getattr__(self, name):
+        method = self.methods[name]
+        return lambda **kwargs: Request(lambda: method(**kwargs))
+
+class Request:
+    def __init__(self, answer):
+        self.answer = answer
+
+    def execute(self):
+        return self.answer()
+
+class ListingService:
+    """A Drive service listing folders page by page and answering changes from change_pages.
+
+    folders maps a folder ID to its files, and change_pages a page token to
+    the changes response for it.
+    """
+
+    def __init__(self, folders, change_pages=None, page_size=2):
+        self.folders = folders
+        self.change_pages = change_pages or {}
+        self.page_size = page_size
+        self.calls = []
+
+    def files(self):
+        return Resource(list=self.list_files)
+
+    def changes(self):
+        return Resource(list=self.list_changes, getStartPageToken=self.start_page_token)
+
+    def list_files(self, q, pageSize, pageToken, fields):
+        self.calls.append(("files.list", pageToken))
+        files = self.folders[q.split("'")[1]]
+        start = int(pageToken or 0)
+        response = {"files": files[start:start + self.page_size]}
+        if start + self.page_size < len(files):
+            response["nextPageToken"] = str(start + self.page_size)
+        return response
+
+    def list_changes(self, pageToken, pageSize, spaces, fields):
+        self.calls.append(("changes.list", pageToken))
+        return self.change_pages[pageToken]
+
+    def start_page_token(self):
+        self.calls.append(("changes.getStartPageToken", None))
+        return {"startPageToken": "start"}
+
+def audio(file_id, folder_id="input", **fields):
+    return dict({"id": file_id, "name": f"{file_id}.mp3", "mimeType": "audio/mpeg", "parents": [folder_id]}, **fields)
+
+def test_list_folder_files_follows_pages():
+    files = [audio(f"show{number}") for number in range(5)]
+    service = ListingService({"input": files})
+
+    assert drive_utils.list_folder_files(service, "input") == files
+    assert service.calls == [("files.list", None), ("files.list", "2"), ("files.list", "4")]
+
+def test_incremental_listing_scans_the_folder_on_the_first_run(tmp_path):
+    files = [audio("show1"), audio("show2"), audio("show3")]
+    service = ListingService({"input": files})
+    path = tmp_path / "state.json"
+
+    assert drive_utils.list_folder_files_incremental(service, "input", path) == files
+    assert [call for call, _ in service.calls] == ["changes.getStartPageToken", "files.list", "files.list"]
+    state = drive_utils.load_listing_state(path)
+    assert (state["folder_id"], state["page_token"], sorted(state["files"])) == ("input", "start", ["show1", "show2", "show3"])
+
+def test_incremental_listing_applies_changes(tmp_path):
+    path = tmp_path / "state.json"
+    drive_utils.list_folder_files_incremental(ListingService({"input": [audio("show1"), audio("show2"), audio("show3"), audio("show4")]}), "input", path)
+
+    service = ListingService({}, {
+        "start": {"changes": [
+            {"fileId": "show1", "removed": True},
+            {"fileId": "show2", "file": audio("show2", "backup")},
+            {"fileId": "show3", "file": audio("show3", trashed=True)},
+            {"fileId": "show5", "file": audio("show5")}
+        ], "nextPageToken": "page2"},
+        "page2": {"changes": [
+            {"fileId": "notes", "file": audio("notes", mimeType="text/plain")},
+            {"fileId": "elsewhere", "file": audio("elsewhere", "other")}
+        ], "newStartPageToken": "next"}
+    })
+
+    files = drive_utils.list_folder_files_incremental(service, "input", path)
+    assert sorted(file["id"] for file in files) == ["show4", "show5"]
+    assert service.calls == [("changes.list", "start"), ("changes.list", "page2")]
+    assert drive_utils.load_listing_state(path)["page_token"] == "next"
+
+    # A show that is still waiting is listed again by the next run
+    service = ListingService({}, {"next": {"changes": [], "newStartPageToken": "next"}})
+    assert sorted(file["id"] for file in drive_utils.list_folder_files_incremental(service, "input", path)) == ["show4", "show5"]
+
+def test_incremental_listing_rescans_when_the_folder_changes(tmp_path):
+    path = tmp_path / "state.json"
+    drive_utils.list_folder_files_incremental(ListingService({"input": [audio("show1")]}), "input", path)
+
+    service = ListingService({"other": [audio("show2", "other")]})
+    assert drive_utils.list_folder_files_incremental(service, "other", path) == [audio("show2", "other")]
+    assert [call for call, _ in service.calls] == ["changes.getStartPageToken", "files.list"]
+    assert drive_utils.load_listing_state(path)["folder_id"] == "other"
@@ -0,0 +1,23 @@
+import sqlite3
+import pytest
+import journal_utils
+from journal_utils import get_show_record, record_failure, record_stage
+
+def test_journal_closes_its_connections(monkeypatch, tmp_path):
+    opened = []
+    sqlite_connect = sqlite3.connect
+    def connect(*args, **kwargs):
+        opened.append(sqlite_connect(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(journal_utils.sqlite3, "connect", connect)
+    path = str(tmp_path / "journal.sqlite3")
+
+    record_stage("show", "Show.mp3", "sc_link", "https://soundcloud.com/show", path=path)
+    record_failure("show", "Show.mp3", "Contentful is down", path=path)
+    record = get_show_record("show", path=path)
+
+    assert (record["sc_link"], record["attempts"], record["last_error"]) == ("https://soundcloud.com/show", 1, "Contentful is down")
+    assert len(opened) == 3
+    for connection in opened:
+        with pytest.raises(sqlite3.ProgrammingError, match="closed"):
+            connection.execute("SELECT 1")
@@ -0,0 +1,75 @@
+import random
+import threading
+import time
+from audio_utils import until_stopped
+from pipeline_utils import run_pipeline
+
+def recorder(name, seen, fn=lambda item: item):
+    """A stage that records each item it is given in seen[name]."""
+    seen[name] = []
+    def stage(item):
+        seen[name].append(item)
+        return fn(item)
+    return stage
+
+def test_items_keep_their_order():
+    seen = {}
+    def jitter(item):
+        time.sleep(random.uniform(0, 0.005))
+        return item
+
+    run_pipeline(range(20), [
+        ("fetch", recorder("fetch", seen, jitter)),
+        ("render", recorder("render", seen, jitter)),
+        ("publish", recorder("publish", seen, jitter))
+    ], depth=2)
+    assert seen["fetch"] == seen["render"] == seen["publish"] == list(range(20))
+
+def test_full_queue_holds_back_earlier_stages():
+    seen = {}
+    release = threading.Event()
+    pipeline = threading.Thread(target=run_pipeline, args=(range(10), [
+        ("fetch", recorder("fetch", seen)),
+        ("publish", recorder("publish", seen, lambda item: release.wait()))
+    ]), kwargs={"depth": 2})
+    pipeline.start()
+    try:
+        time.sleep(0.2)
+        # One show being published, two waiting in the queue and one fetched waiting for room
+        assert seen["fetch"] == [0, 1, 2, 3]
+    finally:
+        release.set()
+        pipeline.join()
+    assert seen["publish"] == list(range(10))
+
+def test_failed_items_are_reported_and_dropped():
+    seen = {}
+    errors = []
+    def render(item):
+        if item == 2:
+            raise ValueError("render failed")
+        return None if item == 3 else item
+
+    run_pipeline(range(5), [
+        ("fetch", recorder("fetch", seen)),
+        ("render", recorder("render", seen, render)),
+        ("publish", recorder("publish", seen))
+    ], depth=1, on_error=lambda item, stage, e: errors.append((item, stage, str(e))))
+    assert seen["publish"] == [0, 1, 4]
+    assert errors == [(2, "render", "render failed")]
+
+def test_stops_taking_shows_once_stopped():
+    seen = {}
+    stop_event = threading.Event()
+    def publish(item):
+        stop_event.set()
+        time.sleep(0.05)
+
+    run_pipeline(until_stopped(range(10), stop_event), [
+        ("fetch", recorder("fetch", seen)),
+        ("render", recorder("render", seen)),
+        ("publish", recorder("publish", seen, publish))
+    ], depth=1)
+    # The shows already taken are finished, the rest are left for the next run
+    assert seen["publish"] == seen["fetch"] == list(range(len(seen["fetch"])))
+    assert len(seen["fetch"]) < 10
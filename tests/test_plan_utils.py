@@ -0,0 +1,91 @@
+import subprocess
+import pytest
+from conftest import requires_ffmpeg
+from audio_helpers import tone, decode, duration_ms
+from plan_utils import HEADER_READ_SIZE, wav_duration_ms, mp3_duration_ms, get_audio_duration
+
+SECONDS = 10
+# An MP3 frame is 26 ms, and without a LAME tag the encoder delay and padding are decoded too
+MP3_TOLERANCE_MS = 60
+
+def write_wav(path, extra_chunk=None):
+    """Write a WAV of a tone, with extra_chunk inserted between the fmt and data chunks."""
+    tone(SECONDS, 440).export(str(path), format="wav")
+    data = path.read_bytes()
+    if extra_chunk:
+        chunk_id, body = extra_chunk
+        chunk = chunk_id + len(body).to_bytes(4, "little") + body + b"\0" * (len(body) & 1)
+        data_offset = data.index(b"data")
+        data = data[:4] + (len(data) + len(chunk) - 8).to_bytes(4, "little") + data[8:data_offset] + chunk + data[data_offset:]
+        path.write_bytes(data)
+    return path
+
+def write_mp3(path, *options):
+    source = write_wav(path.with_suffix(".wav"))
+    subprocess.run(["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", str(source), *options, str(path)], check=True)
+    return path
+
+def header_duration(path, parse):
+    data = path.read_bytes()
+    return parse(data[:HEADER_READ_SIZE], len(data))
+
+@requires_ffmpeg
+def test_wav_with_extra_chunks(tmp_path):
+    # An odd sized chunk is padded to an even length
+    path = write_wav(tmp_path / "show.wav", (b"LIST", b"INFOISFT\x05\0\0\0test\0"))
+
+    assert header_duration(path, wav_duration_ms) == round(duration_ms(decode(str(path))))
+
+@requires_ffmpeg
+@pytest.mark.parametrize("options", [
+    # Constant bitrate without a Xing/Info tag, so the duration comes from the bitrate
+    ["-b:a", "192k", "-write_xing", "0"],
+    # Variable bitrate, the frame count comes from the Xing tag
+    ["-q:a", "4"]
+], ids=["cbr", "vbr-xing"])
+def test_mp3(tmp_path, options):
+    path = write_mp3(tmp_path / "show.mp3", *options)
+
+    assert header_duration(path, mp3_duration_ms) == pytest.approx(duration_ms(decode(str(path))), abs=MP3_TOLERANCE_MS)
+
+@requires_ffmpeg
+def test_truncated_headers(tmp_path):
+    wav = write_wav(tmp_path / "show.wav").read_bytes()
+    mp3 = write_mp3(tmp_path / "show.mp3", "-b:a", "192k").read_bytes()
+
+    # Cut off before the data chunk, and before the first frame after the ID3 tag
+    assert wav_duration_ms(wav[:30], len(wav)) is None
+    assert mp3_duration_ms(mp3[:mp3.index(b"\xff\xfb")], len(mp3)) is None
+    assert mp3_duration_ms(b"ID3", len(mp3)) is None
+
+class HeaderRequest:
+    def __init__(self, data):
+        self.data = data
+        self.headers = {}
+
+    def execute(self):
+        start, end = self.headers["Range"].removeprefix("bytes=").split("-")
+        return self.data[int(start):int(end) + 1]
+
+class HeaderService:
+    """A Drive service that answers ranged get_media requests from data."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def files(self):
+        return self
+
+    def get_media(self, fileId):
+        return HeaderRequest(self.data)
+
+@requires_ffmpeg
+def test_get_audio_duration_reads_the_header(tmp_path):
+    data = write_mp3(tmp_path / "show.mp3", "-q:a", "4").read_bytes()
+    file = {"id": "show", "name": "20240101 1200 Show.MP3", "size": str(len(data))}
+
+    assert get_audio_duration(HeaderService(data), file) == header_duration(tmp_path / "show.mp3", mp3_duration_ms)
+    # Drive's own duration is used when there is one
+    assert get_audio_duration(None, dict(file, videoMediaMetadata={"durationMillis": "1234"})) == 1234
+    # A file too short to hold a frame
+    assert get_audio_duration(HeaderService(data[:20]), dict(file, size="20")) is None
@@ -0,0 +1,18 @@
+import threading
+from pool_utils import run_in_pool
+
+def touch_show(entry):
+    open(entry["path"], "w").close()
+
+def make_entries(tmp_path):
+    return [{"name": f"show{number}.mp3", "action": "skip", "path": str(tmp_path / f"show{number}")} for number in range(3)]
+
+def test_runs_every_show(tmp_path):
+    run_in_pool(make_entries(tmp_path), touch_show, None, (), processes=2)
+    assert len(list(tmp_path.iterdir())) == 3
+
+def test_no_shows_started_once_stopped(tmp_path):
+    stop_event = threading.Event()
+    stop_event.set()
+    run_in_pool(make_entries(tmp_path), touch_show, None, (), processes=2, stop_event=stop_event)
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,54 @@
+import pytest
+from conftest import requires_ffmpeg
+from audio_helpers import tone, decode, overlap_ms, duration_ms
+from silence_utils import detect_silence
+from render_utils import START_CROSSFADE_MS, END_CROSSFADE_MS, kept_ranges, render_show_ffmpeg
+from audio_utils import SILENCE_MIN_LEN_MS, SILENCE_SEEK_STEP_MS, SILENCE_THRESH_DB, render_show
+
+START_JINGLE_HZ, SHOW_HZ, END_JINGLE_HZ = 450, 1000, 650
+# An MP3 frame, the most the two encodes may differ by
+FRAME_MS = 1152 * 1000 / 44100
+
+def test_kept_ranges():
+    assert kept_ranges([]) == [(0, None)]
+    assert kept_ranges([0, 1000, 5000, 9000]) == [(1000, 5000), (9000, None)]
+
+@requires_ffmpeg
+def test_ffmpeg_render_matches_pydub(tmp_path):
+    start_jingle, end_jingle = tone(10, START_JINGLE_HZ), tone(10, END_JINGLE_HZ)
+    show = tone(40, SHOW_HZ, silences=[(15, 23)])
+    paths = {}
+    for name, segment in (("show", show), ("start", start_jingle), ("end", end_jingle)):
+        paths[name] = str(tmp_path / f"{name}.wav")
+        segment.export(paths[name], format="wav")
+
+    silent_ranges = detect_silence(show, min_silence_len=SILENCE_MIN_LEN_MS, seek_step=SILENCE_SEEK_STEP_MS, silence_thresh=SILENCE_THRESH_DB)
+    silent_ranges = [item for sublist in silent_ranges for item in sublist]
+    assert len(silent_ranges) == 2
+
+    with render_show(show, silent_ranges, start_jingle, end_jingle) as pydub_file:
+        pydub_audio = decode(pydub_file.name)
+    with render_show_ffmpeg(paths["show"], silent_ranges, paths["start"], paths["end"]) as ffmpeg_file:
+        ffmpeg_audio = decode(ffmpeg_file.name)
+
+    trimmed_ms = len(show) - (silent_ranges[1] - silent_ranges[0])
+    expected_ms = len(start_jingle) + trimmed_ms + len(end_jingle) - START_CROSSFADE_MS - END_CROSSFADE_MS
+    assert duration_ms(pydub_audio) == pytest.approx(expected_ms, abs=FRAME_MS)
+    assert duration_ms(ffmpeg_audio) == pytest.approx(duration_ms(pydub_audio), abs=FRAME_MS)
+
+    # Each crossfade is where both of its tones can be heard, at the same place in both renders
+    start_fade = (len(start_jingle) - START_CROSSFADE_MS, len(start_jingle))
+    end_fade = (expected_ms - len(end_jingle), expected_ms - len(end_jingle) + END_CROSSFADE_MS)
+    for audio in (pydub_audio, ffmpeg_audio):
+        for (first, second), (fade_start, fade_end) in (
+            ((START_JINGLE_HZ, SHOW_HZ), start_fade),
+            ((SHOW_HZ, END_JINGLE_HZ), end_fade)
+        ):
+            heard_start, heard_end = overlap_ms(audio, first, second)
+            # Both tones are above a tenth of their level for the middle 80% of a linear crossfade
+            margin = (fade_end - fade_start) * 0.1
+            assert heard_start == pytest.approx(fade_start + margin, abs=60)
+            assert heard_end == pytest.approx(fade_end - margin, abs=60)
+
+    assert overlap_ms(pydub_audio, START_JINGLE_HZ, SHOW_HZ) == pytest.approx(overlap_ms(ffmpeg_audio, START_JINGLE_HZ, SHOW_HZ), abs=40)
+    assert overlap_ms(pydub_audio, SHOW_HZ, END_JINGLE_HZ) == pytest.approx(overlap_ms(ffmpeg_audio, SHOW_HZ, END_JINGLE_HZ), abs=40)
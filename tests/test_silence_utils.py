@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment, silence
+from silence_utils import detect_silence
+
+FRAME_RATE = 8000
+
+def synthetic_segment(sample_width, channels, seconds=6):
+    """Noise with quiet gaps of different lengths and levels around the threshold."""
+    rng = np.random.default_rng(sample_width * 10 + channels)
+    peak = 2 ** (8 * sample_width - 1) - 1
+    amplitude = np.full(seconds * FRAME_RATE, 0.5)
+    # Gaps longer and shorter than min_silence_len, one of them just above the threshold
+    for start, end, level in ((0.4, 1.3, 0.0), (2.0, 2.3, 0.0), (3.0, 3.9, 0.002), (4.5, 5.4, 0.02), (5.7, 6.0, 0.0)):
+        amplitude[int(start * FRAME_RATE):int(end * FRAME_RATE)] = level
+    noise = rng.uniform(-1, 1, (seconds * FRAME_RATE, channels)) * amplitude[:, None]
+    samples = np.round(noise * peak).astype({1: np.int8, 2: np.int16, 4: np.int32}[sample_width])
+    return AudioSegment(data=samples.tobytes(), sample_width=sample_width, frame_rate=FRAME_RATE, channels=channels)
+
+@pytest.mark.parametrize("sample_width", [1, 2, 4])
+@pytest.mark.parametrize("channels", [1, 2])
+@pytest.mark.parametrize("seek_step", [1, 7])
+def test_matches_pydub(sample_width, channels, seek_step):
+    segment = synthetic_segment(sample_width, channels)
+    settings = dict(min_silence_len=500, silence_thresh=-40, seek_step=seek_step)
+
+    expected = silence.detect_silence(segment, **settings)
+    assert expected, "the synthetic audio should contain silence"
+    assert detect_silence(segment, **settings) == expected
+
+def test_shorter_than_min_silence_len():
+    segment = AudioSegment.silent(duration=400, frame_rate=FRAME_RATE)
+    assert detect_silence(segment, min_silence_len=500) == silence.detect_silence(segment, min_silence_len=500) == []
@@ -0,0 +1,31 @@
+import json
+import subprocess
+import sys
+from conftest import SCRIPTS_DIR
+
+# Clients that are only imported once a show needs them, not by an empty cron run
+LAZY_MODULES = ("supabase", "contentful_management", "googleapiclient", "google.auth", "google_auth_oauthlib")
+# Seconds importing main may take, about three times what it takes without the clients
+IMPORT_BUDGET = 0.75
+RUNS = 3
+
+def import_main():
+    code = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        "import main\n"
+        "print(json.dumps({'seconds': time.perf_counter() - started, 'modules': sorted(sys.modules)}))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=SCRIPTS_DIR, stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+def test_importing_main_leaves_clients_unloaded():
+    runs = [import_main() for _ in range(RUNS)]
+
+    loaded = [
+        module for module in runs[0]["modules"]
+        if any(module == lazy or module.startswith(f"{lazy}.") for lazy in LAZY_MODULES)
+    ]
+    assert loaded == []
+    # The fastest run, so a busy machine doesn't fail the test
+    assert min(run["seconds"] for run in runs) < IMPORT_BUDGET
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from conftest import requires_ffmpeg
+from audio_helpers import SAMPLE_RATE, alignment, decode, noise
+from render_utils import render_show_ffmpeg
+from stitch_utils import FRAME_SAMPLES, scan_frames, plan_copies, cut_positions, render_show_stitched
+
+SILENT_RANGES = [30000, 40000, 60000, 70000]
+# Samples either side of a cut whose alignment is mixed, and how often the alignment is checked
+CUT_MARGIN = 4096 + FRAME_SAMPLES
+CHECK_EVERY = SAMPLE_RATE // 2
+
+@requires_ffmpeg
+def test_stitched_render_matches_full_render(tmp_path):
+    show_path, start_path, end_path = str(tmp_path / "show.mp3"), str(tmp_path / "start.wav"), str(tmp_path / "end.wav")
+    # Quiet noise leaves frames that don't lean on the bit reservoir, so the kept ranges get copied stretches
+    noise(show_path, 100, silences=[(30, 40), (60, 70)])
+    noise(start_path, 10, amplitude=0.3, color="white", seed=2)
+    noise(end_path, 10, amplitude=0.3, color="brown", seed=3)
+    show_frames = len(decode(show_path))
+    jingle_frames = len(decode(start_path))
+
+    with open(show_path, "rb") as source:
+        copies = plan_copies(scan_frames(source.read()), SILENT_RANGES, show_frames, jingle_frames, "192k")
+    # At least one stretch with a cut in it is encoded between two copies
+    assert len(copies) >= 2
+
+    with render_show_stitched(show_path, SILENT_RANGES, start_path, end_path, show_frames, SAMPLE_RATE) as stitched_file:
+        stitched = decode(stitched_file.name)
+    with render_show_ffmpeg(show_path, SILENT_RANGES, start_path, end_path) as full_file:
+        full = decode(full_file.name)
+
+    # Check every half second and either side of each join between copied and encoded frames
+    positions = set(range(0, len(stitched) - 2 * 4096, CHECK_EVERY))
+    for copy_start, copy_end, _, _ in copies:
+        positions.update((copy_start - 4096 - 64, copy_start + 64, copy_end - 4096 - 64, copy_end + 64))
+    cuts = cut_positions(SILENT_RANGES, show_frames, jingle_frames)
+    positions = sorted(position for position in positions if all(abs(position - cut) > CUT_MARGIN for cut in cuts))
+
+    lags = {}
+    for position in positions:
+        lag, correlation = alignment(stitched, full, position)
+        assert correlation > 0.95, f"stitched render doesn't match at sample {position}"
+        lags[position] = lag
+
+    # Nothing moves before the first cut, and each cut only drops what doesn't make a whole frame
+    for number, (low, high) in enumerate(zip([0] + cuts, cuts + [len(full)])):
+        stretch = {lags[position] for position in positions if low < position < high}
+        assert len(stretch) == 1, f"alignment drifts between cuts {number - 1} and {number}"
+        lag = stretch.pop()
+        if number == 0:
+            assert lag == 0
+        else:
+            assert 0 <= lag - previous < FRAME_SAMPLES
+        previous = lag
+
+    # The dropped samples are all the stitched render is short by, there is no extra audio at either end
+    assert len(full) - len(stitched) == previous
@@ -0,0 +1,109 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import pytest
+import upload_utils
+from contentful_management.errors import NotFoundError
+from conftest import SCRIPTS_DIR
+from fake_services import FakeServices
+
+PROCESSES = 4
+
+@pytest.fixture
+def contentful(monkeypatch):
+    """A Contentful stand-in the shared Contentful context is pointed at."""
+    fake = FakeServices().start()
+    monkeypatch.setattr(upload_utils, "CONTENTFUL_API_HOST", fake.host)
+    monkeypatch.setattr(upload_utils, "CONTENTFUL_UPLOADS_HOST", fake.host)
+    monkeypatch.setattr(upload_utils, "CONTENTFUL_HTTPS", False)
+    monkeypatch.setattr(upload_utils, "CONTENTFUL_MANAGEMENT_API_TOKEN", "test")
+    monkeypatch.setattr(upload_utils, "CONTENTFUL_SPACE_ID", fake.space_id)
+    monkeypatch.setattr(upload_utils, "CONTENTFUL_ENV_ID", fake.environment_id)
+    monkeypatch.setattr(upload_utils, "ASSET_POLL_FIRST_INTERVAL", 0.05)
+    upload_utils.invalidate_contentful_context()
+    yield fake
+    upload_utils.invalidate_contentful_context()
+    fake.stop()
+
+def test_soundcloud_token_refreshed_once_across_processes(tmp_path):
+    # Latency on the token endpoint leaves every process time to find the token expired
+    fake = FakeServices(latency={"soundcloud": 0.3}).start()
+    try:
+        env = dict(
+            os.environ,
+            **fake.environment(),
+            SUPABASE_TOKEN="test.test.test",
+            SC_CLIENT_ID="test",
+            SC_CLIENT_SECRET="test",
+            SOUNDCLOUD_TOKEN_LOCK_PATH=str(tmp_path / "soundcloud-token.lock")
+        )
+        code = "import json, upload_utils; print(json.dumps(upload_utils.get_soundcloud_token()))"
+        processes = [
+            subprocess.Popen([sys.executable, "-c", code], cwd=SCRIPTS_DIR, env=env, stdout=subprocess.PIPE, text=True)
+            for _ in range(PROCESSES)
+        ]
+        tokens = [json.loads(process.communicate()[0].splitlines()[-1]) for process in processes]
+    finally:
+        fake.stop()
+
+    assert fake.stats[("soundcloud", "oauth.token")]["requests"] == 1
+    assert tokens == [fake.soundcloud_tokens["token"]] * PROCESSES
+    assert not fake.slack_messages
+
+def test_contentful_requests_share_a_connection(contentful):
+    for entry_id in ("show1", "show2", "show3"):
+        upload_utils.find_entry_contentful(entry_id)
+
+    # Also fails if a new contentful_management stops calling the requests module the client is given
+    assert contentful.stats[("contentful", "entries.find")]["requests"] == 3
+    assert contentful.connections == 1
+
+def test_unauthorized_request_retried_on_its_own(contentful):
+    # The token is rejected after the file has been uploaded and the asset created
+    contentful.reject_next("PUT", r".*/assets/[^/]+/files/[^/]+/process")
+
+    processing = upload_utils.create_audio_asset_contentful("Show", io.BytesIO(b"audio"))
+    asset_id = upload_utils.publish_asset_contentful(processing.result(timeout=10))
+
+    assert len(contentful.contentful_uploads) == 1
+    assert list(contentful.assets) == [asset_id]
+    assert contentful.stats[("contentful", "assets.process")]["requests"] == 1
+    assert contentful.stats[("contentful", "assets.publish")]["requests"] == 1
+
+def create_asset(process=True):
+    upload = upload_utils.create_upload_contentful(io.BytesIO(b"audio"))
+    asset = upload_utils.create_asset_contentful("Show", upload.sys['id'])
+    if process:
+        asset.process()
+    return asset.sys['id']
+
+def test_asset_waiter_resolves_processed_assets(contentful):
+    contentful.asset_processing_delay = 0.3
+    asset_ids = [create_asset() for _ in range(3)]
+
+    futures = [upload_utils.asset_waiter.wait_for(asset_id) for asset_id in asset_ids]
+
+    assets = [future.result(timeout=10) for future in futures]
+    assert [asset.sys['id'] for asset in assets] == asset_ids
+    assert all('url' in asset.fields()['file'] for asset in assets)
+
+def test_asset_waiter_times_out_after_its_checks(contentful, monkeypatch):
+    monkeypatch.setattr(upload_utils, "ASSET_POLL_MAX_REQUESTS", 3)
+    asset_id = create_asset(process=False)
+
+    with pytest.raises(TimeoutError):
+        upload_utils.asset_waiter.wait_for(asset_id).result(timeout=10)
+    assert contentful.stats[("contentful", "assets.find")]["requests"] == 3
+
+def test_asset_waiter_passes_on_errors(contentful):
+    with pytest.raises(NotFoundError):
+        upload_utils.asset_waiter.wait_for("missing").result(timeout=10)
+
+def test_asset_named_after_its_format(contentful):
+    upload = upload_utils.create_upload_contentful(io.BytesIO(b"OggS"))
+    asset = upload_utils.create_asset_contentful("Show", upload.sys['id'], ".opus", "audio/ogg")
+
+    file = contentful.assets[asset.sys['id']]["fields"]["file"]["en-US"]
+    assert (file["fileName"], file["contentType"]) == ("Show.opus", "audio/ogg")
@@ -0,0 +1,48 @@
+import json
+import time
+import urllib.error
+import urllib.request
+import pytest
+import worker
+
+@pytest.fixture
+def status_server(monkeypatch):
+    # The status dict is shared by the whole module, each test sets the parts it needs
+    for name, value in worker.status.items():
+        monkeypatch.setitem(worker.status, name, value)
+    server = worker.start_status_server(port=0)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def get(url):
+    """Return the status code of a GET request and its body if it is JSON."""
+    try:
+        response = urllib.request.urlopen(url)
+    except urllib.error.HTTPError as e:
+        response = e
+    with response:
+        is_json = response.headers.get_content_type() == "application/json"
+        return response.status, json.load(response) if is_json else None
+
+def test_health_ok_while_polls_are_fresh(status_server):
+    worker.update_status(state="idle", last_poll=time.time(), queue_depth=2)
+
+    code, body = get(f"{status_server}/health")
+    assert code == 200
+    assert (body["healthy"], body["state"], body["queue_depth"]) == (True, "idle", 2)
+
+def test_health_fails_when_idle_and_stale(status_server):
+    worker.update_status(state="idle", last_poll=time.time() - (worker.WORKER_STALE_POLLS + 1) * worker.WORKER_POLL_INTERVAL)
+
+    code, body = get(f"{status_server}/health")
+    assert code == 503
+    assert body["healthy"] is False
+
+def test_health_ok_while_processing_a_long_batch(status_server):
+    worker.update_status(state="processing", last_poll=time.time() - (worker.WORKER_STALE_POLLS + 1) * worker.WORKER_POLL_INTERVAL)
+
+    assert get(f"{status_server}/health")[0] == 200
+
+def test_unknown_path_not_found(status_server):
+    assert get(f"{status_server}/metrics")[0] == 404